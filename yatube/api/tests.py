@@ -0,0 +1,147 @@
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.tasks import run_pending
+from posts.models import Comment, Follow, Group, Post, User
+
+
+def read(response):
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return json.loads(response.content)
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}',
+                                group=cls.group if i % 2 else None)
+            for i in range(25)
+        ]
+        for i in range(3):
+            Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                                   text=f'Комментарий {i}')
+        run_pending()
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get(self, name, *args, client=None, **params):
+        response = (client or self.client).get(
+            reverse(f'api:v1:{name}', args=args), params)
+        return response, read(response)
+
+    def walk(self, name, *args, client=None, **params):
+        """Все id ленты, пройденной по ссылкам next."""
+        response, data = self.get(name, *args, client=client, **params)
+        ids = [item['id'] for item in data['results']]
+        while data['next']:
+            data = read((client or self.client).get(data['next']))
+            ids += [item['id'] for item in data['results']]
+        return ids
+
+    def test_feeds(self):
+        """Ленты по курсорам отдают те же посты, что и HTML-страницы"""
+        newest = sorted(self.posts, key=lambda post: (post.pub_date, post.id),
+                        reverse=True)
+        feeds = {
+            ('index',): [post.id for post in newest],
+            ('group_list', self.group.slug): [
+                post.id for post in newest if post.group_id],
+            ('profile', self.author.username): [post.id for post in newest],
+        }
+        for args, expected in feeds.items():
+            with self.subTest(feed=args[0]):
+                self.assertEqual(self.walk(*args, limit=7), expected)
+        self.assertEqual(
+            self.walk('follow_index', client=self.reader_client, limit=7),
+            [post.id for post in newest])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет в ответе только запрошенные поля"""
+        response, data = self.get('index', fields='id,author')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author'], 'auth')
+        response, data = self.get('index', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_detail_and_comments(self):
+        """Пост и его комментарии отдаются отдельными адресами"""
+        post = self.posts[0]
+        response, data = self.get('post_detail', post.id)
+        self.assertEqual(data['text'], post.text)
+        self.assertEqual(data['comments_count'], 3)
+        self.assertIsNone(data['image'])
+        response, data = self.get('post_comments', post.id, limit=2)
+        self.assertEqual([item['text'] for item in data['results']],
+                         ['Комментарий 0', 'Комментарий 1'])
+        self.assertIsNotNone(data['next'])
+
+    def test_errors(self):
+        """Ошибки отдаются в JSON с нужным кодом"""
+        cases = (
+            (('post_detail', 0), {}, 404),
+            (('group_list', 'missing'), {}, 404),
+            (('profile', 'missing'), {}, 404),
+            (('follow_index',), {}, 401),
+            (('index',), {'limit': 1000}, 400),
+        )
+        for args, params, status in cases:
+            with self.subTest(args=args):
+                response, data = self.get(*args, **params)
+                self.assertEqual(response.status_code, status)
+                self.assertIn('error', data)
+
+    def test_renamed_lookups(self):
+        """Прежние slug и username после переименования отвечают 404"""
+        self.get('group_list', 'group')
+        self.get('profile', 'auth')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'renamed'
+        author.save()
+        for name, old in (('group_list', 'group'), ('profile', 'auth')):
+            with self.subTest(feed=name):
+                response, _ = self.get(name, old)
+                self.assertEqual(response.status_code, 404)
+                response, data = self.get(name, 'renamed')
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(data['results'])
+
+    def test_stale_lookup(self):
+        """Устаревший id в кэше не отдаёт посты другой группы"""
+        self.get('group_list', 'group')
+        Group.objects.filter(pk=self.group.pk).update(slug='moved')
+        other = Group.objects.create(title='Другая', slug='group')
+        post = Post.objects.create(author=self.author, text='Новый',
+                                   group=other)
+        response, data = self.get('group_list', 'group')
+        self.assertEqual([item['id'] for item in data['results']],
+                         [post.id])
+        Group.objects.filter(pk=other.pk).update(slug='gone')
+        response, _ = self.get('group_list', 'group')
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_budget(self):
+        """Страница ленты — один запрос, без объектов моделей"""
+        with self.assertNumQueries(1):
+            self.get('index', limit=50)
+        with self.assertNumQueries(2):
+            self.get('group_list', self.group.slug)
+        with self.assertNumQueries(1):
+            self.get('post_detail', self.posts[0].id)
@@ -0,0 +1,22 @@
+from django.urls import include, path
+
+from api import views
+
+app_name = 'api'
+
+v1 = ([
+    path('posts/', views.IndexFeed.as_view(), name='index'),
+    path('posts/<int:post_id>/', views.PostDetail.as_view(),
+         name='post_detail'),
+    path('posts/<int:post_id>/comments/', views.PostComments.as_view(),
+         name='post_comments'),
+    path('groups/<slug:slug>/posts/', views.GroupFeed.as_view(),
+         name='group_list'),
+    path('profiles/<str:username>/posts/', views.ProfileFeed.as_view(),
+         name='profile'),
+    path('follow/posts/', views.FollowFeed.as_view(), name='follow_index'),
+], 'v1')
+
+urlpatterns = [
+    path('v1/', include(v1)),
+]
@@ -0,0 +1,234 @@
+"""JSON API лент и постов, версия 1.
+
+Строки читаются через values() с join к автору и группе, без создания
+объектов моделей. ?fields= ограничивает набор полей, ?limit= — размер
+страницы, ?after= и ?before= — курсоры из ответа. Ленты отдаются
+потоком: каждый пост пишется в ответ сразу после сериализации.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from posts.cache import forget, lookup
+from posts.models import Comment, Group, Post, User
+from posts.timeline import TimelinePaginator
+from posts.utils import COMMENTS_ORDERING, FEED_ORDERING, CursorPaginator
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'image_width': 'image_width',
+    'image_height': 'image_height',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+class ApiView(View):
+    """Общая часть: разбор ?fields= и ошибки в виде JSON."""
+    fields: dict = POST_FIELDS
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': error.message},
+                                status=error.status,
+                                json_dumps_params={'ensure_ascii': False})
+
+    def get_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.fields)
+        names = [name.strip() for name in requested.split(',')
+                 if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise ApiError(400, 'Неизвестные поля: {}. Доступны: {}'.format(
+                ', '.join(unknown), ', '.join(self.fields)))
+        return names
+
+    def get_paths(self, fields, *extra):
+        return sorted({self.fields[name] for name in fields} | set(extra))
+
+    def serialize(self, row, fields):
+        item = {name: row[self.fields[name]] for name in fields}
+        if 'image' in item:
+            item['image'] = (settings.MEDIA_URL + item['image']
+                             if item['image'] else None)
+        return item
+
+
+class FeedView(ApiView):
+    """Лента с курсорной пагинацией, которая пишется в ответ потоком."""
+    ordering = FEED_ORDERING
+
+    def get_queryset(self):
+        return Post.objects.all()
+
+    def get_paginator(self, queryset, limit):
+        return CursorPaginator(queryset, limit, self.ordering)
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ApiError(400, 'limit должен быть числом')
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ApiError(400, f'limit должен быть от 1 до {MAX_LIMIT}')
+        return limit
+
+    def page_url(self, name, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[name] = cursor
+        return self.request.build_absolute_uri(
+            f'{self.request.path}?{params.urlencode()}')
+
+    def stream(self, page, fields):
+        yield '{"results":['
+        for position, row in enumerate(page):
+            yield (',' if position else '') + dumps(
+                self.serialize(row, fields))
+        yield '],"next":{},"previous":{}}}'.format(
+            dumps(self.page_url('after', page.next_cursor)),
+            dumps(self.page_url('before', page.previous_cursor)),
+        )
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        limit = self.get_limit()
+        page = self.get_page(fields, limit)
+        return StreamingHttpResponse(
+            self.stream(page, fields), content_type='application/json')
+
+    def get_page(self, fields, limit):
+        queryset = self.get_queryset().values(*self.get_paths(
+            fields, *(name.lstrip('-') for name in self.ordering)))
+        return self.get_paginator(queryset, limit).get_page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+
+
+class IndexFeed(FeedView):
+    pass
+
+
+class LookupFeedView(FeedView):
+    """Лента группы или автора по значению из URL.
+
+    id берётся из кэша lookup, но посты ещё и фильтруются по самому
+    значению из URL: устаревший id после переименования даёт пустую
+    страницу, а не чужие посты. Пустая страница сверяется с базой —
+    прежнее имя отвечает 404, а переданное другому объекту отдаёт
+    его посты.
+    """
+    lookup_name = None
+    lookup_field = None
+    relation = None
+    model = None
+    not_found = None
+
+    def get_object_id(self):
+        value = self.kwargs[self.lookup_field]
+        found = lookup(
+            self.lookup_name, value,
+            self.model.objects.filter(**{self.lookup_field: value}), 'id')
+        if found is None:
+            raise ApiError(404, self.not_found)
+        return found[0]
+
+    def get_queryset(self):
+        self.object_id = self.get_object_id()
+        return Post.objects.filter(**{
+            f'{self.relation}_id': self.object_id,
+            f'{self.relation}__{self.lookup_field}':
+                self.kwargs[self.lookup_field],
+        })
+
+    def get_page(self, fields, limit):
+        page = super().get_page(fields, limit)
+        if not page:
+            cached_id = self.object_id
+            forget(self.lookup_name, self.kwargs[self.lookup_field])
+            if self.get_object_id() != cached_id:
+                page = super().get_page(fields, limit)
+        return page
+
+
+class GroupFeed(LookupFeedView):
+    lookup_name = 'group'
+    lookup_field = 'slug'
+    relation = 'group'
+    model = Group
+    not_found = 'Группа не найдена'
+
+
+class ProfileFeed(LookupFeedView):
+    lookup_name = 'user'
+    lookup_field = 'username'
+    relation = 'author'
+    model = User
+    not_found = 'Пользователь не найден'
+
+
+class FollowFeed(FeedView):
+    def get_queryset(self):
+        if self.request.user.is_anonymous:
+            raise ApiError(401, 'Нужна авторизация')
+        return Post.objects.all()
+
+    def get_paginator(self, queryset, limit):
+        return TimelinePaginator(queryset, limit, self.request.user)
+
+
+class PostComments(FeedView):
+    fields = COMMENT_FIELDS
+    ordering = COMMENTS_ORDERING
+
+    def get_queryset(self):
+        post_id = self.kwargs['post_id']
+        if not Post.objects.filter(pk=post_id).exists():
+            raise ApiError(404, 'Пост не найден')
+        return Comment.objects.filter(post_id=post_id)
+
+
+class PostDetail(ApiView):
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        row = Post.objects.filter(pk=self.kwargs['post_id']).values(
+            *self.get_paths(fields)).first()
+        if row is None:
+            raise ApiError(404, 'Пост не найден')
+        return JsonResponse(self.serialize(row, fields),
+                            json_dumps_params={'ensure_ascii': False})
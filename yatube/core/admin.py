@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.contrib import admin
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'created',
+        'wait',
+        'duration',
+    )
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'key')
+    readonly_fields = [field.name for field in Task._meta.fields]
+    actions = ('requeue',)
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+    def wait(self, task):
+        if task.started is None:
+            return None
+        return max(task.started - task.run_at, timedelta(0))
+    wait.short_description = 'Ожидание'
+
+    def duration(self, task):
+        if task.started is None or task.finished is None:
+            return None
+        return task.finished - task.started
+    duration.short_description = 'Выполнение'
+
+    def requeue(self, request, queryset):
+        count = queryset.exclude(status=Task.RUNNING).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now(),
+            finished=None, error='')
+        self.message_user(request, f'Снова в очереди: {count}')
+    requeue.short_description = 'Поставить в очередь заново'
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {'queue_stats': tasks.stats(), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
+
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,126 @@
+"""ASGI-приложение поверх WSGI-обработчика Django.
+
+Django 2.2 не умеет ASGI, поэтому WsgiToAsgi принимает соединения в
+цикле событий, а сам запрос выполняет в пуле из ASGI_THREADS потоков.
+Медленный клиент занимает только корутину: тело запроса читается до
+передачи в пул, ответ отправляется по частям по мере отрисовки.
+"""
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class WsgiToAsgi:
+    def __init__(self, wsgi_application, threads=None):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or settings.ASGI_THREADS,
+            thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Тип соединения {scope["type"]} '
+                             f'не поддерживается')
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self.executor, self.handle,
+                self.environ(scope, body), send, loop)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def environ(self, scope, body):
+        path = scope['path']
+        script_name = scope.get('root_path', '')
+        if not path.startswith(script_name):
+            script_name = ''
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name.encode().decode('latin-1'),
+            'PATH_INFO': path[len(script_name):].encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+            environ['REMOTE_PORT'] = str(scope['client'][1])
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            if name in environ:
+                value = f'{environ[name]},{value}'
+            environ[name] = value
+        return environ
+
+    def handle(self, environ, send, loop):
+        """Выполняет WSGI-приложение в потоке пула."""
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {'started': False}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+
+        def start():
+            # Заголовки уходят с первой непустой частью тела: до неё
+            # WSGI-приложение ещё может сменить статус.
+            if not response['started']:
+                response['started'] = True
+                emit({'type': 'http.response.start',
+                      'status': response['status'],
+                      'headers': response['headers']})
+
+        result = self.wsgi_application(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    start()
+                    emit({'type': 'http.response.body', 'body': chunk,
+                          'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        start()
+        emit({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,95 @@
+"""Пользователь запроса из общего кэша.
+
+Сессии хранит бэкенд cached_db: чтение идёт из кэша, запись — в кэш и
+в базу, поэтому вход, выход и смена пароля сразу видны всем воркерам.
+CachedModelBackend так же достаёт из кэша пользователя сессии.
+Пользователь кладётся в кэш при входе и после каждого сохранения
+(после фиксации транзакции), а сохранение и удаление сразу убирают
+прежнюю копию. Изменения в обход сигналов (QuerySet.update) копия не
+видит, поэтому живёт она недолго — USER_CACHE_TIMEOUT. Хэш пароля в
+общий кэш не кладётся: копия хранит поля строки без него и готовый
+хэш для проверки сессии. Страница залогиненного пользователя не читает
+из базы ни сессию, ни пользователя.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+User = get_user_model()
+
+
+def user_key(user_id):
+    return f'auth_user_fields:{user_id}'
+
+
+def snapshot(user):
+    """Поля строки пользователя без пароля и хэш для проверки сессии."""
+    return {
+        'fields': {
+            field.attname: getattr(user, field.attname)
+            for field in User._meta.concrete_fields
+            if field.attname != 'password'
+        },
+        'session_hash': user.get_session_auth_hash(),
+    }
+
+
+def restore(data):
+    """Пользователь из snapshot. Пароль у него отложенное поле: save()
+    его не перезапишет, а обращение к нему прочитает строку из базы.
+    """
+    fields = data['fields']
+    user = User.from_db(DEFAULT_DB_ALIAS, list(fields), list(fields.values()))
+    session_hash = data['session_hash']
+
+    def get_session_auth_hash():
+        # Пароль загружен или изменён set_password — хэш уже другой.
+        if 'password' in user.__dict__:
+            return User.get_session_auth_hash(user)
+        return session_hash
+    user.get_session_auth_hash = get_session_auth_hash
+    return user
+
+
+def remember(user):
+    cache.set(user_key(user.pk), snapshot(user), settings.USER_CACHE_TIMEOUT)
+
+
+def forget(user_id):
+    cache.delete(user_key(user_id))
+
+
+def user_changed(user):
+    """Убирает прежнюю копию сразу, а новую кладёт после фиксации:
+    откат не оставит в кэше несохранённых данных, а запись после
+    фиксации перекроет строку, которую параллельный запрос успел
+    прочитать до неё.
+    """
+    forget(user.pk)
+    key, fresh = user_key(user.pk), snapshot(user)
+    transaction.on_commit(lambda: cache.set(
+        key, fresh, settings.USER_CACHE_TIMEOUT))
+
+
+def user_deleted(user_id):
+    forget(user_id)
+    transaction.on_commit(lambda: forget(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который берёт пользователя сессии из кэша."""
+
+    def get_user(self, user_id):
+        data = cache.get(user_key(user_id))
+        user = None if data is None else restore(data)
+        if user is None:
+            # С реплики в кэш на сутки могла бы попасть отставшая строка.
+            try:
+                user = User._default_manager.db_manager(
+                    DEFAULT_DB_ALIAS).get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            remember(user)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,403 @@
+"""Кэш, общий для всех процессов сайта.
+
+SharedCache — замена LocMemCache с тем же API Django: хранилище
+вынесено в клиента, поэтому закэшированный фрагмент, увеличенное
+поколение или корзина ограничителя видны всем воркерам сразу. Клиент
+по умолчанию — SQLiteClient, файл базы на общем диске. Сетевое
+хранилище подключается через OPTIONS['CLIENT'] классом с тем же
+небольшим набором методов; MemoryClient — его замена в пределах
+процесса для тестов.
+
+Чтобы истекающий горячий ключ не отправил в базу все воркеры разом,
+каждое значение хранится вместе с мягким сроком, немного раньше
+настоящего. После мягкого срока пересчёт получает только тот, кто
+первым поставит блокировку ключа, остальные до конца настоящего срока
+читают старое значение. get_or_set на промахе тоже считает значение
+один раз: остальные ждут его до LOCK_WAIT секунд.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from core.instrumentation import InstrumentedCacheMixin
+
+# Доля срока жизни значения в конце, когда его уже пересчитывают, но
+# ещё отдают; не больше MAX_GRACE секунд.
+GRACE_SHARE = 0.1
+MAX_GRACE = 60
+LOCK_SUFFIX = ':fill'
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2
+LOCK_POLL = 0.01
+
+
+class MemoryClient:
+    """Хранилище в памяти процесса, общее для всех клиентов с одним
+    LOCATION. Заменяет сетевое хранилище в тестах.
+    """
+    _stores = {}
+    _lock = threading.Lock()
+
+    def __init__(self, location, options):
+        with self._lock:
+            self.store = self._stores.setdefault(location, {})
+
+    def _alive(self, key, now):
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self.store[key]
+            return None
+        return entry
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            found = {key: self._alive(key, now) for key in keys}
+        return {key: entry[0] for key, entry in found.items() if entry}
+
+    def set_many(self, data, expires):
+        with self._lock:
+            for key, value in data.items():
+                self.store[key] = (value, expires)
+
+    def add(self, key, value, expires):
+        with self._lock:
+            if self._alive(key, time.time()):
+                return False
+            self.store[key] = (value, expires)
+            return True
+
+    def update(self, key, function, expires=None):
+        with self._lock:
+            entry = self._alive(key, time.time())
+            if entry is None:
+                return None
+            value = function(entry[0])
+            if value is not None:
+                self.store[key] = (
+                    value, entry[1] if expires is None else expires)
+            return value
+
+    def delete_many(self, keys):
+        with self._lock:
+            return sum(self.store.pop(key, None) is not None for key in keys)
+
+    def clear(self):
+        with self._lock:
+            self.store.clear()
+
+    def cull(self, max_entries, cull_frequency):
+        with self._lock:
+            if len(self.store) < max_entries:
+                return
+            for key in list(self.store)[:len(self.store) // cull_frequency]:
+                del self.store[key]
+
+
+class SQLiteClient:
+    """Хранилище в файле SQLite, который открывают все процессы.
+
+    Каждый поток держит своё соединение; после fork соединение
+    открывается заново. WAL позволяет читать во время записи, add и
+    update выполняются одной транзакцией и атомарны между процессами.
+    """
+
+    def __init__(self, location, options):
+        self.path = location
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_entries_expires '
+                'ON cache_entries (expires)')
+            self.local.connection, self.local.pid = connection, pid
+        return self.local.connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        # SQLite ограничивает число параметров запроса.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            found.update(self.connection.execute(
+                'SELECT key, value FROM cache_entries '
+                'WHERE key IN ({}) AND (expires IS NULL OR expires > ?)'
+                .format(','.join('?' * len(chunk))),
+                [*chunk, time.time()]))
+        return found
+
+    def set_many(self, data, expires):
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?)',
+                [(key, value, expires) for key, value in data.items()])
+
+    def add(self, key, value, expires):
+        cursor = self.connection.execute(
+            'INSERT INTO cache_entries VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entries.expires <= ?',
+            (key, value, expires, time.time()))
+        return cursor.rowcount == 1
+
+    def update(self, key, function, expires=None):
+        """Заменяет живое значение на function(значение) в одной
+        транзакции. None от function оставляет запись как есть, срок
+        меняется, только если передан expires.
+        """
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache_entries '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                return None
+            value = function(row[0])
+            if value is not None:
+                connection.execute(
+                    'UPDATE cache_entries SET value = ?, '
+                    'expires = COALESCE(?, expires) WHERE key = ?',
+                    (value, expires, key))
+        return value
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return 0
+        cursor = self.connection.execute(
+            'DELETE FROM cache_entries WHERE key IN ({})'.format(
+                ','.join('?' * len(keys))), keys)
+        return cursor.rowcount
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache_entries')
+
+    def cull(self, max_entries, cull_frequency):
+        with self.transaction() as connection:
+            connection.execute(
+                'DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+            count = connection.execute(
+                'SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+            if count >= max_entries:
+                connection.execute(
+                    'DELETE FROM cache_entries WHERE key IN ('
+                    'SELECT key FROM cache_entries '
+                    'ORDER BY expires IS NULL, expires LIMIT ?)',
+                    (count // cull_frequency,))
+
+
+class SharedCache(BaseCache):
+    """Бэкенд кэша поверх клиента из OPTIONS['CLIENT']."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        client = import_string(
+            options.get('CLIENT', 'core.cache.SQLiteClient'))
+        self.client = client(location, options)
+        # Отбраковка идёт раз в CULL_EVERY записей, а не на каждой.
+        self.cull_every = options.get('CULL_EVERY', 100)
+        self.writes = 0
+
+    def _encode(self, value, expires):
+        soft = None
+        if expires is not None:
+            lifetime = expires - time.time()
+            soft = expires - min(lifetime * GRACE_SHARE, MAX_GRACE)
+        return pickle.dumps((value, soft), pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, key, raw):
+        """(значение, нужно ли этому вызову его пересчитать)."""
+        value, soft = pickle.loads(raw)
+        if soft is not None and time.time() >= soft and self.client.add(
+                key + LOCK_SUFFIX, self._encode(True, None),
+                time.time() + LOCK_TIMEOUT):
+            return value, True
+        return value, False
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, data, timeout):
+        self.writes += len(data)
+        if self.writes >= self.cull_every:
+            self.writes = 0
+            self.client.cull(self._max_entries, self._cull_frequency)
+        expires = self.get_backend_timeout(timeout)
+        self.client.set_many(
+            {key: self._encode(value, expires)
+             for key, value in data.items()},
+            expires)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        raw = self.client.get_many([key]).get(key)
+        if raw is None:
+            return default
+        value, refresh = self._decode(key, raw)
+        return default if refresh else value
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = {}
+        for key, raw in self.client.get_many(keys).items():
+            value, refresh = self._decode(key, raw)
+            if not refresh:
+                found[keys[key]] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write({self._key(key, version): value}, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(
+            {self._key(key, version): value for key, value in data.items()},
+            timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        return self.client.add(
+            self._key(key, version), self._encode(value, expires), expires)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        """Значение ключа или default, посчитанный одним вызовом на все
+        процессы.
+        """
+        made_key = self._key(key, version)
+        lock = made_key + LOCK_SUFFIX
+        raw = self.client.get_many([made_key]).get(made_key)
+        held = False
+        if raw is not None:
+            value, held = self._decode(made_key, raw)
+            if not held:
+                return value
+        elif callable(default):
+            held = self.client.add(
+                lock, self._encode(True, None), time.time() + LOCK_TIMEOUT)
+            # Без блокировки значение уже считает другой вызов.
+            deadline = time.monotonic() + LOCK_WAIT
+            while not held and time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                raw = self.client.get_many([made_key]).get(made_key)
+                if raw is not None:
+                    return pickle.loads(raw)[0]
+        try:
+            if callable(default):
+                default = default()
+            if default is not None:
+                self._write({made_key: default}, timeout)
+        finally:
+            if held:
+                self.client.delete_many([lock])
+        return default
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        raw = self.client.get_many([key]).get(key)
+        if raw is None:
+            return False
+        expires = self.get_backend_timeout(timeout)
+        value = pickle.loads(raw)[0]
+        self.client.set_many({key: self._encode(value, expires)}, expires)
+        return True
+
+    def delete(self, key, version=None):
+        return bool(self.client.delete_many([self._key(key, version)]))
+
+    def delete_many(self, keys, version=None):
+        self.client.delete_many([self._key(key, version) for key in keys])
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self.client.get_many([key])
+
+    def incr(self, key, delta=1, version=None):
+        def add_delta(raw):
+            value, soft = pickle.loads(raw)
+            return pickle.dumps((value + delta, soft),
+                                pickle.HIGHEST_PROTOCOL)
+
+        key = self._key(key, version)
+        raw = self.client.update(key, add_delta)
+        if raw is None:
+            raise ValueError(f"Key '{key}' not found")
+        return pickle.loads(raw)[0]
+
+    def update(self, key, function, timeout=DEFAULT_TIMEOUT, version=None):
+        """Атомарно заменяет значение ключа на function(значение).
+
+        function получает текущее значение или None, если ключа нет, и
+        возвращает новое или None, чтобы ничего не записывать; её могут
+        вызвать несколько раз. Мягкого срока у такого значения нет:
+        его меняют на месте, а не пересчитывают. timeout=None оставляет
+        прежний срок записи. Возвращает записанное значение или None.
+        """
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        found = False
+
+        def replace(raw):
+            nonlocal found
+            found = True
+            value = function(pickle.loads(raw)[0])
+            if value is None:
+                return None
+            return pickle.dumps((value, None), pickle.HIGHEST_PROTOCOL)
+
+        while True:
+            found = False
+            raw = self.client.update(key, replace, expires)
+            if found:
+                return None if raw is None else pickle.loads(raw)[0]
+            value = function(None)
+            if value is None:
+                return None
+            # Ключ мог появиться между update и add — тогда заново.
+            if self.client.add(key, pickle.dumps(
+                    (value, None), pickle.HIGHEST_PROTOCOL), expires):
+                return value
+
+    def clear(self):
+        self.client.clear()
+
+
+class InstrumentedSharedCache(InstrumentedCacheMixin, SharedCache):
+    pass
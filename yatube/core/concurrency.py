@@ -0,0 +1,67 @@
+"""Параллельное выполнение независимых запросов к базе.
+
+gather() отдаёт вызовы, кроме первого, в общий пул потоков, а первый
+выполняет сам. У каждого потока пула своё соединение с базой, которое
+живёт по правилам CONN_MAX_AGE. Контекст запроса (маршрутизация на
+реплики, замеры) переносится в поток через copy_context, запросы из
+пула попадают в Server-Timing.
+
+Внутри transaction.atomic вызовы выполняются по очереди: соединения
+пула не видят незафиксированных изменений транзакции.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from contextvars import copy_context
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from core.instrumentation import current
+
+_executor = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.CONCURRENT_LOOKUP_WORKERS,
+                    thread_name_prefix='lookup')
+    return _executor
+
+
+def sequential():
+    return (not settings.CONCURRENT_LOOKUP_WORKERS
+            or any(connection.in_atomic_block
+                   for connection in connections.all()))
+
+
+def _run(call):
+    close_old_connections()
+    metrics = current.get()
+    with ExitStack() as stack:
+        if metrics is not None:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute))
+        return call()
+
+
+def gather(*calls):
+    """Выполняет независимые вызовы одновременно и возвращает их
+    результаты в том же порядке. Исключение любого вызова поднимается
+    после завершения остальных.
+    """
+    if len(calls) < 2 or sequential():
+        return [call() for call in calls]
+    futures = [executor().submit(copy_context().run, _run, call)
+               for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        wait(futures)
+    return [first, *(future.result() for future in futures)]
@@ -0,0 +1,228 @@
+"""Лёгкие замеры каждого запроса.
+
+InstrumentationMiddleware заводит на запрос RequestMetrics и кладёт его
+в contextvar. SQL считается через execute_wrapper соединений, шаблоны —
+бэкендом InstrumentedDjangoTemplates, кэш — бэкендом с
+InstrumentedCacheMixin. Итог уходит в заголовок Server-Timing и в
+скользящие гистограммы по имени URL, которые показывает core:stats.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.template.backends.django import DjangoTemplates, Template
+
+# Верхние границы корзин гистограмм: миллисекунды для времени, штуки
+# для числа запросов и обращений к кэшу.
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+METRICS = ('total', 'db', 'queries', 'template', 'cache', 'cache_hits',
+           'cache_misses')
+
+current = ContextVar('request_metrics', default=None)
+_missing = object()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса. Время хранится в секундах."""
+    __slots__ = ('queries', 'db', 'template', 'cache', 'cache_hits',
+                 'cache_misses', 'template_depth', 'lock')
+
+    def __init__(self):
+        # SQL могут считать и потоки core.concurrency.gather.
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.cache = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """execute_wrapper для соединений с базой."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.db += elapsed
+                self.queries += 1
+
+    def values(self, total):
+        return {
+            'total': total * 1000,
+            'db': self.db * 1000,
+            'queries': self.queries,
+            'template': self.template * 1000,
+            'cache': self.cache * 1000,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template * 1000:.1f}',
+            f'cache;dur={self.cache * 1000:.1f};'
+            f'desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None or metrics.template_depth:
+            return super().render(context, request)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template += time.perf_counter() - started
+            metrics.template_depth -= 1
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который считает время отрисовки шаблонов.
+
+    Вложенные render_to_string внутри отрисовки не считаются дважды.
+    Время включает ленивые SQL-запросы, выполненные из шаблона.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self)
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания и промахи get и get_many текущего запроса."""
+
+    def get(self, key, default=None, version=None):
+        metrics = current.get()
+        if metrics is None:
+            return super().get(key, default, version)
+        started = time.perf_counter()
+        value = super().get(key, _missing, version)
+        metrics.cache += time.perf_counter() - started
+        if value is _missing:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        metrics = current.get()
+        if metrics is None:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        started = time.perf_counter()
+        found = super().get_many(keys, version)
+        metrics.cache += time.perf_counter() - started
+        metrics.cache_hits += len(found)
+        metrics.cache_misses += len(keys) - len(found)
+        return found
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class RollingHistogram:
+    """Гистограмма за последние window секунд.
+
+    Окно разбито на кольцо слотов по slot секунд; устаревший слот
+    обнуляется при первой записи в него, поэтому запись стоит O(1).
+    """
+
+    def __init__(self, window, slot):
+        self.slot = slot
+        self.size = max(1, int(window // slot))
+        self.slots = [None] * self.size
+
+    def add(self, value, now):
+        stamp = int(now // self.slot)
+        entry = self.slots[stamp % self.size]
+        if entry is None or entry[0] != stamp:
+            entry = [stamp, [0] * (len(BUCKETS) + 1), 0.0]
+            self.slots[stamp % self.size] = entry
+        entry[1][bisect_left(BUCKETS, value)] += 1
+        entry[2] += value
+
+    def merged(self, now):
+        stamp = int(now // self.slot)
+        counts = [0] * (len(BUCKETS) + 1)
+        total = 0.0
+        for entry in self.slots:
+            if entry is not None and stamp - entry[0] < self.size:
+                counts = [a + b for a, b in zip(counts, entry[1])]
+                total += entry[2]
+        return counts, total
+
+    def summary(self, now):
+        """Число замеров, среднее и перцентили как верхние границы
+        корзин (None — больше последней границы).
+        """
+        counts, total = self.merged(now)
+        count = sum(counts)
+        result = {'count': count, 'mean': round(total / count, 3)
+                  if count else None}
+        for name, share in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            result[name] = None
+            seen = 0
+            for position, amount in enumerate(counts):
+                seen += amount
+                if count and seen >= share * count:
+                    result[name] = (BUCKETS[position]
+                                    if position < len(BUCKETS) else None)
+                    break
+        result['buckets'] = dict(zip(
+            [str(bound) for bound in BUCKETS] + ['inf'], counts))
+        return result
+
+
+class RequestStats:
+    """Скользящие гистограммы метрик по имени URL в памяти процесса."""
+
+    def __init__(self, window, slot):
+        self.window = window
+        self.slot = slot
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, values, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            histograms = self.views.get(view_name)
+            if histograms is None:
+                histograms = self.views[view_name] = {
+                    metric: RollingHistogram(self.window, self.slot)
+                    for metric in METRICS
+                }
+            for metric in METRICS:
+                histograms[metric].add(values[metric], now)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            return {
+                view_name: {metric: histogram.summary(now)
+                            for metric, histogram in histograms.items()}
+                for view_name, histograms in sorted(self.views.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+request_stats = RequestStats(
+    settings.REQUEST_STATS_WINDOW, settings.REQUEST_STATS_SLOT)
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils.module_loading import autodiscover_modules
+
+from core import tasks
+
+
+def run_and_close(task_id):
+    """Выполняет задачу в потоке или процессе пула."""
+    try:
+        return tasks.run(task_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди пулом потоков или '
+            'процессов, пока не получит SIGINT или SIGTERM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.TASK_WORKERS,
+            help='Сколько задач выполнять одновременно.')
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Пул процессов вместо пула потоков, для задач, '
+                 'которые упираются в процессор.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должно быть больше нуля')
+        autodiscover_modules('tasks')
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        if options['once']:
+            done = tasks.run_pending(self.worker)
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        for number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(number, lambda *_: self.stopping.set())
+        if options['processes']:
+            # spawn, а не fork: дочерние процессы не должны наследовать
+            # открытые соединения с базой.
+            pool = ProcessPoolExecutor(
+                options['workers'], initializer=django.setup,
+                mp_context=multiprocessing.get_context('spawn'))
+        else:
+            pool = ThreadPoolExecutor(
+                options['workers'], thread_name_prefix='tasks')
+        self.stdout.write(
+            f'Воркер {self.worker}: {options["workers"]} '
+            f'{"процессов" if options["processes"] else "потоков"}')
+        with pool:
+            self.loop(pool, options['workers'])
+        self.stdout.write('Воркер остановлен')
+
+    def loop(self, pool, workers):
+        running = set()
+        purged = 0
+        while not self.stopping.is_set():
+            close_old_connections()
+            if time.monotonic() - purged > settings.TASK_PURGE_EVERY:
+                tasks.release_expired()
+                tasks.purge()
+                purged = time.monotonic()
+            for task_id in tasks.claim(self.worker, workers - len(running)):
+                running.add(pool.submit(run_and_close, task_id))
+            if running:
+                # Полный пул ждёт свободного места, неполный — ещё и
+                # новых задач.
+                wait(running, return_when=FIRST_COMPLETED,
+                     timeout=None if len(running) == workers
+                     else settings.TASK_POLL_INTERVAL)
+            else:
+                self.stopping.wait(settings.TASK_POLL_INTERVAL)
+            self.collect(running)
+        # Захваченные задачи доделываются, новые не берутся.
+        wait(running)
+        self.collect(running)
+
+    def collect(self, running):
+        for future in [future for future in running if future.done()]:
+            running.discard(future)
+            if future.exception() is not None:
+                self.stderr.write(f'Ошибка воркера: {future.exception()!r}')
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики. Заменяет '
+            'репликацию при локальной проверке чтения с реплик.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Псевдонимы реплик (по умолчанию DATABASE_REPLICAS).')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не заданы: укажите псевдонимы '
+                               'или DATABASE_REPLICAS')
+        source = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+                raise CommandError(f'Неизвестная реплика: {alias}')
+            target = connections[alias]
+            if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+                raise CommandError('Копирование поддерживается только '
+                                   'для SQLite')
+            source.ensure_connection()
+            target.ensure_connection()
+            source.connection.backup(target.connection)
+            self.stdout.write(f'{alias}: скопировано')
@@ -0,0 +1,71 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core.instrumentation import RequestMetrics, current, request_stats
+from core.routers import PIN_COOKIE, Routing, routing, wants_primary
+
+
+class InstrumentationMiddleware:
+    """Замеряет запрос и отдаёт замеры в заголовке Server-Timing.
+
+    Должен стоять первым в MIDDLEWARE, чтобы total включал остальные
+    middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = metrics.server_timing(total)
+        match = request.resolver_match
+        if match is not None:
+            request_stats.record(match.view_name, metrics.values(total))
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Разрешает чтение с реплик для GET и HEAD запросов.
+
+    Запросы к представлениям с use_primary, небезопасные методы и
+    запросы в окне после собственной записи пользователя читают из
+    default. Если во время запроса была запись, ответ ставит cookie,
+    которая держит пользователя на default REPLICA_PIN_SECONDS секунд.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = Routing(
+            request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+        )
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if wants_primary(view_func):
+            routing.get().replica = False
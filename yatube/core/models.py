@@ -11,3 +11,54 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class Task(models.Model):
+    """Задача фоновой очереди (см. core.tasks)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не удалась'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    arguments = models.TextField('Аргументы (JSON)', default='[]')
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text='Задача с тем же ключом ставится в очередь один раз')
+    status = models.CharField(
+        'Статус', max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Наибольшее число попыток')
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+    run_at = models.DateTimeField('Выполнить не раньше')
+    started = models.DateTimeField('Начата', null=True, blank=True)
+    finished = models.DateTimeField('Закончена', null=True, blank=True)
+    worker = models.CharField('Воркер', max_length=100, blank=True)
+    locked_until = models.DateTimeField(
+        'Занята до', null=True, blank=True,
+        help_text='После этого задачу воркера считают упавшей')
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='task_status_run_at_idx'),
+            models.Index(fields=['status', 'finished'],
+                         name='task_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
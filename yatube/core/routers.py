@@ -0,0 +1,73 @@
+"""Разделение чтения и записи между основной базой и репликами.
+
+Запись всегда идёт в default. Чтение уходит в одну из реплик из
+settings.DATABASE_REPLICAS только внутри GET и HEAD запросов, которые
+ReplicaRoutingMiddleware разрешил читать с реплики. Остальное —
+команды, shell, POST-запросы и представления с use_primary — читает
+из default; после первой записи в запросе его чтения тоже идут в
+default. После записи пользователь ещё REPLICA_PIN_SECONDS секунд
+читает из default (cookie PIN_COOKIE), чтобы видеть свои изменения,
+пока реплика догоняет основную базу.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'primary_pin'
+
+routing = ContextVar('replica_routing', default=None)
+
+
+class Routing:
+    """Состояние одного запроса: можно ли читать с реплики, с какой и
+    была ли запись.
+
+    Реплика выбирается один раз на запрос: реплики отстают по-разному,
+    и чтение с нескольких собрало бы страницу из разных моментов.
+    """
+    __slots__ = ('replica', 'alias', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        replicas = settings.DATABASE_REPLICAS
+        self.alias = random.choice(replicas) if replica and replicas else None
+        self.wrote = False
+
+
+def use_primary(view):
+    """Помечает функцию-представление: весь запрос идёт в default."""
+    view.use_primary = True
+    return view
+
+
+class UsePrimaryMixin:
+    """То же для представлений-классов."""
+    use_primary: bool = True
+
+
+def wants_primary(view_func):
+    view = getattr(view_func, 'view_class', view_func)
+    return getattr(view, 'use_primary', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if state is None or not state.replica or state.wrote:
+            return None
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default, объекты с любой из них совместимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core import auth
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    auth.user_changed(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    auth.user_deleted(instance.pk)
+
+
+@receiver(user_logged_in)
+def user_logged_in_remember(sender, request, user, **kwargs):
+    auth.remember(user)
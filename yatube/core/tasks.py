@@ -0,0 +1,232 @@
+"""Фоновая очередь задач в основной базе.
+
+Медленные побочные действия запроса — миниатюры, раскладка поста по
+лентам, письма, массовые действия админки — ставятся в очередь
+строкой Task в той же транзакции, что и сами данные: откат запроса
+отменяет и задачу, а фиксация делает её видимой воркеру. Ответ
+уходит сразу, задачи выполняет команда run_tasks.
+
+Задача — функция с декоратором @task в модуле tasks.py приложения,
+аргументы сериализуются в JSON. Задача с ключом ставится в очередь
+один раз, пока её строка хранится, поэтому повторный запрос не
+запустит работу дважды; неудавшуюся задачу тот же ключ ставит
+заново, выполненную — только с requeue=True. Воркер захватывает
+задачу условным UPDATE по статусу, так что одну задачу не возьмут два
+воркера; задача упавшего воркера возвращается в очередь, когда
+истечёт TASK_LEASE. Упавшая
+задача повторяется через TASK_RETRY_DELAY * 2 ** (попытка - 1)
+секунд, пока не кончатся попытки, поэтому задачи пишутся так, чтобы
+повтор после частичного выполнения был безвреден. Задача идёт без
+общей транзакции: в SQLite транзакция, которая сначала читает, а
+потом пишет, при параллельной записи сразу падает с «database is
+locked», а отдельные запросы ждут блокировку. Глубину очереди и
+задержки видно на core:stats и в админке.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core.models import Task
+
+logger = logging.getLogger(__name__)
+
+# Имя задачи -> (функция, наибольшее число попыток).
+registry = {}
+
+
+def queue():
+    return Task.objects.using(DEFAULT_DB_ALIAS)
+
+
+def task(name=None, max_attempts=None):
+    """Регистрирует функцию как задачу и добавляет ей enqueue."""
+    def decorator(function):
+        task_name = name or f'{function.__module__}.{function.__name__}'
+        registry[task_name] = (function, max_attempts)
+        function.task_name = task_name
+        function.enqueue = partial(enqueue, task_name)
+        return function
+    return decorator
+
+
+def enqueue(name, *args, key=None, delay=0, requeue=False, **kwargs):
+    """Ставит задачу в очередь в текущей транзакции.
+
+    Если задача с таким ключом уже есть, возвращает её; неудавшаяся
+    задача с этим ключом ставится в очередь заново, а с requeue=True —
+    и выполненная.
+    """
+    _, max_attempts = registry.get(name, (None, None))
+    fields = {
+        'name': name,
+        'arguments': json.dumps([args, kwargs], ensure_ascii=False),
+        'max_attempts': max_attempts or settings.TASK_MAX_ATTEMPTS,
+        'run_at': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        return queue().create(**fields)
+    existing = queue().filter(key=key).first()
+    if existing is not None:
+        finished = (Task.FAILED, Task.DONE) if requeue else (Task.FAILED,)
+        if existing.status in finished and queue().filter(
+                pk=existing.pk, status=existing.status).update(
+                    attempts=0, status=Task.QUEUED, started=None,
+                    finished=None, worker='', error='', **fields):
+            existing.refresh_from_db()
+        return existing
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            return queue().create(key=key, **fields)
+    except IntegrityError:
+        return queue().get(key=key)
+
+
+def release_expired(now=None):
+    """Возвращает в очередь задачи воркеров, не уложившихся в
+    TASK_LEASE; без оставшихся попыток задача считается неудавшейся.
+    """
+    now = now or timezone.now()
+    expired = queue().filter(status=Task.RUNNING, locked_until__lt=now)
+    expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, finished=now, locked_until=None,
+        error='Воркер не закончил задачу за TASK_LEASE')
+    return expired.update(status=Task.QUEUED, locked_until=None)
+
+
+def claim(worker, limit):
+    """Захватывает до limit готовых задач, возвращает их id."""
+    now = timezone.now()
+    candidates = list(
+        queue().filter(status=Task.QUEUED, run_at__lte=now)
+        .order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+    lease = now + timedelta(seconds=settings.TASK_LEASE)
+    return [
+        task_id for task_id in candidates
+        if queue().filter(pk=task_id, status=Task.QUEUED).update(
+            status=Task.RUNNING, worker=worker, started=now,
+            locked_until=lease, attempts=F('attempts') + 1)
+    ]
+
+
+def find(name):
+    if name not in registry:
+        autodiscover_modules('tasks')
+    return registry.get(name, (None, None))[0]
+
+
+def run(task_id):
+    """Выполняет захваченную задачу и записывает итог.
+
+    Возвращает True, если задача выполнена.
+    """
+    job = queue().get(pk=task_id)
+    function = find(job.name)
+    try:
+        if function is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована')
+        args, kwargs = json.loads(job.arguments)
+        function(*args, **kwargs)
+    except Exception:
+        now = timezone.now()
+        retry = job.attempts < job.max_attempts
+        logger.warning('Задача %s не удалась (попытка %s из %s)', job,
+                       job.attempts, job.max_attempts, exc_info=True)
+        delay = settings.TASK_RETRY_DELAY * 2 ** (job.attempts - 1)
+        queue().filter(pk=job.pk, status=Task.RUNNING).update(
+            status=Task.QUEUED if retry else Task.FAILED,
+            run_at=now + timedelta(seconds=delay) if retry else job.run_at,
+            finished=None if retry else now,
+            locked_until=None,
+            error=traceback.format_exc(),
+        )
+        return False
+    queue().filter(pk=job.pk, status=Task.RUNNING).update(
+        status=Task.DONE, finished=timezone.now(), locked_until=None)
+    return True
+
+
+def run_pending(worker='inline', limit=None):
+    """Выполняет готовые задачи в текущем потоке, пока они есть.
+
+    Нужна тестам и --once; возвращает число выполненных задач.
+    """
+    done = 0
+    while limit is None or done < limit:
+        claimed = claim(worker, 1)
+        if not claimed:
+            break
+        run(claimed[0])
+        done += 1
+    return done
+
+
+def purge(now=None):
+    """Удаляет выполненные и неудавшиеся задачи старше TASK_KEEP_DONE."""
+    since = (now or timezone.now()) - timedelta(
+        seconds=settings.TASK_KEEP_DONE)
+    deleted, _ = queue().filter(
+        status__in=(Task.DONE, Task.FAILED), finished__lt=since).delete()
+    return deleted
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def stats(now=None):
+    """Глубина очереди по задачам и задержки выполненных за
+    TASK_STATS_WINDOW секунд: ожидание в очереди и время работы, мс.
+    """
+    now = now or timezone.now()
+    names = {}
+    queued = (
+        queue().filter(status__in=(Task.QUEUED, Task.RUNNING))
+        .order_by().values('name', 'status')
+        .annotate(count=Count('id'), oldest=Min('run_at'))
+    )
+    for row in queued:
+        entry = names.setdefault(row['name'], {})
+        entry[row['status']] = row['count']
+        if row['status'] == Task.QUEUED:
+            entry['oldest_ms'] = max(
+                0, (now - row['oldest']).total_seconds() * 1000)
+    since = now - timedelta(seconds=settings.TASK_STATS_WINDOW)
+    failed = (queue().filter(status=Task.FAILED, finished__gte=since)
+              .order_by().values('name').annotate(count=Count('id')))
+    for row in failed:
+        names.setdefault(row['name'], {})[Task.FAILED] = row['count']
+    timings = {}
+    finished = (
+        queue().filter(status=Task.DONE, finished__gte=since)
+        .order_by('-finished')
+        .values_list('name', 'run_at', 'started', 'finished')
+        [:settings.TASK_STATS_LIMIT]
+    )
+    for name, run_at, started, done in finished:
+        wait, work = timings.setdefault(name, ([], []))
+        wait.append(max(0, (started - run_at).total_seconds() * 1000))
+        work.append((done - started).total_seconds() * 1000)
+    for name, (wait, work) in timings.items():
+        wait.sort()
+        work.sort()
+        names.setdefault(name, {}).update({
+            Task.DONE: len(work),
+            'wait_p50': percentile(wait, 0.5),
+            'wait_p95': percentile(wait, 0.95),
+            'run_p50': percentile(work, 0.5),
+            'run_p95': percentile(work, 0.95),
+        })
+    return {
+        'depth': sum(entry.get(Task.QUEUED, 0) for entry in names.values()),
+        'tasks': names,
+    }
@@ -0,0 +1,26 @@
+"""Запуск тестов на кэше в памяти вместо общего кэша сайта."""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты очищают кэш и пишут в него, поэтому каждый прогон
+    получает своё хранилище в памяти процесса.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = {
+            alias: dict(
+                params, LOCATION=f'test-{alias}',
+                OPTIONS=dict(params.get('OPTIONS', {}),
+                             CLIENT='core.cache.MemoryClient'))
+            for alias, params in settings.CACHES.items()
+        }
+        self.caches = override_settings(CACHES=caches)
+        self.caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,4 +1,55 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core import auth, tasks
+from core.asgi import WsgiToAsgi
+from core.cache import SharedCache
+from core.concurrency import gather
+from core.instrumentation import RollingHistogram, request_stats
+from core.models import Task
+from core.routers import (PIN_COOKIE, PrimaryReplicaRouter, Routing,
+                          routing)
+from core.throttling import client_ip, take
+from posts.def_uls import (COMMENT_URL, FOLLOW_INDEX_URL, INDEX_URL,
+                           POST_EDIT_URL, PROFILE_URL)
+from posts.models import Comment, Follow, Post, User
+from users.forms import QueuedPasswordResetForm
+
+STATS_URL = reverse('core:stats')
+
+calls = []
+
+
+@tasks.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@tasks.task('tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError('сбой')
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +57,670 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class InstrumentationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.user = User.objects.create_user(username='user')
+
+    def setUp(self):
+        cache.clear()
+        request_stats.reset()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_server_timing_header(self):
+        """Ответ несёт замеры SQL, шаблонов, кэша и общего времени."""
+        response = self.client.get(INDEX_URL())
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'cache;dur=', 'total;dur='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+        queries = int(re.search(r'"(\d+) queries"', timing).group(1))
+        misses = int(re.search(r'(\d+) misses', timing).group(1))
+        self.assertGreater(queries, 0)
+        self.assertGreater(misses, 0)
+        hits = int(re.search(r'(\d+) hits', self.client.get(
+            INDEX_URL())['Server-Timing']).group(1))
+        self.assertGreater(hits, 0)
+
+    def test_stats_aggregated_by_url_name(self):
+        """Замеры копятся в гистограммах по имени URL."""
+        for _ in range(3):
+            self.client.get(INDEX_URL())
+        stats = self.staff_client.get(STATS_URL).json()['views']
+        self.assertEqual(stats['posts:index']['total']['count'], 3)
+        self.assertIsNotNone(stats['posts:index']['total']['p99'])
+        self.assertEqual(
+            sum(stats['posts:index']['queries']['buckets'].values()), 3)
+
+    def test_stats_staff_only(self):
+        """Статистику видит только персонал."""
+        client = Client()
+        client.force_login(self.user)
+        self.assertEqual(client.get(STATS_URL).status_code, 302)
+        self.assertEqual(self.client.get(STATS_URL).status_code, 302)
+        self.assertEqual(self.staff_client.get(STATS_URL).status_code, 200)
+
+    def test_rolling_window(self):
+        """Старые слоты выпадают из окна."""
+        histogram = RollingHistogram(window=60, slot=10)
+        histogram.add(3, now=0)
+        histogram.add(300, now=30)
+        self.assertEqual(histogram.summary(now=30)['count'], 2)
+        self.assertEqual(histogram.summary(now=30)['p99'], 500)
+        self.assertEqual(histogram.summary(now=65)['count'], 1)
+        self.assertEqual(histogram.summary(now=100)['count'], 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    """Тестовые базы default и replica играют роль основной базы и
+    реплики; sync_replica заменяет репликацию.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.sync()
+
+    def sync(self):
+        call_command('sync_replica', stdout=StringIO())
+
+    def texts(self, client, name='api:v1:index', *args):
+        response = client.get(reverse(name, args=args))
+        return [item['text'] for item in json.loads(
+            b''.join(response.streaming_content))['results']]
+
+    def test_feed_reads_replica(self):
+        """Ленты читаются с реплики и видят записи после репликации"""
+        Post.objects.create(author=self.author, text='Новый')
+        self.assertNotIn('Новый', self.texts(self.client))
+        self.sync()
+        self.assertIn('Новый', self.texts(self.client))
+
+    def test_own_write_read_from_primary(self):
+        """После своей записи пользователь читает из default, пока
+        не истечёт окно
+        """
+        response = self.author_client.post(
+            COMMENT_URL(self.post.id), {'text': 'Комментарий'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(Comment.objects.filter(text='Комментарий').exists())
+        self.assertFalse(Comment.objects.using('replica').exists())
+        comments = ('api:v1:post_comments', self.post.id)
+        self.assertEqual(self.texts(self.author_client, *comments),
+                         ['Комментарий'])
+        del self.author_client.cookies[PIN_COOKIE]
+        self.assertEqual(self.texts(self.author_client, *comments), [])
+
+    def test_write_views_use_primary(self):
+        """Страницы записи читают из default даже без cookie"""
+        post = Post.objects.create(author=self.author, text='Новый')
+        response = self.author_client.get(POST_EDIT_URL(post.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_one_replica_per_request(self):
+        """Все чтения запроса идут с одной реплики"""
+        with override_settings(DATABASE_REPLICAS=['replica', 'other']):
+            for _ in range(10):
+                token = routing.set(Routing(True))
+                try:
+                    aliases = {PrimaryReplicaRouter().db_for_read(Post)
+                               for _ in range(20)}
+                finally:
+                    routing.reset(token)
+                self.assertEqual(len(aliases), 1)
+                self.assertLessEqual(aliases, {'replica', 'other'})
+
+    def test_reads_after_write_use_primary(self):
+        """После записи чтения того же запроса идут в default"""
+        router = PrimaryReplicaRouter()
+        token = routing.set(Routing(True))
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            router.db_for_write(Post)
+            self.assertIsNone(router.db_for_read(Post))
+        finally:
+            routing.reset(token)
+
+    def test_outside_requests_use_primary(self):
+        """Команды и shell читают из default"""
+        self.assertEqual(Post.objects.all().db, 'default')
+
+
+class ConcurrencyTest(TransactionTestCase):
+    def test_gather(self):
+        """Вызовы идут в других потоках, результаты — по порядку"""
+        main = threading.get_ident()
+        results = gather(threading.get_ident, lambda: 2, lambda: 3)
+        self.assertEqual(results[0], main)
+        self.assertEqual(results[1:], [2, 3])
+        self.assertNotEqual(gather(lambda: 1, threading.get_ident)[1], main)
+
+    def test_gather_error(self):
+        """Исключение вызова из пула доходит до вызывающего"""
+        def fail():
+            raise ValueError('ошибка')
+        with self.assertRaises(ValueError):
+            gather(lambda: 1, fail)
+
+    def test_gather_in_transaction(self):
+        """Внутри транзакции вызовы выполняются в текущем потоке"""
+        with transaction.atomic():
+            self.assertEqual(gather(threading.get_ident,
+                                    threading.get_ident),
+                             [threading.get_ident()] * 2)
+
+    def test_profile_lookups(self):
+        """Профиль собирает автора, подписку и посты из разных потоков"""
+        author = User.objects.create_user(username='auth')
+        reader = User.objects.create_user(username='reader')
+        Post.objects.create(author=author, text='Пост автора')
+        Follow.objects.create(user=reader, author=author)
+        self.client.force_login(reader)
+        response = self.client.get(PROFILE_URL(author.username))
+        self.assertEqual(response.context['author'], author)
+        self.assertTrue(response.context['following'])
+        self.assertEqual([post.text for post in response.context['page_obj']],
+                         ['Пост автора'])
+        self.assertEqual(
+            self.client.get(PROFILE_URL('nobody')).status_code, 404)
+
+
+class AsgiTest(TransactionTestCase):
+    def request(self, scope, body=b''):
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        application = WsgiToAsgi(get_wsgi_application(), threads=2)
+        asyncio.run(application(scope, receive, send))
+        return sent
+
+    def test_http(self):
+        """Запрос через ASGI отдаёт ответ Django"""
+        User.objects.create_user(username='auth')
+        sent = self.request({
+            'type': 'http', 'method': 'GET', 'path': PROFILE_URL('auth'),
+            'query_string': b'', 'headers': [(b'host', b'testserver')],
+        })
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertEqual(sent[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertIn('auth', body.decode())
+        self.assertFalse(sent[-1].get('more_body'))
+
+    def test_lifespan(self):
+        """Сервер получает подтверждение запуска и остановки"""
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        application = WsgiToAsgi(get_wsgi_application(), threads=1)
+        asyncio.run(application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+class ThrottleTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket(self):
+        """burst запросов подряд, дальше по одному за интервал"""
+        bucket = [('throttle:test', 10, 3)]
+        self.assertEqual([take(bucket, now=1000) for _ in range(3)],
+                         [0, 0, 0])
+        self.assertAlmostEqual(take(bucket, now=1000), 10)
+        self.assertEqual(take(bucket, now=1010), 0)
+        self.assertGreater(take(bucket, now=1010), 0)
+
+    def test_all_or_nothing(self):
+        """Отказ одной корзины не тратит токены других"""
+        take([('throttle:ip', 10, 1)], now=1000)
+        buckets = [('throttle:user', 10, 1), ('throttle:ip', 10, 1)]
+        self.assertGreater(take(buckets, now=1000), 0)
+        self.assertEqual(take([('throttle:user', 10, 1)], now=1000), 0)
+
+    def test_concurrent(self):
+        """Одновременные запросы не получают больше burst токенов"""
+        bucket = [('throttle:race', 60, 5)]
+        barrier = threading.Barrier(16)
+        results = []
+
+        def hit():
+            barrier.wait()
+            results.append(take(bucket))
+        threads = [threading.Thread(target=hit) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 5)
+
+    def test_client_ip(self):
+        """Адрес клиента берётся у доверенных прокси, а не из подделанной
+        клиентом части X-Forwarded-For"""
+        request = RequestFactory().post(
+            '/', REMOTE_ADDR='10.0.0.2',
+            HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4, 10.0.0.1')
+        cases = ((0, '10.0.0.2'), (1, '10.0.0.1'), (2, '1.2.3.4'),
+                 (5, '10.0.0.2'))
+        for depth, expected in cases:
+            with self.subTest(depth=depth), override_settings(
+                    THROTTLE_TRUSTED_PROXIES=depth):
+                self.assertEqual(client_ip(request), expected)
+
+    def test_overhead(self):
+        """Проверка корзин стоит меньше миллисекунды"""
+        buckets = [('throttle:fast:user', 0.0001, 10 ** 6),
+                   ('throttle:fast:ip', 0.0001, 10 ** 6)]
+        started = time.perf_counter()
+        for _ in range(1000):
+            take(buckets)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+
+@override_settings(THROTTLE_RATES={
+    'comment': {'user': ('1/h', 2), 'ip': ('1/h', 3)}})
+class ThrottledViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, client):
+        return client.post(COMMENT_URL(self.post.id), {'text': 'Текст'})
+
+    def test_user_limit(self):
+        """Сверх лимита пользователя запрос получает 429 с Retry-After"""
+        self.client.force_login(self.author)
+        self.assertEqual([self.comment(self.client).status_code
+                          for _ in range(2)], [302, 302])
+        response = self.comment(self.client)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    def test_fails_closed(self):
+        """Без доступа к корзинам запрос не проходит"""
+        self.client.force_login(self.author)
+        with mock.patch('core.throttling.take', side_effect=OSError):
+            response = self.comment(self.client)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Comment.objects.count(), 0)
+
+    def test_ip_limit(self):
+        """Лимит адреса общий для всех пользователей с него"""
+        codes = []
+        for number in range(2):
+            client = Client()
+            client.force_login(
+                User.objects.create_user(username=f'user{number}'))
+            codes += [self.comment(client).status_code for _ in range(2)]
+        self.assertEqual(codes, [302, 302, 302, 429])
+
+
+class SharedCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def backend(self, client='core.cache.SQLiteClient'):
+        """Отдельный экземпляр, как в другом процессе."""
+        return SharedCache(self.path, {'OPTIONS': {'CLIENT': client}})
+
+    def run_threads(self, target, count=8):
+        barrier = threading.Barrier(count)
+
+        def run():
+            barrier.wait()
+            target()
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому"""
+        for client in ('core.cache.SQLiteClient', 'core.cache.MemoryClient'):
+            with self.subTest(client=client):
+                first, second = self.backend(client), self.backend(client)
+                first.set_many({'a': 1, 'b': [2]}, 60)
+                self.assertEqual(second.get_many(['a', 'b', 'c']),
+                                 {'a': 1, 'b': [2]})
+                self.assertFalse(second.add('a', 3))
+                self.assertEqual(second.incr('a', 5), 6)
+                self.assertEqual(first.get('a'), 6)
+                second.delete('b')
+                self.assertIsNone(first.get('b'))
+                first.set('gone', 1, 0)
+                self.assertFalse(second.has_key('gone'))
+                self.assertTrue(second.add('gone', 2))
+                first.clear()
+                self.assertIsNone(second.get('a'))
+
+    def test_atomic_incr_and_add(self):
+        """incr и add атомарны между экземплярами"""
+        self.backend().set('counter', 0, None)
+        added = []
+
+        def work():
+            backend = self.backend()
+            for _ in range(20):
+                backend.incr('counter')
+            added.append(backend.add('once', 1))
+        self.run_threads(work)
+        self.assertEqual(self.backend().get('counter'), 160)
+        self.assertEqual(added.count(True), 1)
+
+    def test_atomic_update(self):
+        """update атомарен между экземплярами и не имеет мягкого срока"""
+        def work():
+            backend = self.backend()
+            for _ in range(20):
+                backend.update('counter', lambda value: (value or 0) + 1, 100)
+        self.run_threads(work)
+        self.assertEqual(self.backend().get('counter'), 160)
+        self.assertIsNone(self.backend().update('counter', lambda _: None))
+        with mock.patch('core.cache.time.time',
+                        return_value=time.time() + 95):
+            self.assertEqual(self.backend().get('counter'), 160)
+
+    def test_early_refresh(self):
+        """После мягкого срока пересчитывает один вызов, остальные
+        читают старое значение"""
+        first, second = self.backend(), self.backend()
+        first.set('hot', 'old', 100)
+        later = time.time() + 95
+        with mock.patch('core.cache.time.time', return_value=later):
+            self.assertIsNone(first.get('hot'))
+            self.assertEqual(second.get('hot'), 'old')
+            self.assertEqual(second.get_many(['hot']), {'hot': 'old'})
+        with mock.patch('core.cache.time.time', return_value=later + 10):
+            self.assertIsNone(second.get('hot'))
+
+    def test_single_flight(self):
+        """На промахе значение считается один раз на все экземпляры"""
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'page'
+
+        def work():
+            results.append(self.backend().get_or_set('page', compute, 60))
+        self.run_threads(work)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['page'] * 8)
+        self.assertIsNone(self.backend().get('page:fill'))
+
+    def test_single_flight_refresh(self):
+        """Истекающее значение пересчитывает один вызов get_or_set"""
+        self.backend().set('hot', 'old', 100)
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'new'
+
+        def work():
+            results.append(self.backend().get_or_set('hot', compute, 100))
+        with mock.patch('core.cache.time.time',
+                        return_value=time.time() + 95):
+            self.run_threads(work)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), ['new'] + ['old'] * 7)
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        """Задача выполняется воркером, а не при постановке"""
+        task = record.enqueue('значение')
+        self.assertEqual((task.status, calls), (Task.QUEUED, []))
+        self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(calls, ['значение'])
+
+    def test_idempotency_key(self):
+        """Задача с ключом ставится в очередь один раз"""
+        first = record.enqueue(1, key='once')
+        second = record.enqueue(2, key='once')
+        self.assertEqual(first.pk, second.pk)
+        tasks.run_pending()
+        record.enqueue(3, key='once')
+        tasks.run_pending()
+        self.assertEqual(calls, [1])
+
+    def test_failed_key_requeued(self):
+        """Неудавшаяся задача с ключом ставится в очередь заново"""
+        task = fail.enqueue(key='retry')
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.FAILED, attempts=2, finished=timezone.now())
+        again = fail.enqueue(key='retry')
+        self.assertEqual(again.pk, task.pk)
+        self.assertEqual((again.status, again.attempts), (Task.QUEUED, 0))
+        self.assertEqual(tasks.claim('worker', 1), [task.pk])
+
+    def test_done_key_requeued_on_request(self):
+        """Выполненная задача с ключом ставится заново только с
+        requeue=True"""
+        task = record.enqueue('первый', key='done')
+        tasks.run_pending()
+        self.assertEqual(record.enqueue('второй', key='done').status,
+                         Task.DONE)
+        again = record.enqueue('второй', key='done', requeue=True)
+        self.assertEqual((again.pk, again.status), (task.pk, Task.QUEUED))
+        tasks.run_pending()
+        self.assertEqual(calls, ['первый', 'второй'])
+
+    def test_purge(self):
+        """Старые выполненные и неудавшиеся задачи удаляются"""
+        old = timezone.now() - timedelta(days=30)
+        for status in (Task.DONE, Task.FAILED, Task.QUEUED):
+            Task.objects.filter(pk=record.enqueue(status).pk).update(
+                status=status, finished=old)
+        self.assertEqual(tasks.purge(), 2)
+        self.assertEqual(
+            list(Task.objects.values_list('status', flat=True)),
+            [Task.QUEUED])
+
+    def test_delay(self):
+        """Отложенная задача ждёт своего времени"""
+        record.enqueue(1, delay=60)
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_retries(self):
+        """Упавшая задача повторяется с задержкой, пока есть попытки"""
+        task = fail.enqueue()
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertIn('сбой', task.error)
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertEqual(tasks.run_pending(), 0)
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        self.assertIsNotNone(task.finished)
+
+    def test_claim_is_exclusive(self):
+        """Одну задачу не захватят два воркера"""
+        for value in range(3):
+            record.enqueue(value)
+        first = tasks.claim('first', 2)
+        second = tasks.claim('second', 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+
+    def test_expired_lease(self):
+        """Задача упавшего воркера возвращается в очередь"""
+        task = record.enqueue(1)
+        tasks.claim('dead', 1)
+        self.assertEqual(tasks.release_expired(), 0)
+        Task.objects.filter(pk=task.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(tasks.release_expired(), 1)
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.DONE, 2))
+
+    def test_stats(self):
+        """Глубина очереди и задержки видны на core:stats"""
+        record.enqueue(1)
+        tasks.run_pending()
+        record.enqueue(2)
+        fail.enqueue()
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        stats = json.loads(self.client.get(STATS_URL).content)['tasks']
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['tasks']['tests.record']['queued'], 1)
+        self.assertEqual(stats['tasks']['tests.record']['done'], 1)
+        self.assertIsNotNone(stats['tasks']['tests.record']['run_p95'])
+        self.assertEqual(stats['tasks']['tests.fail']['queued'], 1)
+
+    def test_run_tasks_once(self):
+        """run_tasks --once выполняет готовые задачи и выходит"""
+        record.enqueue(1)
+        out = StringIO()
+        call_command('run_tasks', '--once', stdout=out)
+        self.assertEqual(calls, [1])
+        self.assertIn('Выполнено задач: 1', out.getvalue())
+
+    def test_password_reset_email_is_queued(self):
+        """Письмо сброса пароля уходит из очереди, а не из запроса"""
+        user = User.objects.create_user(
+            username='forgetful', email='forgetful@example.com',
+            password='secret-password')
+        form = QueuedPasswordResetForm({'email': 'forgetful@example.com'})
+        self.assertTrue(form.is_valid())
+        form.save(domain_override='testserver')
+        self.assertEqual(mail.outbox, [])
+        # Токен сброса не хранится в очереди.
+        task = Task.objects.get()
+        self.assertNotIn(default_token_generator.make_token(user),
+                         task.arguments)
+        tasks.run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['forgetful@example.com'])
+        token = re.search(r'/reset/[\w-]+/([\w-]+)/', mail.outbox[0].body)
+        self.assertTrue(default_token_generator.check_token(
+            user, token.group(1)))
+
+
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', password='old-password-1')
+        self.client.force_login(self.user)
+
+    def logged_in(self, client=None):
+        response = (client or self.client).get(FOLLOW_INDEX_URL())
+        return response.status_code == 200
+
+    def test_no_session_or_user_queries(self):
+        """Сессия и пользователь запроса читаются из кэша"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(PROFILE_URL(self.user.username))
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn(f'"auth_user"."id" = {self.user.id}', tables)
+
+    def test_cache_loss_falls_back_to_database(self):
+        """Без кэша сессия и пользователь читаются из базы"""
+        cache.clear()
+        self.assertTrue(self.logged_in())
+        self.assertIsNotNone(cache.get(auth.user_key(self.user.id)))
+
+    def test_user_change_invalidates(self):
+        """Изменённый или отключённый пользователь не берётся из кэша"""
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        response = self.client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(response.context['user'].first_name, 'Новое имя')
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.logged_in())
+
+    def test_bulk_update_expires(self):
+        """Отключение в обход сигналов видно после USER_CACHE_TIMEOUT"""
+        self.assertTrue(self.logged_in())
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        later = time.time() + settings.USER_CACHE_TIMEOUT + 1
+        with mock.patch('core.cache.time.time', return_value=later):
+            self.assertFalse(self.logged_in())
+
+    def test_password_hash_not_cached(self):
+        """В общем кэше нет хэша пароля, а сохранение пользователя из
+        кэша его не затирает"""
+        self.assertTrue(self.logged_in())
+        data = cache.get(auth.user_key(self.user.id))
+        self.assertNotIn(self.user.password, repr(data))
+        cached = auth.restore(data)
+        cached.first_name = 'Имя'
+        cached.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('old-password-1'))
+
+    def test_deleted_user(self):
+        """Удалённый пользователь разлогинивается"""
+        self.user.delete()
+        self.assertFalse(self.logged_in())
+
+    def test_password_change_and_logout(self):
+        """Смена пароля сохраняет свою сессию и закрывает чужие, выход
+        убирает сессию из кэша
+        """
+        other = Client()
+        other.force_login(self.user)
+        self.client.post(reverse('users:password_change_form'), {
+            'old_password': 'old-password-1',
+            'new_password1': 'new-password-2',
+            'new_password2': 'new-password-2',
+        })
+        self.assertTrue(self.logged_in())
+        self.assertFalse(self.logged_in(other))
+        session_key = self.client.session.session_key
+        self.assertIsNotNone(cache.get(KEY_PREFIX + session_key))
+        self.client.get(reverse('users:logout'))
+        self.assertFalse(self.logged_in())
+        self.assertIsNone(cache.get(KEY_PREFIX + session_key))
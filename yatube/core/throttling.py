@@ -0,0 +1,154 @@
+"""Ограничение частоты пишущих запросов.
+
+Каждое ограничение — корзина токенов: burst запросов подряд, дальше
+не чаще rate. Корзина хранится в кэше одним числом по алгоритму GCRA:
+моментом, когда она снова станет полной. Для области из
+THROTTLE_RATES проверяются корзины пользователя и IP-адреса; запрос
+тратит токен из всех или ни из одной. Каждая корзина меняется
+атомарным cache.update, без мягкого срока и без блокировок, а токены
+уже потраченных корзин возвращаются, если отказала следующая. При
+ошибке кэша запрос получает 429: ограничение не снимается молча.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.views import too_many_requests
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+# Retry-After, когда корзины не удалось проверить.
+ERROR_RETRY_AFTER = 1
+
+
+def parse_rate(rate):
+    """'30/h' -> секунды между токенами."""
+    count, period = rate.split('/')
+    return PERIODS[period[0]] / int(count)
+
+
+def client_ip(request):
+    """Адрес клиента с учётом THROTTLE_TRUSTED_PROXIES.
+
+    Левые части X-Forwarded-For присылает сам клиент, поэтому берётся
+    адрес, дописанный первым доверенным прокси.
+    """
+    depth = settings.THROTTLE_TRUSTED_PROXIES
+    if depth:
+        forwarded = [
+            address.strip() for address in
+            request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+            if address.strip()
+        ]
+        if len(forwarded) >= depth:
+            return forwarded[-depth]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def bucket_keys(scope, request):
+    """Ключи корзин запроса с их интервалом и ёмкостью."""
+    limits = settings.THROTTLE_RATES.get(scope)
+    if not limits:
+        return []
+    idents = {'ip': client_ip(request)}
+    if request.user.is_authenticated:
+        idents['user'] = request.user.pk
+    return [
+        (f'throttle:{scope}:{kind}:{idents[kind]}', parse_rate(rate), burst)
+        for kind, (rate, burst) in sorted(limits.items()) if kind in idents
+    ]
+
+
+def spend(key, interval, burst, now):
+    """Тратит токен из корзины одним атомарным обновлением ключа.
+
+    Возвращает 0, если токен потрачен, иначе сколько секунд ждать.
+    """
+    wait = 0
+
+    def consume(full_at):
+        nonlocal wait
+        full_at = max(now if full_at is None else full_at, now) + interval
+        wait = max(0, full_at - now - burst * interval)
+        return None if wait else full_at
+
+    # Принятый запрос не сдвигает full_at дальше now + burst * interval.
+    cache.update(key, consume, math.ceil(burst * interval) + 1)
+    return wait
+
+
+def refund(key, interval):
+    """Возвращает токен, потраченный запросом, которому отказала
+    другая корзина.
+    """
+    cache.update(
+        key, lambda full_at: None if full_at is None else full_at - interval,
+        None)
+
+
+def take(buckets, now=None):
+    """Тратит по токену из каждой корзины.
+
+    Возвращает 0, если запрос пропущен, иначе сколько секунд ждать.
+    """
+    now = time.time() if now is None else now
+    spent = []
+    for key, interval, burst in buckets:
+        wait = spend(key, interval, burst, now)
+        if wait:
+            for spent_key, spent_interval in spent:
+                refund(spent_key, spent_interval)
+            return wait
+        spent.append((key, interval))
+    return 0
+
+
+def check(scope, request):
+    """None или ответ 429 с Retry-After.
+
+    Если кэш недоступен, запрос не пропускается.
+    """
+    try:
+        wait = take(bucket_keys(scope, request))
+    except Exception:
+        logger.exception('Не удалось проверить ограничение %s', scope)
+        wait = ERROR_RETRY_AFTER
+    if wait:
+        return too_many_requests(request, math.ceil(wait))
+    return None
+
+
+class ThrottleMixin:
+    """Ограничивает частоту запросов представления.
+
+    throttle_scope — ключ THROTTLE_RATES, throttle_methods — методы,
+    которые тратят токены.
+    """
+    throttle_scope: str = ''
+    throttle_methods: tuple = ('POST',)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.throttle_methods:
+            response = check(self.throttle_scope, request)
+            if response is not None:
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+def throttle(scope, methods=('POST',)):
+    """То же для функций-представлений."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                response = check(scope, request)
+                if response is not None:
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
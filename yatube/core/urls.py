@@ -0,0 +1,9 @@
+from django.urls import path
+
+from core import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('stats/', views.request_stats, name='stats'),
+]
@@ -1,5 +1,9 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from core import instrumentation, tasks
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +19,22 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def too_many_requests(request, retry_after):
+    response = render(request, 'core/429.html',
+                      {'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+@staff_member_required
+def request_stats(request):
+    """Скользящие гистограммы замеров по имени URL и состояние очереди
+    задач (только персонал).
+    """
+    return JsonResponse({
+        'window': instrumentation.request_stats.window,
+        'views': instrumentation.request_stats.snapshot(),
+        'tasks': tasks.stats(),
+    }, json_dumps_params={'ensure_ascii': False})
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from core.models import Task
+from posts import tasks
 from posts.models import Post, Group, Follow, Comment
 
 
@@ -15,6 +17,18 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    actions = ('build_thumbnails',)
+
+    def build_thumbnails(self, request, queryset):
+        posts = queryset.exclude(image='').exclude(image__isnull=True)
+        queued = sum(
+            tasks.schedule_thumbnails(post, requeue=True).status
+            == Task.QUEUED
+            for post in posts
+        )
+        self.message_user(
+            request, f'Миниатюры в очереди: {queued} из {len(posts)}')
+    build_thumbnails.short_description = 'Построить миниатюры в фоне'
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -36,6 +50,15 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ('user', 'author')
     list_filter = ('author',)
     empty_value_display = '-пусто-'
+    actions = ('rebuild_timelines',)
+
+    def rebuild_timelines(self, request, queryset):
+        user_ids = sorted(set(queryset.values_list('user_id', flat=True)))
+        tasks.rebuild_timelines.enqueue(user_ids)
+        self.message_user(
+            request, f'Ленты читателей в очереди на пересборку: '
+                     f'{len(user_ids)}')
+    rebuild_timelines.short_description = 'Пересобрать ленты читателей в фоне'
 
 
 admin.site.register(Post, PostAdmin)
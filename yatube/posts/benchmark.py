@@ -0,0 +1,448 @@
+"""Воспроизводимый замер производительности страниц posts.
+
+Набор данных строится по зерну seed через mixer и Faker, затем каждый
+маршрут из posts/urls.py и JSON API прогоняется тестовым клиентом.
+Для каждого сценария считаются p50/p95/p99 времени ответа, число
+SQL-запросов и пиковая память. Результат сохраняется в JSON, два
+прогона сравниваются функцией compare. Функция load нагружает те же
+страницы параллельными клиентами через WSGI и ASGI.
+"""
+import asyncio
+import os
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from mixer.backend.django import Mixer
+
+from core.asgi import WsgiToAsgi
+from posts import counters, search, timeline, trending
+from posts.models import Comment, Follow, Group, Post
+from posts.utils import encode_cursor
+
+User = get_user_model()
+
+DATASET = {
+    'users': 200,
+    'groups': 10,
+    'posts': 5000,
+    'comments': 10000,
+    'follows': 3000,
+}
+BATCH_SIZE = 500
+METRICS = ('p50', 'p95', 'p99', 'queries', 'peak_kb')
+# Читающие сценарии для нагрузки параллельными клиентами.
+LOAD_SCENARIOS = ('index', 'group_list', 'profile_auth',
+                  'post_detail_auth', 'follow_index')
+LOAD_LEVELS = (1, 8, 32)
+
+
+def isolated_caches(directory):
+    """Настройки CACHES с хранилищами в directory.
+
+    Замер очищает кэш и пишет в него сессии, пользователей и журнал
+    графа подписок, поэтому не должен трогать общий кэш сайта.
+    """
+    caches = {}
+    for alias, params in settings.CACHES.items():
+        caches[alias] = dict(
+            params, LOCATION=os.path.join(directory, f'{alias}.sqlite3'))
+    return caches
+
+
+def seed(seed=0, users=DATASET['users'], groups=DATASET['groups'],
+         posts=DATASET['posts'], comments=DATASET['comments'],
+         follows=DATASET['follows']):
+    """Заполняет пустую базу набором данных заданного размера.
+
+    Посты, комментарии и подписки пишутся через bulk_create мимо
+    сигналов, поэтому счётчики, ленты и поисковый индекс потом
+    пересобираются целиком. Возвращает объекты, по которым строятся
+    сценарии.
+    """
+    rng = random.Random(seed)
+    mixer = Mixer(locale='ru_RU', silence=True)
+    mixer.faker.seed_instance(seed)
+    fake = mixer.faker
+
+    authors = mixer.cycle(users).blend(
+        User, username=mixer.sequence('bench{0}'))
+    group_list = mixer.cycle(groups).blend(
+        Group,
+        slug=mixer.sequence('bench-group-{0}'),
+        title=lambda: fake.sentence(nb_words=3)[:200],
+        description=lambda: fake.paragraph(),
+    )
+
+    Post.objects.bulk_create(
+        (Post(text=fake.paragraph(nb_sentences=5),
+              author=rng.choice(authors),
+              group=rng.choice(group_list) if rng.random() < 0.7 else None)
+         for _ in range(posts)),
+        batch_size=BATCH_SIZE,
+    )
+    # auto_now_add ставит всем постам одну дату: разносим их на час
+    # друг от друга, чтобы ленты и курсоры работали на разбросе дат.
+    now = timezone.now()
+    post_list = list(Post.objects.order_by('id').only('id'))
+    for position, post in enumerate(post_list):
+        post.pub_date = now - timedelta(
+            minutes=(len(post_list) - position) * 60)
+    Post.objects.bulk_update(post_list, ['pub_date'], batch_size=BATCH_SIZE)
+
+    Comment.objects.bulk_create(
+        (Comment(post=rng.choice(post_list), author=rng.choice(authors),
+                 text=fake.sentence())
+         for _ in range(comments)),
+        batch_size=BATCH_SIZE,
+    )
+
+    edges = set()
+    limit = min(follows, users * (users - 1))
+    while len(edges) < limit:
+        user, author = rng.sample(authors, 2)
+        edges.add((user.id, author.id))
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in sorted(edges)),
+        batch_size=BATCH_SIZE,
+    )
+
+    counters.recount()
+    for user_id in {user_id for user_id, _ in edges}:
+        timeline.rebuild(user_id)
+    search.get_backend().rebuild()
+    trending.recompute()
+    cache.clear()
+
+    reader = max(authors, key=lambda user: sum(
+        1 for user_id, _ in edges if user_id == user.id))
+    post = (Post.objects.filter(group__isnull=False)
+            .order_by('-comments_count', 'id').first())
+    return {
+        'reader': reader,
+        'post': post,
+        'group': post.group,
+        'author': post.author,
+        'stranger': next(user for user in authors
+                         if user.id not in (reader.id, post.author_id)),
+        'query': fake.word(),
+    }
+
+
+def deep_cursor(queryset, depth):
+    """Курсор ?after= на страницу, до которой depth записей."""
+    post = queryset.order_by('-pub_date', '-id')[depth:depth + 1].first()
+    return encode_cursor([post.pub_date, post.id]) if post else ''
+
+
+def scenarios(data):
+    """Сценарии: (имя, пользователь, метод, адрес, данные POST).
+
+    Пользователь — ключ из data или None для анонимного читателя.
+    Пишущие сценарии не удаляют объекты, на которые ссылаются
+    остальные.
+    """
+    post, group, author = data['post'], data['group'], data['author']
+    stranger = data['stranger'].username
+    depth = Post.objects.count() * 4 // 5
+    return [
+        ('index', None, 'get', reverse('posts:index'), None),
+        ('index_deep_cursor', None, 'get', reverse('posts:index') + '?after='
+         + deep_cursor(Post.objects.all(), depth), None),
+        ('index_deep_page', None, 'get', reverse('posts:index')
+         + f'?page={depth // 10}', None),
+        ('index_auth', 'reader', 'get', reverse('posts:index'), None),
+        ('group_list', 'reader', 'get',
+         reverse('posts:group_list', args=[group.slug]), None),
+        ('profile', None, 'get',
+         reverse('posts:profile', args=[author.username]), None),
+        ('profile_auth', 'reader', 'get',
+         reverse('posts:profile', args=[author.username]), None),
+        ('post_detail', None, 'get',
+         reverse('posts:post_detail', args=[post.id]), None),
+        ('post_detail_auth', 'reader', 'get',
+         reverse('posts:post_detail', args=[post.id]), None),
+        ('post_comments', None, 'get',
+         reverse('posts:post_comments', args=[post.id]), None),
+        ('post_create_form', 'author', 'get',
+         reverse('posts:post_create'), None),
+        ('post_create', 'author', 'post', reverse('posts:post_create'),
+         {'text': 'Замер создания поста', 'group': group.id}),
+        ('post_edit_form', 'author', 'get',
+         reverse('posts:post_edit', args=[post.id]), None),
+        ('post_edit', 'author', 'post',
+         reverse('posts:post_edit', args=[post.id]),
+         {'text': post.text, 'group': group.id}),
+        ('post_delete_form', 'author', 'get',
+         reverse('posts:post_delete', args=[post.id]), None),
+        ('add_comment', 'reader', 'post',
+         reverse('posts:add_comment', args=[post.id]),
+         {'text': 'Замер комментария'}),
+        ('follow_index', 'reader', 'get', reverse('posts:follow_index'),
+         None),
+        ('search', None, 'get',
+         reverse('posts:search') + f'?q={data["query"]}', None),
+        ('trending', None, 'get', reverse('posts:trending'), None),
+        ('group_trending', None, 'get',
+         reverse('posts:group_trending', args=[group.slug]), None),
+        ('api_index', None, 'get', reverse('api:v1:index'), None),
+        ('api_index_sparse', None, 'get',
+         reverse('api:v1:index') + '?fields=id,author&limit=100', None),
+        ('api_group_list', None, 'get',
+         reverse('api:v1:group_list', args=[group.slug]), None),
+        ('api_profile', None, 'get',
+         reverse('api:v1:profile', args=[author.username]), None),
+        ('api_follow_index', 'reader', 'get',
+         reverse('api:v1:follow_index'), None),
+        ('api_post_detail', None, 'get',
+         reverse('api:v1:post_detail', args=[post.id]), None),
+        ('api_post_comments', None, 'get',
+         reverse('api:v1:post_comments', args=[post.id]), None),
+        ('profile_follow', 'reader', 'get',
+         reverse('posts:profile_follow', args=[stranger]), None),
+        ('profile_unfollow', 'reader', 'get',
+         reverse('posts:profile_unfollow', args=[stranger]), None),
+    ]
+
+
+def percentile(samples, share):
+    """Перцентиль с линейной интерполяцией между соседними замерами."""
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * share
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (
+        position - lower)
+
+
+def measure(client, method, url, payload, iterations, warmup, cold):
+    """Замеряет один сценарий.
+
+    Время снимается без tracemalloc, пиковая память — отдельным
+    прогоном, чтобы трассировка не искажала задержки. cold=True
+    очищает кэш перед каждым запросом.
+    """
+    request = getattr(client, method)
+
+    def call():
+        if cold:
+            cache.clear()
+        return request(url, payload) if payload else request(url)
+
+    for _ in range(warmup):
+        call()
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = call()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'iterations': iterations,
+        'p50': round(percentile(timings, 0.50), 3),
+        'p95': round(percentile(timings, 0.95), 3),
+        'p99': round(percentile(timings, 0.99), 3),
+        'mean': round(statistics.mean(timings), 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(data, iterations=50, warmup=5, cold=False, only=None):
+    """Прогоняет сценарии и возвращает отчёт, готовый к json.dump."""
+    clients = {None: Client()}
+    for name in ('reader', 'author'):
+        clients[name] = Client()
+        clients[name].force_login(data[name])
+    results = {}
+    for name, user, method, url, payload in scenarios(data):
+        if only and name not in only:
+            continue
+        results[name] = dict(
+            measure(clients[user], method, url, payload,
+                    iterations, warmup, cold),
+            url=url,
+        )
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'warmup': warmup,
+            'cold': cold,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.1, noise_ms=0.5):
+    """Сравнивает два отчёта.
+
+    Возвращает строки (сценарий, метрика, было, стало, изменение,
+    регрессия). Регрессия — рост времени или памяти больше чем на
+    threshold или любой рост числа запросов. Рост времени меньше
+    noise_ms миллисекунд считается шумом.
+    """
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            if metric == 'queries':
+                regression = new > old
+            elif metric.startswith('p') and new - old < noise_ms:
+                regression = False
+            else:
+                regression = change > threshold
+            rows.append((name, metric, old, new, change, regression))
+    return rows
+
+
+def session_cookie(user):
+    if user is None:
+        return ''
+    client = Client()
+    client.force_login(user)
+    return '; '.join(f'{name}={morsel.value}'
+                     for name, morsel in client.cookies.items())
+
+
+def split_url(url):
+    path, _, query = url.partition('?')
+    return path, query
+
+
+def drive_wsgi(application, url, cookie, requests, level):
+    """level потоков, как у многопоточного WSGI-сервера."""
+    path, query = split_url(url)
+
+    def call():
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query,
+                   'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+                   'wsgi.input': BytesIO()}
+        setup_testing_defaults(environ)
+        started = time.perf_counter()
+        status = []
+        result = application(
+            environ, lambda code, headers, exc_info=None: status.append(code))
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return (time.perf_counter() - started) * 1000, status[0]
+
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        return list(pool.map(lambda _: call(), range(requests)))
+
+
+def drive_asgi(application, url, cookie, requests, level):
+    """level одновременных соединений к ASGI-приложению."""
+    path, query = split_url(url)
+    headers = [(b'host', b'testserver')]
+    if cookie:
+        headers.append((b'cookie', cookie.encode()))
+
+    async def call():
+        scope = {'type': 'http', 'method': 'GET', 'path': path,
+                 'query_string': query.encode(), 'headers': headers}
+        status = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return (time.perf_counter() - started) * 1000, str(status[0])
+
+    async def main():
+        gate = asyncio.Semaphore(level)
+
+        async def limited():
+            async with gate:
+                return await call()
+        return await asyncio.gather(*(limited() for _ in range(requests)))
+
+    return asyncio.run(main())
+
+
+def load(data, levels=LOAD_LEVELS, requests=200, only=None):
+    """Нагружает страницы параллельными клиентами.
+
+    Каждый сценарий гоняется через WSGI (поток на клиента) и через
+    yatube.asgi, с одновременными независимыми запросами внутри
+    страницы и без них. Возвращает строки отчёта с пропускной
+    способностью и перцентилями задержки.
+    """
+    wsgi = get_wsgi_application()
+    servers = {
+        'wsgi': (wsgi, drive_wsgi),
+        'asgi': (WsgiToAsgi(wsgi, threads=max(levels)), drive_asgi),
+    }
+    cookies = {user: session_cookie(data.get(user))
+               for user in (None, 'reader', 'author')}
+    rows = []
+    for name, user, method, url, _ in scenarios(data):
+        if name not in (only or LOAD_SCENARIOS):
+            continue
+        for level in levels:
+            for server, (application, drive) in servers.items():
+                for lookups, workers in (('parallel', None), ('serial', 0)):
+                    changed = ({} if workers is None else
+                               {'CONCURRENT_LOOKUP_WORKERS': workers})
+                    with override_settings(**changed):
+                        drive(application, url, cookies[user],
+                              min(requests, level * 2), level)
+                        started = time.perf_counter()
+                        results = drive(application, url, cookies[user],
+                                        requests, level)
+                        elapsed = time.perf_counter() - started
+                    timings = [timing for timing, _ in results]
+                    rows.append({
+                        'scenario': name,
+                        'server': server,
+                        'lookups': lookups,
+                        'concurrency': level,
+                        'status': results[-1][1].split(' ')[0],
+                        'rps': round(requests / elapsed, 1),
+                        'p50': round(percentile(timings, 0.50), 3),
+                        'p95': round(percentile(timings, 0.95), 3),
+                    })
+    return rows
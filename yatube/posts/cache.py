@@ -0,0 +1,227 @@
+"""Поколения (generation keys) для кэша фрагментов и страниц.
+
+У каждой области — главной ленты, ленты группы, профиля, поста — есть
+номер поколения в кэше. Он входит в ключ закэшированного фрагмента или
+страницы и увеличивается сигналами при изменении постов, комментариев,
+групп и пользователей, поэтому кэш живёт долго и устаревает ровно
+тогда, когда меняется его содержимое.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+INDEX = 'index'
+# Метка страницы, которую нельзя кэшировать, и сколько она живёт.
+UNCACHEABLE = 'uncacheable'
+UNCACHEABLE_TIMEOUT = 10
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def profile_scope(user_id):
+    return f'profile:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def post_detail_scopes(post_id, author_id, group_id):
+    """Страница поста зависит от самого поста, автора и группы."""
+    scopes = [post_scope(post_id), profile_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def generation_key(scope):
+    return f'generation:{scope}'
+
+
+def initial_generation():
+    """Начальное поколение растёт со временем, поэтому после вытеснения
+    ключа из кэша номер не повторит уже выданный.
+    """
+    return time.time_ns()
+
+
+def generation_time(generation):
+    """Поколение — время последнего изменения области в наносекундах,
+    в секундах оно идёт в Last-Modified.
+    """
+    return generation // 10 ** 9
+
+
+def get_generations(*scopes):
+    keys = {generation_key(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    missing = {key: initial_generation()
+               for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {keys[key]: value for key, value in found.items()}
+
+
+def get_generation(scope):
+    return get_generations(scope)[scope]
+
+
+def bump(*scopes):
+    """Делает устаревшими все фрагменты перечисленных областей.
+
+    Новое поколение — текущее время, но не меньше прежнего + 1, поэтому
+    номер только растёт, даже если часы отстают.
+    """
+    for scope in set(scopes):
+        cache.update(
+            generation_key(scope),
+            lambda generation: max((generation or 0) + 1,
+                                   initial_generation()),
+            None)
+
+
+def fragment_context(scope):
+    """Контекст для тега {% cache %} в шаблонах лент."""
+    return {
+        'feed_version': get_generation(scope),
+        'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    }
+
+
+class FragmentCacheMixin:
+    """Добавляет в контекст поколение области, которую показывает
+    страница.
+    """
+
+    def get_fragment_scope(self, context):
+        return INDEX
+
+    def render_to_response(self, context, **response_kwargs):
+        context.update(fragment_context(self.get_fragment_scope(context)))
+        return super().render_to_response(context, **response_kwargs)
+
+
+def lookup(name, value, queryset, *fields):
+    """Кэширует поиск строки по значению из URL (slug, username, id).
+
+    Возвращает значения fields или None, если строки нет. Устаревшее
+    значение безопасно: после отрисовки страница сверяет области
+    с настоящими объектами и при расхождении не попадает в кэш.
+    """
+    key = 'lookup:{}:{}'.format(
+        name, hashlib.md5(str(value).encode()).hexdigest())
+    found = cache.get(key)
+    if found is None:
+        found = queryset.values_list(*fields).first()
+        if found is None:
+            return None
+        cache.set(key, found, settings.PAGE_CACHE_TIMEOUT)
+    return found
+
+
+def forget(name, value):
+    cache.delete('lookup:{}:{}'.format(
+        name, hashlib.md5(str(value).encode()).hexdigest()))
+
+
+def page_cache_key(request, generations, params):
+    query = '&'.join(
+        f'{name}={request.GET[name]}' for name in params
+        if name in request.GET
+    )
+    raw = '|'.join([
+        request.path,
+        query,
+        *(f'{scope}={generation}' for scope, generation in generations),
+    ])
+    return 'page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+class AnonymousPageCacheMixin:
+    """Отдаёт анонимным читателям страницу целиком из кэша.
+
+    Ключ страницы — путь, параметры пагинации и поколения её областей.
+    В ответ добавляются ETag и Last-Modified — время самого нового из
+    этих поколений, поэтому удаление поста не сдвигает его назад. По
+    If-None-Match и If-Modified-Since страница отвечает 304 без
+    отрисовки. Если страницу кэшировать нельзя, на UNCACHEABLE_TIMEOUT
+    вместо неё кладётся UNCACHEABLE: другие запросы отрисуют её сами,
+    а не будут ждать в кэше.
+    """
+    page_cache_params = ('after', 'before', 'page')
+
+    def get_page_scopes(self):
+        """Области страницы по параметрам URL или None, если объекта нет.
+        """
+        return [INDEX]
+
+    def get_rendered_scopes(self, context):
+        """Области страницы по объектам, которые попали в контекст."""
+        return [INDEX]
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated):
+            return super().dispatch(request, *args, **kwargs)
+        scopes = self.get_page_scopes()
+        if scopes is None:
+            return super().dispatch(request, *args, **kwargs)
+        generations = get_generations(*scopes)
+        key = page_cache_key(
+            request, [(scope, generations[scope]) for scope in scopes],
+            self.page_cache_params)
+        rendered = {}
+
+        def render():
+            response = rendered['response'] = super(
+                AnonymousPageCacheMixin, self).dispatch(
+                    request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(
+                    response, 'render'):
+                cache.set(key, UNCACHEABLE, UNCACHEABLE_TIMEOUT)
+                return None
+            response.render()
+            entry = rendered['entry'] = {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': '"{}"'.format(
+                    hashlib.md5(response.content).hexdigest()),
+                'last_modified': generation_time(max(generations.values())),
+            }
+            if self.get_rendered_scopes(response.context_data) == scopes:
+                return entry
+            cache.set(key, UNCACHEABLE, UNCACHEABLE_TIMEOUT)
+            return None
+
+        # Пропавшую страницу отрисовывает один запрос, остальные ждут
+        # её в кэше.
+        entry = cache.get_or_set(key, render, settings.PAGE_CACHE_TIMEOUT)
+        response = rendered.get('response')
+        if entry == UNCACHEABLE:
+            if response is None:
+                return super().dispatch(request, *args, **kwargs)
+            entry = None
+        if entry is None:
+            entry = rendered.get('entry')
+            if entry is None:
+                return response
+        if response is None:
+            response = HttpResponse(
+                entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        if entry['last_modified']:
+            response['Last-Modified'] = http_date(entry['last_modified'])
+        return get_conditional_response(
+            request,
+            etag=entry['etag'],
+            last_modified=entry['last_modified'],
+            response=response,
+        )
@@ -0,0 +1,46 @@
+"""Кэш отрисованных карточек постов.
+
+Ключ карточки — вид, id, версия и время изменения поста. Версия
+растёт при правке поста, готовности его миниатюры, переименовании
+группы и смене имени автора, поэтому старые карточки просто перестают
+читаться и вытесняются по таймауту. Страница ленты достаёт все свои карточки
+одним get_many и отрисовывает только недостающие.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+TEMPLATES = {
+    # Карточка с автором: главная, группа, подписки, поиск.
+    'article': 'includes/article.html',
+    # Карточка без автора: профиль.
+    'post': 'posts/includes/one_post.html',
+}
+
+
+def card_key(kind, post):
+    # Время изменения отличает новый пост от удалённого с тем же id.
+    modified = int(post.modified.timestamp() * 1_000_000)
+    return f'card:{kind}:{post.id}:{post.version}:{modified}'
+
+
+def render(posts, kind):
+    """HTML карточек постов в том же порядке."""
+    posts = list(posts)
+    keys = [card_key(kind, post) for post in posts]
+    found = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in found:
+            missing[key] = found[key] = render_to_string(
+                TEMPLATES[kind], {'post': post})
+    if missing:
+        cache.set_many(missing, settings.CARD_CACHE_TIMEOUT)
+    return [found[key] for key in keys]
+
+
+def touch(queryset):
+    """Поднимает версию постов, чьи карточки устарели без их правки."""
+    return queryset.update(version=F('version') + 1, modified=timezone.now())
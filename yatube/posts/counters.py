@@ -0,0 +1,56 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарным UPDATE ... SET n = n + 1 при создании и
+удалении строк, поэтому показ любого числа на странице не требует
+COUNT(*). Счётчик не уходит ниже нуля, расхождения чинит команда
+recount_counters.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+def shifted(field, delta):
+    """n + delta, но не меньше нуля: разошедшийся счётчик не должен
+    ронять удаление нарушением CHECK (n >= 0).
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def bump_user(user_id, field, delta):
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: shifted(field, delta)})
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta))
+
+
+def count_of(model, field, outer='pk'):
+    """Подзапрос с числом строк model, у которых field равно outer."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def recount():
+    """Пересчитывает все счётчики с нуля."""
+    existing = UserStats.objects.values('user_id')
+    UserStats.objects.bulk_create(
+        UserStats(user_id=user_id)
+        for user_id in User.objects.exclude(pk__in=existing)
+        .values_list('pk', flat=True)
+    )
+    UserStats.objects.update(
+        posts_count=count_of(Post, 'author', 'user_id'),
+        followers_count=count_of(Follow, 'author', 'user_id'),
+        following_count=count_of(Follow, 'user', 'user_id'),
+    )
+    Post.objects.update(comments_count=count_of(Comment, 'post'))
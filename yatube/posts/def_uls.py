@@ -21,6 +21,10 @@ def POST_EDIT_URL(POST_ID):
     return reverse('posts:post_edit', kwargs={'post_id': POST_ID})
 
 
+def POST_DELETE_URL(POST_ID):
+    return reverse('posts:post_delete', kwargs={'post_id': POST_ID})
+
+
 def POST_CREATE_URL():
     return reverse('posts:post_create')
 
@@ -37,6 +41,10 @@ def COMMENT_URL(POST_ID):
     return reverse('posts:add_comment', kwargs={'post_id': POST_ID})
 
 
+def POST_COMMENTS_URL(POST_ID):
+    return reverse('posts:post_comments', kwargs={'post_id': POST_ID})
+
+
 def FOLLOW_INDEX_URL():
     return reverse('posts:follow_index')
 
@@ -47,3 +55,15 @@ def FOLLOW_URL(USER_NAME):
 
 def UNFOLLOW_URL(USER_NAME):
     return reverse('posts:profile_unfollow', kwargs={'username': USER_NAME})
+
+
+def SEARCH_URL():
+    return reverse('posts:search')
+
+
+def TRENDING_URL():
+    return reverse('posts:trending')
+
+
+def GROUP_TRENDING_URL(GROUP_SLUG):
+    return reverse('posts:group_trending', kwargs={'slug': GROUP_SLUG})
@@ -1,6 +1,10 @@
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
-from posts.models import Post, Comment
+from posts import images
+from posts.models import Post, Comment, Group
 
 
 class PostForm(ModelForm):
@@ -12,6 +16,21 @@ class PostForm(ModelForm):
                       'image': 'Добавьте изображение'}
         fields = ['group', 'text', 'image']
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        if image.size > settings.POST_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                'Файл больше {} МБ'.format(
+                    settings.POST_IMAGE_MAX_BYTES // (1024 * 1024)))
+        try:
+            # forms.ImageField уже прочитал заголовок картинки в image.image.
+            images.check(image.image)
+        except images.ImageError as error:
+            raise forms.ValidationError(str(error))
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -19,3 +38,13 @@ class CommentForm(ModelForm):
         labels = {'text': 'Добавить комментарий'}
         help_texts = {'text': 'Текст комментария'}
         fields = ['text']
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label='Поиск', max_length=200)
+    group = forms.ModelChoiceField(
+        label='Группа',
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False)
+    author = forms.CharField(label='Автор', max_length=150, required=False)
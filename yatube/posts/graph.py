@@ -0,0 +1,287 @@
+"""Граф подписок в памяти процесса.
+
+Подписки и подписчики хранятся списками смежности в формате CSR: все
+соседи подряд в одном array('i'), а offsets[v]:offsets[v + 1] —
+отрезок вершины v, отсортированный по id. Миллион рёбер занимает
+около 4 МБ, соседи вершины читаются без копирования, пересечение —
+двоичным поиском по большему отрезку.
+
+Граф загружается из Follow при первом обращении. Подписка и отписка
+(сигналы Follow) сразу правят граф своего процесса и пишут изменение в
+журнал в общем кэше; остальные процессы раз в
+FOLLOW_GRAPH_SYNC_INTERVAL секунд дочитывают журнал, а отстав больше
+чем на FOLLOW_GRAPH_JOURNAL_LENGTH изменений, загружают граф заново.
+Изменённые вершины хранятся отдельными массивами, пока их не станет
+больше COMPACT_AFTER, тогда CSR собирается заново. offsets, targets и
+изменённые вершины лежат в одном неизменяемом снимке CSR: запись
+подменяет ссылку на снимок целиком, а читатель берёт его один раз,
+поэтому не смешает массивы до и после пересборки. Запись журнала,
+которой нет и через FOLLOW_GRAPH_SYNC_INTERVAL (писатель упал или
+запись вытеснена), считается потерянной: граф загружается заново.
+"""
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from posts.models import Follow, User
+
+VERSION_KEY = 'follow_graph:version'
+COMPACT_AFTER = 10_000
+
+
+def change_key(number):
+    return f'follow_graph:change:{number}'
+
+
+# Снимок списков смежности; patched — {вершина: array} изменённых.
+CSR = namedtuple('CSR', 'offsets targets patched')
+
+
+class Adjacency:
+    """Отсортированные списки соседей всех вершин."""
+
+    def __init__(self, pairs=()):
+        """pairs — (вершина, сосед), отсортированные по обоим полям."""
+        offsets = array('q', [0])
+        targets = array('i')
+        for source, target in pairs:
+            while len(offsets) <= source:
+                offsets.append(len(targets))
+            targets.append(target)
+        offsets.append(len(targets))
+        self.snapshot = CSR(offsets, targets, {})
+
+    @property
+    def patched(self):
+        return self.snapshot.patched
+
+    def row(self, vertex):
+        """(массив, начало, конец) соседей вершины."""
+        snapshot = self.snapshot
+        patched = snapshot.patched.get(vertex)
+        if patched is not None:
+            return patched, 0, len(patched)
+        offsets = snapshot.offsets
+        if vertex + 1 < len(offsets):
+            return snapshot.targets, offsets[vertex], offsets[vertex + 1]
+        return snapshot.targets, 0, 0
+
+    def neighbours(self, vertex):
+        values, start, end = self.row(vertex)
+        return values[start:end]
+
+    def degree(self, vertex):
+        _, start, end = self.row(vertex)
+        return end - start
+
+    def has(self, vertex, neighbour):
+        values, start, end = self.row(vertex)
+        index = bisect_left(values, neighbour, start, end)
+        return index < end and values[index] == neighbour
+
+    def add(self, vertex, neighbour):
+        values, start, end = self.row(vertex)
+        index = bisect_left(values, neighbour, start, end)
+        if index < end and values[index] == neighbour:
+            return
+        # Новый массив вместо правки на месте: читатели в других
+        # потоках видят либо старый список, либо новый.
+        row = values[start:index]
+        row.append(neighbour)
+        row.extend(values[index:end])
+        self.patch(vertex, row)
+
+    def remove(self, vertex, neighbour):
+        values, start, end = self.row(vertex)
+        index = bisect_left(values, neighbour, start, end)
+        if index == end or values[index] != neighbour:
+            return
+        row = values[start:index]
+        row.extend(values[index + 1:end])
+        self.patch(vertex, row)
+
+    def patch(self, vertex, row):
+        snapshot = self.snapshot
+        patched = dict(snapshot.patched)
+        patched[vertex] = row
+        self.snapshot = snapshot._replace(patched=patched)
+        if len(patched) > COMPACT_AFTER:
+            self.compact()
+
+    def compact(self):
+        """Собирает CSR заново вместе с изменёнными вершинами."""
+        snapshot = self.snapshot
+        vertices = max(len(snapshot.offsets) - 1,
+                       max(snapshot.patched, default=-1) + 1)
+        self.snapshot = Adjacency(
+            (vertex, neighbour)
+            for vertex in range(vertices)
+            for neighbour in self.neighbours(vertex)
+        ).snapshot
+
+
+def intersect(first, second):
+    """Общие элементы двух отрезков (массив, начало, конец) по
+    возрастанию.
+    """
+    if first[2] - first[1] > second[2] - second[1]:
+        first, second = second, first
+    values, start, end = first
+    other, low, high = second
+    common = []
+    for index in range(start, end):
+        value = values[index]
+        low = bisect_left(other, value, low, high)
+        if low == high:
+            break
+        if other[low] == value:
+            common.append(value)
+    return common
+
+
+class FollowGraph:
+    def __init__(self):
+        self.following = None
+        self.followers = None
+        self.version = 0
+        self.checked = 0
+        # Номер записи журнала, которой не было при прошлой сверке.
+        self.gap = None
+        self.lock = threading.RLock()
+
+    def load(self):
+        # Номер журнала читается до рёбер: изменения, которые попадут и
+        # в загрузку, и в журнал, применятся повторно без вреда.
+        cache.add(VERSION_KEY, 0, None)
+        version = cache.get(VERSION_KEY, 0)
+        follows = Follow.objects.using(DEFAULT_DB_ALIAS)
+        following = Adjacency(
+            follows.order_by('user_id', 'author_id')
+            .values_list('user_id', 'author_id').iterator())
+        followers = Adjacency(
+            follows.order_by('author_id', 'user_id')
+            .values_list('author_id', 'user_id').iterator())
+        with self.lock:
+            self.following, self.followers = following, followers
+            self.version = version
+            self.checked = time.monotonic()
+            self.gap = None
+
+    def reset(self):
+        with self.lock:
+            self.following = self.followers = None
+
+    def apply(self, followed, user_id, author_id):
+        with self.lock:
+            if self.following is None:
+                return
+            if followed:
+                self.following.add(user_id, author_id)
+                self.followers.add(author_id, user_id)
+            else:
+                self.following.remove(user_id, author_id)
+                self.followers.remove(author_id, user_id)
+
+    def sync(self):
+        """Дочитывает журнал изменений других процессов."""
+        if time.monotonic() - self.checked < (
+                settings.FOLLOW_GRAPH_SYNC_INTERVAL):
+            return
+        with self.lock:
+            self.checked = time.monotonic()
+            version = cache.get(VERSION_KEY)
+            if version == self.version:
+                return
+            # Журнал пропал из кэша или ушёл слишком далеко вперёд.
+            if version is None or not 0 < version - self.version <= (
+                    settings.FOLLOW_GRAPH_JOURNAL_LENGTH):
+                self.load()
+                return
+            numbers = range(self.version + 1, version + 1)
+            changes = cache.get_many([change_key(n) for n in numbers])
+            for number in numbers:
+                change = changes.get(change_key(number))
+                if change is None:
+                    # Запись могла ещё не дописаться: ждём её до
+                    # следующей сверки, потом загружаем граф заново.
+                    if self.gap == number:
+                        self.load()
+                    else:
+                        self.gap = number
+                    return
+                self.apply(*change)
+                self.version = number
+            self.gap = None
+
+    def ready(self):
+        if self.following is None:
+            with self.lock:
+                if self.following is None:
+                    self.load()
+        else:
+            self.sync()
+        return self
+
+    def changed(self, followed, user_id, author_id):
+        """Подписка или отписка в этом процессе."""
+        self.apply(followed, user_id, author_id)
+        try:
+            number = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 0, None)
+            number = cache.incr(VERSION_KEY)
+        cache.set(change_key(number), (followed, user_id, author_id),
+                  settings.FOLLOW_GRAPH_JOURNAL_TIMEOUT)
+
+    def followers_you_know(self, viewer_id, author_id):
+        """Подписчики автора, на которых подписан читатель."""
+        self.ready()
+        return intersect(self.following.row(viewer_id),
+                         self.followers.row(author_id))
+
+    def suggestions(self, user_id, limit=None):
+        """Кого читают те, кого читает пользователь: [(id, сколько
+        из его подписок читают этого автора)] по убыванию.
+        """
+        self.ready()
+        fanout = settings.FOLLOW_SUGGESTION_FANOUT
+        following = self.following
+        friends = following.neighbours(user_id)
+        if len(friends) > fanout:
+            friends = random.sample(list(friends), fanout)
+        counts = Counter()
+        for friend in friends:
+            values, start, end = following.row(friend)
+            counts.update(values[start:min(end, start + fanout)])
+        return [
+            (author_id, count) for author_id, count in counts.most_common()
+            if author_id != user_id and not following.has(user_id, author_id)
+        ][:limit or settings.FOLLOW_SUGGESTIONS]
+
+
+graph = FollowGraph()
+
+
+def profile_context(user, author):
+    """Подписчики автора, которых знает читатель, и кого ему почитать
+    для страницы профиля. Пользователи грузятся одним запросом.
+    """
+    known = []
+    if user.id != author.id:
+        known = graph.followers_you_know(user.id, author.id)
+    suggested = [author_id for author_id, _ in graph.suggestions(user.id)]
+    shown = known[:settings.KNOWN_FOLLOWERS_SHOWN]
+    users = User.objects.in_bulk(shown + suggested) if (
+        shown or suggested) else {}
+    return {
+        'known_followers': [users[pk] for pk in shown if pk in users],
+        'known_followers_more': len(known) - len(shown),
+        'suggested_authors': [users[pk] for pk in suggested if pk in users],
+    }
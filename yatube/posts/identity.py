@@ -0,0 +1,36 @@
+"""Карта идентичности на время одного запроса.
+
+Объект, загруженный представлением по slug, username или pk,
+запоминается в request, и повторный поиск в том же запросе (из
+get_queryset, get_context_data, dispatch) берёт его из памяти, а не
+из базы.
+"""
+from django.shortcuts import get_object_or_404
+
+
+def identity_map(request):
+    """Словари запроса: объекты по (модель, pk) и pk по условию поиска."""
+    return request.__dict__.setdefault('_identity_map', ({}, {}))
+
+
+def get_object_once(request, queryset, **lookup):
+    """get_object_or_404, который в пределах запроса грузит объект один
+    раз. Один и тот же объект стоит всегда искать одним queryset, иначе
+    select_related второго поиска не сработает.
+    """
+    objects, lookups = identity_map(request)
+    label = queryset.model._meta.label
+    key = (label, tuple(sorted(lookup.items())))
+    if key in lookups:
+        return objects[(label, lookups[key])]
+    obj = get_object_or_404(queryset, **lookup)
+    objects.setdefault((label, obj.pk), obj)
+    lookups[key] = lookups[(label, (('pk', obj.pk),))] = obj.pk
+    return objects[(label, obj.pk)]
+
+
+class IdentityMapMixin:
+    """Даёт представлению get_once с картой идентичности запроса."""
+
+    def get_once(self, queryset, **lookup):
+        return get_object_once(self.request, queryset, **lookup)
@@ -0,0 +1,91 @@
+"""Обработка картинок постов при загрузке.
+
+Загрузка пишется во временный файл (TemporaryFileUploadHandler), а
+перед сохранением поста картинка поворачивается по EXIF, уменьшается
+до POST_IMAGE_MAX_SIZE и перекодируется: непрозрачные — в
+прогрессивный JPEG, с прозрачностью — в PNG. Из метаданных при
+перекодировании переносится только цветовой профиль. Ширина и высота
+записываются в пост, поэтому страницам и миниатюрам не нужно
+открывать файл ради размеров.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps
+
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'optimize': True}
+
+
+class ImageError(ValueError):
+    pass
+
+
+def check(image):
+    """Отказывает картинкам, которые слишком велики для декодирования."""
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ImageError(
+            f'Картинка {width}×{height} слишком большая: не больше '
+            f'{settings.POST_IMAGE_MAX_PIXELS // 1_000_000} Мп')
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+
+
+def process(source, name):
+    """Готовит загруженную картинку к хранению.
+
+    Возвращает (файл, ширина, высота). Анимации, которые уже не больше
+    предельного размера, сохраняются как есть: перекодирование
+    оставило бы от них один кадр.
+    """
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    source.seek(0)
+    with Image.open(source) as image:
+        check(image)
+        if getattr(image, 'is_animated', False) and (
+                image.width <= max_size[0] and image.height <= max_size[1]):
+            source.seek(0)
+            return File(source, name=name), image.width, image.height
+        # JPEG декодируется сразу в уменьшенном масштабе.
+        image.draft('RGB', max_size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size, Image.LANCZOS)
+        if has_alpha(image):
+            image = image.convert('RGBA')
+            extension, image_format, options = '.png', 'PNG', PNG_OPTIONS
+        else:
+            image = image.convert('RGB')
+            extension, image_format, options = '.jpg', 'JPEG', JPEG_OPTIONS
+        # Из метаданных остаётся только цветовой профиль.
+        icc_profile = image.info.get('icc_profile')
+        image.info = {}
+        if icc_profile:
+            options = dict(options, icc_profile=icc_profile)
+        target = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        image.save(target, image_format, **options)
+        target.seek(0)
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return File(target, name=stem + extension), image.width, image.height
+
+
+def prepare(post):
+    """Обрабатывает новую картинку поста перед сохранением.
+
+    Уже сохранённые картинки (правка без новой загрузки, перенос
+    данных) не трогаются.
+    """
+    if not post.image:
+        post.image_width = post.image_height = None
+        return
+    if post.image._committed:
+        return
+    processed, post.image_width, post.image_height = process(
+        post.image.file, post.image.name)
+    post.image = processed
@@ -0,0 +1,104 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа, число запросов и память всех страниц '
+            'posts на отдельной тестовой базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in benchmark.DATASET.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Размер набора данных (по умолчанию {default}).')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument(
+            '--only', nargs='+', metavar='SCENARIO',
+            help='Прогнать только перечисленные сценарии.')
+        parser.add_argument(
+            '--output', help='Куда сохранить отчёт в JSON.')
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Отчёт прошлого прогона для поиска регрессий.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Допустимый рост времени и памяти (доля, по умолчанию '
+                 '0.1).')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должно быть больше нуля')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as source:
+                baseline = json.load(source)
+
+        # Без setup_test_environment: его инструментирование шаблонов
+        # искажает время. DEBUG выключен, чтобы не работал debug_toolbar,
+        # ограничения частоты — чтобы пишущие сценарии не получали 429.
+        # Кэш — во временном каталоге, общий кэш сайта замер не трогает.
+        cache_dir = tempfile.TemporaryDirectory()
+        environment = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            THROTTLE_RATES={},
+            CACHES=benchmark.isolated_caches(cache_dir.name),
+        )
+        environment.enable()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            data = benchmark.seed(
+                seed=options['seed'],
+                **{name: options[name] for name in benchmark.DATASET})
+            report = benchmark.run(
+                data,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                cold=options['cold'],
+                only=options['only'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            environment.disable()
+            cache_dir.cleanup()
+        report['meta']['seed'] = options['seed']
+        report['meta']['dataset'] = {
+            name: options[name] for name in benchmark.DATASET}
+
+        self.stdout.write(
+            f'{"сценарий":<20} {"код":>4} {"p50":>9} {"p95":>9} {"p99":>9} '
+            f'{"запросы":>8} {"память, КБ":>11}')
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<20} {result["status"]:>4} {result["p50"]:>9.2f} '
+                f'{result["p95"]:>9.2f} {result["p99"]:>9.2f} '
+                f'{result["queries"]:>8} {result["peak_kb"]:>11.1f}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                json.dump(report, target, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+
+        if baseline is not None:
+            rows = benchmark.compare(baseline, report, options['threshold'])
+            regressions = [row for row in rows if row[-1]]
+            for name, metric, old, new, change, _ in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f'Регрессия {name}.{metric}: {old} -> {new} '
+                    f'({change:+.0%})'))
+            if regressions:
+                raise CommandError(f'Найдено регрессий: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, пользователей (с хэшами паролей), посты, '
+            'комментарии и подписки в JSONL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help='Файл выгрузки, .gz сжимается; по умолчанию stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--progress-every', type=int, default=100000,
+            help='Как часто сообщать о ходе выгрузки (строк).')
+
+    def handle(self, *args, **options):
+        every = options['progress_every']
+
+        def progress(name, count):
+            if count % every == 0:
+                self.stderr.write(f'{name}: {count}')
+
+        with transfer.open_stream(options['output'], 'w') as stream:
+            counts = transfer.export(
+                stream, options['chunk_size'], progress)
+        self.stderr.write('Выгружено: ' + ', '.join(
+            f'{name} {count}' for name, count in counts.items()))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Task
+from posts.models import Post
+from posts.tasks import build_thumbnails, thumbnails_key
+
+
+class Command(BaseCommand):
+    help = ('Ставит в очередь миниатюры для уже загруженных картинок '
+            'постов; строит их воркер run_tasks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Построить заново и уже готовые миниатюры.')
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('id').values_list('image', flat=True).iterator()
+        )
+        statuses = {}
+        for name in names:
+            task = build_thumbnails.enqueue(
+                name, key=thumbnails_key(name), requeue=options['force'])
+            statuses[task.status] = statuses.get(task.status, 0) + 1
+        self.stdout.write(
+            f'Картинок в очереди: {statuses.get(Task.QUEUED, 0)}')
+        if statuses.get(Task.DONE):
+            self.stdout.write(
+                f'Уже готовы: {statuses[Task.DONE]} '
+                f'(--force построит их заново)')
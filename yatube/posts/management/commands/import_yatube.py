@@ -0,0 +1,52 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_yatube пачками через bulk_create '
+            'и пересобирает счётчики, ленты и поисковый индекс.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', nargs='?', default='-',
+            help='Файл выгрузки (.gz распаковывается); по умолчанию stdin.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--progress-every', type=int, default=100000,
+            help='Как часто сообщать о ходе загрузки (строк).')
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересобирать счётчики, ленты и индекс после загрузки.')
+
+    def handle(self, *args, **options):
+        every = options['progress_every']
+        reported = {}
+
+        def progress(name, count):
+            if count - reported.get(name, 0) >= every:
+                reported[name] = count
+                self.stderr.write(f'{name}: {count}')
+
+        importer = transfer.Importer(options['batch_size'], progress)
+        try:
+            with transfer.open_stream(options['input'], 'r') as stream:
+                loaded, skipped = importer.run(stream)
+        except ValueError as error:
+            raise CommandError(error)
+        self.stderr.write('Загружено: ' + ', '.join(
+            f'{name} {count}' for name, count in loaded.items()))
+        if any(skipped.values()):
+            self.stderr.write('Пропущено без связей: ' + ', '.join(
+                f'{name} {count}' for name, count in skipped.items()
+                if count))
+        if not options['no_rebuild']:
+            # bulk_create не вызывает сигналы: всё производное
+            # пересобирается целиком.
+            call_command('recount_counters', stdout=self.stderr)
+            call_command('rebuild_timelines', stdout=self.stderr)
+            call_command('rebuild_search_index', stdout=self.stderr)
+            call_command('recompute_trending', stdout=self.stderr)
+            cache.clear()
@@ -0,0 +1,78 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Нагружает страницы posts параллельными клиентами через WSGI '
+            'и ASGI на отдельной тестовой базе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in benchmark.DATASET.items():
+            parser.add_argument(
+                f'--{name}', type=int, default=default,
+                help=f'Размер набора данных (по умолчанию {default}).')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+',
+            default=list(benchmark.LOAD_LEVELS),
+            help='Числа одновременных клиентов.')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов на каждый замер.')
+        parser.add_argument(
+            '--only', nargs='+', metavar='SCENARIO',
+            help='Сценарии (по умолчанию читающие страницы лент).')
+        parser.add_argument(
+            '--output', help='Куда сохранить отчёт в JSON.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or min(options['concurrency']) < 1:
+            raise CommandError('--requests и --concurrency должны быть '
+                               'больше нуля')
+        # Кэш — во временном каталоге, общий кэш сайта замер не трогает.
+        cache_dir = tempfile.TemporaryDirectory()
+        environment = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+            THROTTLE_RATES={},
+            CACHES=benchmark.isolated_caches(cache_dir.name),
+        )
+        environment.enable()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            data = benchmark.seed(
+                seed=options['seed'],
+                **{name: options[name] for name in benchmark.DATASET})
+            rows = benchmark.load(
+                data,
+                levels=options['concurrency'],
+                requests=options['requests'],
+                only=options['only'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            environment.disable()
+            cache_dir.cleanup()
+
+        self.stdout.write(
+            f'{"сценарий":<18} {"сервер":<6} {"запросы":<9} {"клиенты":>7} '
+            f'{"код":>4} {"rps":>8} {"p50":>9} {"p95":>9}')
+        for row in rows:
+            self.stdout.write(
+                f'{row["scenario"]:<18} {row["server"]:<6} '
+                f'{row["lookups"]:<9} {row["concurrency"]:>7} '
+                f'{row["status"]:>4} {row["rps"]:>8.1f} '
+                f'{row["p50"]:>9.2f} {row["p95"]:>9.2f}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                json.dump(rows, target, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Читатели, чьи ленты пересобрать (по умолчанию все).')
+
+    def handle(self, *args, **options):
+        readers = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True).distinct()
+        if options['usernames']:
+            readers = readers.filter(user__username__in=options['usernames'])
+        total = 0
+        for user_id in readers.iterator():
+            timeline.rebuild(user_id)
+            total += 1
+        self.stdout.write(f'Пересобрано лент: {total}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность постов с нуля. Запускается '
+            'периодически, например раз в час из cron.')
+
+    def handle(self, *args, **options):
+        total = trending.recompute()
+        self.stdout.write(f'Популярность пересчитана: постов {total}')
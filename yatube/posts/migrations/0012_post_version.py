@@ -0,0 +1,31 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:01
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_pub_date(apps, schema_editor):
+    """Существующие посты считаются не менявшимися с публикации."""
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(modified=F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Растёт при каждом изменении карточки поста', verbose_name='Версия'),
+        ),
+        migrations.RunPython(copy_pub_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:04
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image
+
+
+def fill_sizes(apps, schema_editor):
+    """Размеры уже загруженных картинок читаются один раз здесь."""
+    Post = apps.get_model('posts', 'Post')
+    posts = (Post.objects.exclude(image='').exclude(image__isnull=True)
+             .only('id', 'image').iterator())
+    for post in posts:
+        try:
+            with default_storage.open(post.image.name) as source, \
+                    Image.open(source) as image:
+                width, height = image.size
+        except (OSError, ValueError):
+            continue
+        Post.objects.filter(pk=post.pk).update(
+            image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(fill_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_timelines(apps, schema_editor):
+    """Раскладывает существующие посты по лентам подписчиков.
+
+    Как и при записи, раздаются только авторы, у которых подписчиков
+    не больше TIMELINE_FANOUT_LIMIT, и в ленте остаются последние
+    TIMELINE_LENGTH постов.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    pushed = set(
+        Follow.objects.order_by().values('author_id')
+        .annotate(total=Count('pk'))
+        .filter(total__lte=settings.TIMELINE_FANOUT_LIMIT)
+        .values_list('author_id', flat=True)
+    )
+    readers = list(Follow.objects.order_by('user_id').values_list(
+        'user_id', flat=True).distinct())
+    for user_id in readers:
+        authors = [
+            author_id for author_id in Follow.objects.filter(
+                user_id=user_id).values_list('author_id', flat=True)
+            if author_id in pushed
+        ]
+        posts = (
+            Post.objects.filter(author_id__in=authors)
+            .order_by('-pub_date', '-id')
+            .values_list('id', 'author_id', 'pub_date')
+            [:settings.TIMELINE_LENGTH]
+        )
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           author_id=author_id, pub_date=pub_date)
+             for post_id, author_id, pub_date in posts],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_postscore'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -30,11 +30,39 @@ class Post(CreatedModel):
         blank=True,
         null=True
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина картинки')
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота картинки')
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев')
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения')
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name='Версия',
+        help_text='Растёт при каждом изменении карточки поста')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -77,6 +105,13 @@ class Comment(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации комментария')
 
+    class Meta:
+        ordering = ('created', 'id')
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -93,3 +128,110 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following',
         verbose_name='Автор постов')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые поддерживаются сигналами."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов')
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписок')
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: запись на каждый пост
+    автора, на которого подписан читатель.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель')
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class PostScore(models.Model):
+    """Популярность поста для страницы «Популярное».
+
+    score — log2 суммы весов событий поста, см. posts.trending. group
+    повторяет группу поста, чтобы топ группы читался по одному индексу.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Пост')
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='+',
+        verbose_name='Группа')
+    score = models.FloatField(verbose_name='Счёт')
+
+    class Meta:
+        verbose_name = 'Популярность поста'
+        verbose_name_plural = 'Популярность постов'
+        indexes = [
+            models.Index(fields=['-score'], name='score_idx'),
+            models.Index(fields=['group', '-score'],
+                         name='score_group_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score:.2f}'
@@ -0,0 +1,237 @@
+"""Полнотекстовый поиск по постам.
+
+Основной движок — виртуальная таблица SQLite FTS5 с ранжированием bm25.
+Если база не SQLite или FTS5 не собран, используется инвертированный
+индекс в памяти процесса. Оба движка обновляются сигналами при
+сохранении и удалении поста; индекс в памяти других воркеров узнаёт
+об изменении по номеру версии в общем кэше и пересобирается из базы.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from posts.models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TOKEN_RE = re.compile(r'\w+')
+# Номер изменения индекса в памяти, общий для всех воркеров.
+VERSION_KEY = 'search:memory:version'
+# Сколько найденных id проверяется фильтрами за один запрос: SQLite
+# ограничивает число параметров.
+FILTER_CHUNK = 500
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class FTS5Backend:
+    """Поиск через FTS5: токены запроса ищутся по префиксу, все
+    обязательны, результаты упорядочены по bm25.
+    """
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.id, post.text])
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}')
+
+    def search(self, query, offset, limit, group_id=None, author_id=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = ' '.join('"{}"*'.format(token) for token in tokens)
+        sql = [
+            f'SELECT p.id FROM {FTS_TABLE} f '
+            f'JOIN {Post._meta.db_table} p ON p.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s'
+        ]
+        params = [match]
+        if group_id is not None:
+            sql.append('AND p.group_id = %s')
+            params.append(group_id)
+        if author_id is not None:
+            sql.append('AND p.author_id = %s')
+            params.append(author_id)
+        sql.append('ORDER BY f.rank, p.id DESC LIMIT %s OFFSET %s')
+        params += [limit, offset]
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InvertedIndexBackend:
+    """Инвертированный индекс в памяти процесса для баз без FTS5.
+
+    Строится при первом запросе, ранжирует по tf-idf. Отсортированный
+    словарь для поиска по префиксу пересобирается лениво. Каждое
+    изменение увеличивает VERSION_KEY — сразу и после фиксации
+    транзакции; воркер, чья версия отстала больше чем на своё
+    изменение, пересобирает индекс из базы при следующем поиске.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = None
+        self.version = None
+
+    def shared_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, 0, None)
+            version = cache.get(VERSION_KEY, 0)
+        return version
+
+    def ensure_built(self):
+        version = self.shared_version()
+        if self.postings is not None and self.version == version:
+            return
+        # Версия читается до базы: изменение во время сборки вызовет
+        # ещё одну.
+        self.version = version
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.terms = None
+        for post_id, text in Post.objects.values_list(
+                'id', 'text').iterator():
+            self.add(post_id, text)
+
+    def changed(self):
+        """Сообщает остальным воркерам об изменении индекса."""
+        version = cache.update(
+            VERSION_KEY, lambda version: (version or 0) + 1, None)
+        with self.lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def notify(self):
+        self.changed()
+        transaction.on_commit(self.changed)
+
+    def add(self, post_id, text):
+        tokens = tokenize(text)
+        self.documents[post_id] = set(tokens)
+        for token in tokens:
+            self.postings[token][post_id] = (
+                self.postings[token].get(post_id, 0) + 1)
+
+    def discard(self, post_id):
+        for token in self.documents.pop(post_id, ()):
+            self.postings[token].pop(post_id, None)
+            if not self.postings[token]:
+                del self.postings[token]
+
+    def index(self, post):
+        with self.lock:
+            if self.postings is not None:
+                self.discard(post.id)
+                self.add(post.id, post.text)
+                self.terms = None
+        self.notify()
+
+    def remove(self, post_id):
+        with self.lock:
+            if self.postings is not None:
+                self.discard(post_id)
+                self.terms = None
+        self.notify()
+
+    def rebuild(self):
+        with self.lock:
+            self.postings = None
+            self.ensure_built()
+
+    def scores(self, prefix):
+        """tf-idf документов, содержащих слова с данным префиксом."""
+        found = defaultdict(float)
+        total = len(self.documents) or 1
+        position = bisect_left(self.terms, prefix)
+        while (position < len(self.terms)
+               and self.terms[position].startswith(prefix)):
+            docs = self.postings[self.terms[position]]
+            idf = math.log(1 + total / len(docs))
+            for post_id, frequency in docs.items():
+                found[post_id] += frequency * idf
+            position += 1
+        return found
+
+    def search(self, query, offset, limit, group_id=None, author_id=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            self.ensure_built()
+            if self.terms is None:
+                self.terms = sorted(self.postings)
+            ranked = None
+            for token in tokens:
+                found = self.scores(token)
+                if ranked is None:
+                    ranked = found
+                else:
+                    ranked = {post_id: score + found[post_id]
+                              for post_id, score in ranked.items()
+                              if post_id in found}
+        ordered = sorted(ranked, key=lambda post_id: (-ranked[post_id],
+                                                      -post_id))
+        if group_id is None and author_id is None:
+            return ordered[offset:offset + limit]
+        filters = {}
+        if group_id is not None:
+            filters['group_id'] = group_id
+        if author_id is not None:
+            filters['author_id'] = author_id
+        # Фильтры проверяются порциями и только до конца страницы.
+        matched = []
+        for start in range(0, len(ordered), FILTER_CHUNK):
+            chunk = ordered[start:start + FILTER_CHUNK]
+            allowed = set(Post.objects.filter(
+                id__in=chunk, **filters).values_list('id', flat=True))
+            matched += [post_id for post_id in chunk if post_id in allowed]
+            if len(matched) >= offset + limit:
+                break
+        return matched[offset:offset + limit]
+
+
+fts5_backend = FTS5Backend()
+memory_backend = InvertedIndexBackend()
+_fts5_tables = {}
+
+
+def fts5_available():
+    """Есть ли в текущей базе таблица FTS5 (проверяется один раз)."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        _fts5_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names())
+    return _fts5_tables[name]
+
+
+def get_backend():
+    if settings.SEARCH_BACKEND == 'memory':
+        return memory_backend
+    if settings.SEARCH_BACKEND == 'fts5' or fts5_available():
+        return fts5_backend
+    return memory_backend
@@ -0,0 +1,210 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from posts import (cache, cards, counters, graph, images, search, tasks,
+                   timeline, trending)
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+
+# Поля автора, которые показывает карточка поста.
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def bump_post_scopes(post, *group_ids):
+    cache.forget('post', post.id)
+    cache.bump(
+        cache.INDEX,
+        cache.post_scope(post.id),
+        cache.profile_scope(post.author_id),
+        *(cache.group_scope(group_id)
+          for group_id in (post.group_id, *group_ids) if group_id),
+    )
+
+
+def bump_author_scopes(user_id):
+    group_ids = (
+        Post.objects.filter(author_id=user_id, group__isnull=False)
+        .order_by().values_list('group_id', flat=True).distinct()
+    )
+    cache.bump(
+        cache.INDEX,
+        cache.profile_scope(user_id),
+        *(cache.group_scope(group_id) for group_id in group_ids),
+    )
+
+
+def previous_values(instance, *fields):
+    """Значения полей объекта в базе до сохранения."""
+    if not instance.pk:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        *fields).first()
+
+
+def bump_follow_scopes(follow):
+    """Число подписчиков и подписок видно на страницах профилей."""
+    cache.bump(
+        cache.profile_scope(follow.author_id),
+        cache.profile_scope(follow.user_id),
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_name(sender, instance, update_fields, **kwargs):
+    """Запоминает имя, которое видно в карточках постов автора."""
+    instance._previous_name = None
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        instance._previous_name = previous_values(
+            instance, *AUTHOR_CARD_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    cache.forget('user', instance.username)
+    previous = getattr(instance, '_previous_name', None)
+    if previous is not None:
+        # Прежнее имя из URL больше не должно вести к этому автору.
+        cache.forget('user', dict(zip(AUTHOR_CARD_FIELDS, previous))[
+            'username'])
+    if created:
+        UserStats.objects.create(user=instance)
+    elif update_fields is None or set(update_fields) != {'last_login'}:
+        bump_author_scopes(instance.id)
+        current = tuple(getattr(instance, name)
+                        for name in AUTHOR_CARD_FIELDS)
+        if previous is not None and previous != current:
+            cards.touch(Post.objects.filter(author_id=instance.id))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    cache.forget('user', instance.username)
+    cache.bump(cache.INDEX, cache.profile_scope(instance.id))
+
+
+@receiver(pre_save, sender=Group)
+def remember_title(sender, instance, **kwargs):
+    instance._previous_title = previous_values(instance, 'title', 'slug')
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    """Посты группы теряют её через UPDATE без сигналов."""
+    cards.touch(Post.objects.filter(group_id=instance.id))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_title', None)
+    if previous is not None and previous != (instance.title, instance.slug):
+        cards.touch(Post.objects.filter(group_id=instance.id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    cache.forget('group', instance.slug)
+    previous = getattr(instance, '_previous_title', None)
+    if previous is not None:
+        cache.forget('group', previous[1])
+    author_ids = (
+        Post.objects.filter(group_id=instance.id)
+        .order_by().values_list('author_id', flat=True).distinct()
+    )
+    cache.bump(
+        cache.INDEX,
+        cache.group_scope(instance.id),
+        *(cache.profile_scope(author_id) for author_id in author_ids),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def process_image(sender, instance, **kwargs):
+    """Новая картинка уменьшается и перекодируется до записи в
+    хранилище.
+    """
+    images.prepare(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    """Запоминает прежнюю группу, чтобы сбросить и её ленту, и
+    поднимает версию карточки изменённого поста.
+    """
+    instance._previous_group_id = None
+    if instance.pk:
+        instance._previous_group_id = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', flat=True).first()
+        )
+        instance.version += 1
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    """Сбрасывает кэш лент с постом, новый пост добавляет в популярное
+    и ставит в очередь раскладку по лентам подписчиков автора.
+
+    Правка поста материализованные ленты не меняет: записи ссылаются
+    на сам пост, а при удалении поста удаляются каскадно.
+    """
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    bump_post_scopes(instance, previous_group_id)
+    search.get_backend().index(instance)
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        tasks.fan_out.enqueue(instance.id)
+        trending.post_published(instance)
+    elif previous_group_id != instance.group_id:
+        trending.move(instance.id, instance.group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    bump_post_scopes(instance)
+    search.get_backend().remove(instance.id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    cache.bump(cache.post_scope(instance.post_id))
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+        trending.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    cache.bump(cache.post_scope(instance.post_id))
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        bump_follow_scopes(instance)
+        timeline.backfill(instance.user_id, instance.author_id)
+        # Откаченная подписка не должна попасть ни в граф, ни в журнал.
+        transaction.on_commit(partial(
+            graph.graph.changed, True, instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_follow_scopes(instance)
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    timeline.drop(instance.user_id, instance.author_id)
+    if timeline.dropped_to_push(instance.author_id):
+        # Посты, написанные в режиме pull, надо разложить по лентам.
+        tasks.backfill_timelines.enqueue(
+            instance.author_id,
+            key=tasks.timelines_key(instance.author_id), requeue=True)
+    transaction.on_commit(partial(
+        graph.graph.changed, False, instance.user_id, instance.author_id))
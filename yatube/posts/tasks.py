@@ -0,0 +1,49 @@
+"""Фоновые задачи posts (см. core.tasks)."""
+from core.tasks import task
+from posts import thumbnails, timeline
+from posts.models import Post
+
+
+@task()
+def build_thumbnails(name):
+    thumbnails.generate(name)
+
+
+def thumbnails_key(name):
+    return f'thumbnails:{name}'
+
+
+def schedule_thumbnails(post, requeue=False):
+    """Ставит миниатюры картинки поста в очередь один раз; requeue=True
+    строит заново и уже готовые.
+
+    Возвращает задачу или None, если картинки нет.
+    """
+    if post.image:
+        return build_thumbnails.enqueue(
+            post.image.name, key=thumbnails_key(post.image.name),
+            requeue=requeue)
+    return None
+
+
+@task()
+def fan_out(post_id):
+    """Раскладывает пост по лентам подписчиков, если он ещё есть."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        timeline.fan_out(post)
+
+
+@task()
+def rebuild_timelines(user_ids):
+    for user_id in user_ids:
+        timeline.rebuild(user_id)
+
+
+@task()
+def backfill_timelines(author_id):
+    timeline.backfill_followers(author_id)
+
+
+def timelines_key(author_id):
+    return f'timelines:{author_id}'
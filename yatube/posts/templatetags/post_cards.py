@@ -0,0 +1,11 @@
+from django import template
+
+from posts import cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, kind='article'):
+    """Список HTML карточек постов из кэша, недостающие отрисовываются."""
+    return cards.render(posts, kind)
@@ -0,0 +1,11 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image, size):
+    """Готовая миниатюра картинки или None, пока её строит пул."""
+    return thumbnails.ready(image, size)
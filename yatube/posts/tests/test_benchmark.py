@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from posts import benchmark
+from posts.models import Comment, Follow, Post, TimelineEntry
+
+
+class BenchmarkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.data = benchmark.seed(
+            seed=1, users=8, groups=2, posts=30, comments=20, follows=10)
+
+    def test_seed(self):
+        """Набор данных строится нужного размера вместе с производными."""
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), 10)
+        self.assertTrue(TimelineEntry.objects.exists())
+        post = Post.objects.get(pk=self.data['post'].pk)
+        self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_run_covers_every_route(self):
+        """Каждый маршрут posts отвечает без ошибок и попадает в отчёт."""
+        report = benchmark.run(self.data, iterations=2, warmup=0)
+        routes = {url.split('?')[0] for url in
+                  (result['url'] for result in report['results'].values())}
+        self.assertGreaterEqual(len(routes), 12)
+        for name, result in report['results'].items():
+            with self.subTest(name=name):
+                self.assertIn(result['status'], (200, 302))
+                self.assertLessEqual(result['p50'], result['p99'])
+                for metric in benchmark.METRICS:
+                    self.assertIn(metric, result)
+
+    def test_compare_flags_regressions(self):
+        """Рост времени сверх порога и рост числа запросов — регрессии."""
+        baseline = {'results': {'index': {
+            'p50': 10, 'p95': 20, 'p99': 30, 'queries': 2, 'peak_kb': 100}}}
+        current = {'results': {'index': {
+            'p50': 10.2, 'p95': 40, 'p99': 30, 'queries': 3,
+            'peak_kb': 100}}}
+        flagged = {row[1] for row in benchmark.compare(baseline, current)
+                   if row[-1]}
+        self.assertEqual(flagged, {'p95', 'queries'})
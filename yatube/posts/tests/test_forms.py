@@ -1,11 +1,16 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from http import HTTPStatus
+from PIL import Image
 
+from core.models import Task
+from core.tasks import run_pending
+from posts import tasks, thumbnails
 from posts.models import Comment, Group, Post, User
 from posts.def_uls import (INDEX_URL, POST_EDIT_URL,
                            POST_CREATE_URL, COMMENT_URL)
@@ -117,6 +122,31 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         self.assertTrue(Post.objects.filter(text=POST_TEXT,).exists())
 
+    def test_post_with_image_schedules_thumbnails(self):
+        """Миниатюры новой картинки строятся вне отрисовки страницы."""
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            POST_CREATE_URL(),
+            data={'text': 'С миниатюрой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='С миниатюрой')
+        task = Task.objects.get(key=tasks.thumbnails_key(post.image.name))
+        self.assertEqual(task.name, tasks.build_thumbnails.task_name)
+        self.assertEqual(task.status, Task.QUEUED)
+        self.assertIsNone(thumbnails.ready(post.image, 'card'))
+        # Страница, закэшированная до миниатюры, показывает оригинал.
+        self.assertNotContains(self.client.get(INDEX_URL()), 'cache/')
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.DONE)
+        thumbnail = thumbnails.ready(post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        self.assertContains(self.client.get(INDEX_URL()), thumbnail.url)
+
     def test_add_comment(self):
         """Комментарий появляется на странице поста."""
         comment_count = Comment.objects.count()
@@ -126,3 +156,73 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(Comment.objects.count(), comment_count + 1)
         self.assertTrue(Comment.objects.filter(
             text=COMMENT,).exists())
+
+
+def image_upload(name, size, mode='RGB', image_format='JPEG', **options):
+    content = BytesIO()
+    Image.new(mode, size, 'red').save(content, image_format, **options)
+    return SimpleUploadedFile(name, content.getvalue(),
+                              content_type=f'image/{image_format.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIZE=(64, 64))
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=AUTHOR_NAME)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create(self, image):
+        return self.client.post(POST_CREATE_URL(),
+                                {'text': 'С картинкой', 'image': image})
+
+    def test_photo_normalised(self):
+        """Фото поворачивается по EXIF, уменьшается и теряет EXIF"""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Камера'
+        self.create(image_upload('photo.jpeg', (200, 100),
+                                 exif=exif.tobytes()))
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (32, 64))
+        with post.image.open() as stored, Image.open(stored) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (32, 64))
+            self.assertNotIn('exif', image.info)
+
+    def test_transparent_image_kept_png(self):
+        """Картинка с прозрачностью остаётся PNG"""
+        self.create(image_upload('logo.png', (100, 100), 'RGBA', 'PNG'))
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.png'))
+        self.assertEqual((post.image_width, post.image_height), (64, 64))
+
+    def test_limits(self):
+        """Слишком большие файлы и картинки не принимаются"""
+        for limit in ({'POST_IMAGE_MAX_BYTES': 10},
+                      {'POST_IMAGE_MAX_PIXELS': 100}):
+            with self.subTest(limit=limit), override_settings(**limit):
+                response = self.create(image_upload('big.jpg', (20, 20)))
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('image', response.context['form'].errors)
+                self.assertFalse(Post.objects.exists())
+
+    def test_edit_without_upload_keeps_image(self):
+        """Правка без новой картинки не перекодирует старую"""
+        self.create(image_upload('photo.jpg', (20, 20)))
+        post = Post.objects.get()
+        name = post.image.name
+        self.client.post(POST_EDIT_URL(post.id),
+                         {'text': 'Новый текст'})
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, name)
+        self.assertEqual((post.image_width, post.image_height), (20, 20))
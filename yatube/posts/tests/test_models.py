@@ -1,6 +1,14 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.models import (Comment, Follow, Group, Post, PostScore,
+                          TimelineEntry, User, UserStats)
+from posts.timeline import TimelinePaginator
+from posts.utils import (COMMENTS_LIMIT, COMMENTS_ORDERING, FEED_ORDERING,
+                         LIMIT, CursorPaginator)
 
 
 class PostModelTest(TestCase):
@@ -87,3 +95,160 @@ class GroupModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     group._meta.get_field(value).help_text, expected)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_posts_count(self):
+        """Счётчик постов меняется при создании и удалении поста."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_comments_count(self):
+        """Счётчик комментариев меняется при создании и удалении."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counts(self):
+        """Счётчики подписок меняются при подписке и отписке."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_drifted_counters_do_not_block_deletes(self):
+        """Удаление при нулевом счётчике не падает и не уводит его ниже
+        нуля."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.update(comments_count=0)
+        UserStats.objects.update(
+            posts_count=0, followers_count=0, following_count=0)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount_counters чинит расхождения счётчиков."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7)
+        Post.objects.update(comments_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('recount_counters', stdout=StringIO())
+        author_stats = self.stats(self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(author_stats.following_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+
+class QueryPlanTest(TestCase):
+    """Запросы лент читают индексы, а не всю таблицу."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост')
+        cls.comment = Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def feed_queries(self):
+        posts = Post.objects.select_related('author', 'group')
+        paginator = CursorPaginator(posts, LIMIT)
+        after = paginator.keyset_filter(paginator.key(self.post))
+        group_posts = posts.filter(group=self.group)
+        author_posts = posts.filter(author=self.author)
+        # Страницы группы и профиля ищут посты по slug и username.
+        slug_posts = posts.filter(group__slug=self.group.slug)
+        username_posts = posts.filter(author__username=self.author.username)
+        entries = TimelineEntry.objects.filter(user=self.reader)
+        comments = CursorPaginator(
+            Comment.objects.all(), COMMENTS_LIMIT, COMMENTS_ORDERING)
+        entry_after = paginator.keyset_filter(
+            paginator.key(self.post), fields=TimelinePaginator.entry_fields)
+        return {
+            'index': posts.order_by(*FEED_ORDERING)[:LIMIT + 1],
+            'index_after': posts.filter(after).order_by(
+                *FEED_ORDERING)[:LIMIT + 1],
+            'group': group_posts.order_by(*FEED_ORDERING)[:LIMIT + 1],
+            'group_after': group_posts.filter(after).order_by(
+                *FEED_ORDERING)[:LIMIT + 1],
+            'profile': author_posts.order_by(*FEED_ORDERING)[:LIMIT + 1],
+            'profile_after': author_posts.filter(after).order_by(
+                *FEED_ORDERING)[:LIMIT + 1],
+            'group_by_slug': slug_posts.order_by(*FEED_ORDERING)[:LIMIT + 1],
+            'group_by_slug_after': slug_posts.filter(after).order_by(
+                *FEED_ORDERING)[:LIMIT + 1],
+            'profile_by_username': username_posts.order_by(
+                *FEED_ORDERING)[:LIMIT + 1],
+            'profile_by_username_after': username_posts.filter(
+                after).order_by(*FEED_ORDERING)[:LIMIT + 1],
+            'timeline': entries.order_by('-pub_date', '-post_id')
+            .values_list('post_id', flat=True)[:LIMIT + 1],
+            'timeline_after': entries.filter(entry_after)
+            .order_by('-pub_date', '-post_id')
+            .values_list('post_id', flat=True)[:LIMIT + 1],
+            'comments': self.post.comments.select_related('author'),
+            'comments_after': self.post.comments.select_related('author')
+            .filter(comments.keyset_filter(comments.key(self.comment)))
+            .order_by(*COMMENTS_ORDERING)[:COMMENTS_LIMIT + 1],
+            'following': Follow.objects.filter(
+                user=self.reader, author=self.author),
+            'following_by_username': Follow.objects.filter(
+                user=self.reader, author__username=self.author.username),
+            'followers': Follow.objects.filter(
+                author=self.author).values_list('user_id', flat=True),
+            'trending': PostScore.objects.select_related(
+                'post__author', 'post__group').order_by('-score')[:LIMIT],
+            'group_trending': PostScore.objects.select_related(
+                'post__author', 'post__group').filter(
+                    group__slug=self.group.slug).order_by('-score')[:LIMIT],
+        }
+
+    def test_feeds_use_indexes(self):
+        """Ни один запрос ленты не сканирует таблицу и не сортирует
+        во временном B-tree.
+        """
+        for name, queryset in self.feed_queries().items():
+            with self.subTest(query=name):
+                for step in self.plan(queryset):
+                    self.assertNotIn('TEMP B-TREE', step)
+                    self.assertNotRegex(step, r'^SCAN \w+$')
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO, TextIOWrapper
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts.models import (Comment, Follow, Group, Post, TimelineEntry, User,
+                          UserStats)
+
+
+class TransferTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='auth', password='secret-pass')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}',
+                                group=self.group if i % 2 else None)
+            for i in range(7)
+        ]
+        Comment.objects.create(
+            post=self.posts[3], author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'dump.jsonl.gz')
+
+    def export(self):
+        call_command('export_yatube', self.path, stderr=StringIO())
+
+    def load(self, *args):
+        call_command('import_yatube', self.path, '--batch-size', '3',
+                     *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_stdout_stays_open(self):
+        """Выгрузка в «-» пишет в stdout и не закрывает его"""
+        stdout = TextIOWrapper(BytesIO(), encoding='utf-8')
+        with mock.patch('sys.stdout', stdout):
+            call_command('export_yatube', '-', stderr=StringIO())
+        self.assertFalse(stdout.closed)
+        stdout.write('дальше\n')
+        stdout.flush()
+        lines = stdout.buffer.getvalue().decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['format'], 'yatube')
+        self.assertEqual(lines[-1], 'дальше')
+
+    def test_round_trip_remaps_keys(self):
+        """Выгрузка загружается в пустую базу с новыми id и теми же
+        связями и датами
+        """
+        self.export()
+        dates = {post.text: post.pub_date for post in self.posts}
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        # Новые строки не должны совпасть id со старыми.
+        User.objects.create_user(username='other')
+        Group.objects.create(title='Другая', slug='other')
+        self.load()
+
+        author = User.objects.get(username='auth')
+        reader = User.objects.get(username='reader')
+        group = Group.objects.get(slug='group')
+        self.assertTrue(author.check_password('secret-pass'))
+        self.assertNotEqual(group.id, self.group.id)
+        self.assertEqual(Post.objects.filter(author=author).count(), 7)
+        self.assertEqual(Post.objects.filter(group=group).count(), 3)
+        for post in Post.objects.all():
+            with self.subTest(post=post.text):
+                self.assertEqual(post.pub_date, dates[post.text])
+        comment = Comment.objects.get()
+        self.assertEqual(comment.post.text, 'Пост 3')
+        self.assertEqual(comment.author, reader)
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=author).exists())
+        self.assertEqual(UserStats.objects.get(user=author).posts_count, 7)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=reader).count(), 7)
+
+    def test_existing_users_and_groups_reused(self):
+        """Пользователи и группы с теми же username и slug не дублируются
+        """
+        self.export()
+        self.load()
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Post.objects.count(), 14)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_bad_file(self):
+        """Чужой файл не загружается"""
+        with open(self.path[:-3], 'w', encoding='utf-8') as target:
+            target.write(json.dumps({'model': 'post'}) + '\n')
+        with self.assertRaises(CommandError):
+            call_command('import_yatube', self.path[:-3],
+                         stdout=StringIO(), stderr=StringIO())
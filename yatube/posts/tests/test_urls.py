@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase, Client
 from http import HTTPStatus
 
@@ -32,6 +33,7 @@ class PostURLTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username=USER_NAME)
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
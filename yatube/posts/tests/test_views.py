@@ -1,16 +1,36 @@
+import random
 import shutil
 import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
 from django import forms
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
 
-from posts.models import Group, Post, Follow, User
+from core.tasks import run_pending
+from posts import graph, search, trending, viewsfunc
+from posts.cache import (INDEX, UNCACHEABLE, get_generations,
+                         page_cache_key)
+from posts.models import (Comment, Group, Post, PostScore, Follow,
+                          TimelineEntry, User)
+from posts.utils import COMMENTS_LIMIT
+from posts.views import Index
 from posts.def_uls import (INDEX_URL, GROUP_URL, PROFILE_URL, POST_URL,
-                           POST_EDIT_URL, POST_CREATE_URL, COMMENT_URL,
-                           FOLLOW_INDEX_URL, FOLLOW_URL, UNFOLLOW_URL)
+                           POST_EDIT_URL, POST_DELETE_URL, POST_CREATE_URL,
+                           COMMENT_URL, POST_COMMENTS_URL,
+                           FOLLOW_INDEX_URL, FOLLOW_URL, UNFOLLOW_URL,
+                           SEARCH_URL, TRENDING_URL, GROUP_TRENDING_URL)
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -68,6 +88,7 @@ class PostTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username=USER_NAME)
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -203,13 +224,150 @@ class PostTests(TestCase):
         """Проверка кэша главной страницы"""
         first_page = self.authorized_client.get(INDEX_URL())
         post = first_page.context['page_obj'][0]
-        post.delete()
+        Post.objects.filter(pk=post.pk).update(text='Без сигналов')
         second_page = self.authorized_client.get(INDEX_URL())
         self.assertEqual(second_page.content, first_page.content)
         cache.clear()
         third_page = self.authorized_client.get(INDEX_URL())
         self.assertNotEqual(third_page.content, first_page.content)
 
+    def test_cache_invalidated_on_change(self):
+        """Фрагменты лент сбрасываются при изменении их содержимого"""
+        urls = (
+            INDEX_URL(),
+            GROUP_URL(GROUP_SLUG=GROUP_SLUG),
+            PROFILE_URL(USER_NAME=AUTHOR_NAME),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        post = Post.objects.get(pk=POST_ID)
+        post.text = 'Изменённый текст'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.authorized_client.get(url), 'Изменённый текст')
+        group = Group.objects.get(slug=GROUP_SLUG)
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(
+            self.authorized_client.get(INDEX_URL()), 'Новое название')
+
+    def test_post_moved_to_another_group(self):
+        """Пост пропадает из кэша прежней группы"""
+        url = GROUP_URL(GROUP_SLUG=GROUP_SLUG)
+        self.assertContains(self.authorized_client.get(url), POST_TEXT)
+        post = Post.objects.get(pk=POST_ID)
+        post.group = self.group2
+        post.save()
+        self.assertNotContains(self.authorized_client.get(url), POST_TEXT)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=AUTHOR_NAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_TEXT,
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text=POST_TEXT,
+            group=cls.group,
+        )
+        cls.urls = (
+            INDEX_URL(),
+            GROUP_URL(GROUP_SLUG=GROUP_SLUG),
+            PROFILE_URL(USER_NAME=AUTHOR_NAME),
+            POST_URL(POST_ID=cls.post.id),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.user)
+
+    def test_conditional_get(self):
+        """По совпавшему ETag или дате страница отвечает 304"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response.has_header('Last-Modified'))
+                not_modified = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(not_modified.status_code, 304)
+                not_modified = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(not_modified.status_code, 304)
+
+    def test_last_modified_never_goes_back(self):
+        """Удаление самого нового поста не сдвигает Last-Modified назад"""
+        Post.objects.filter(pk=self.post.pk).update(
+            modified=timezone.now() - timedelta(days=1))
+        newest = Post.objects.create(
+            author=self.user, text='Свежий пост', group=self.group)
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                before = self.client.get(url)['Last-Modified']
+                newest.delete()
+                response = self.client.get(url)
+                self.assertGreaterEqual(
+                    parse_http_date(response['Last-Modified']),
+                    parse_http_date(before))
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=before,
+                    HTTP_IF_MODIFIED_SINCE=http_date(
+                        parse_http_date(before) - 60))
+                self.assertEqual(response.status_code, 200)
+                newest = Post.objects.create(
+                    author=self.user, text='Свежий пост', group=self.group)
+
+    def test_uncacheable_page_marked(self):
+        """Страницу, которую нельзя кэшировать, другие запросы не ждут
+        в кэше, а отрисовывают сами"""
+        with mock.patch.object(Index, 'get_rendered_scopes',
+                               return_value=[]):
+            self.client.get(INDEX_URL())
+            generations = get_generations(INDEX)
+            key = page_cache_key(
+                RequestFactory().get(INDEX_URL()),
+                [(INDEX, generations[INDEX])], Index.page_cache_params)
+            self.assertEqual(cache.get(key), UNCACHEABLE)
+            response = self.client.get(INDEX_URL())
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, POST_TEXT)
+
+    def test_comment_invalidates_post_page(self):
+        """Новый комментарий сбрасывает кэш страницы поста"""
+        url = POST_URL(POST_ID=self.post.id)
+        etag = self.client.get(url)['ETag']
+        self.author_client.post(COMMENT_URL(POST_ID=self.post.id),
+                                {'text': COMMENT})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, COMMENT)
+
+    def test_new_post_invalidates_feeds(self):
+        """Новый пост сбрасывает кэш лент, в которые попадает"""
+        for url in self.urls[:3]:
+            self.client.get(url)
+        Post.objects.create(
+            author=self.user, text='Свежий пост', group=self.group)
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+
+    def test_authorized_pages_not_cached(self):
+        """Авторизованным пользователям страницы не отдаются из кэша"""
+        self.author_client.get(INDEX_URL())
+        response = self.author_client.get(INDEX_URL())
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIsNotNone(response.context)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -231,6 +389,7 @@ class PaginatorViewsTest(TestCase):
         Post.objects.bulk_create(cls.posts)
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username=USER_NAME)
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -257,6 +416,95 @@ class PaginatorViewsTest(TestCase):
             response = self.client.get(url + '?page=2')
             self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую страницу и обратно"""
+        list_reverse = [
+            INDEX_URL(),
+            GROUP_URL(GROUP_SLUG=GROUP_SLUG),
+            PROFILE_URL(USER_NAME=AUTHOR_NAME),
+        ]
+        for url in list_reverse:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    url + '?after=' + first.next_cursor
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                self.assertFalse(set(first) & set(second))
+                back = self.client.get(
+                    url + '?before=' + second.previous_cursor
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу"""
+        response = self.client.get(INDEX_URL() + '?after=broken')
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_page_without_count_and_offset(self):
+        """Курсорная страница не делает COUNT и OFFSET"""
+        first = self.client.get(INDEX_URL()).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(INDEX_URL() + '?after=' + first.next_cursor)
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_NAME)
+        cls.post = Post.objects.create(author=cls.author, text=POST_TEXT)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Комментарий {i}')
+            for i in range(COMMENTS_LIMIT * 2 + 5)
+        )
+        cls.expected = list(cls.post.comments.order_by('created', 'id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_chunk_inline(self):
+        """На странице поста только первая порция комментариев"""
+        response = self.client.get(POST_URL(POST_ID=self.post.id))
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.expected[:COMMENTS_LIMIT])
+        self.assertTrue(comments.has_next())
+        self.assertContains(
+            response,
+            f'{POST_COMMENTS_URL(POST_ID=self.post.id)}'
+            f'?after={comments.next_cursor}')
+
+    def test_chunks_cover_all_comments(self):
+        """Фрагменты по курсору отдают все комментарии по порядку"""
+        comments = self.client.get(
+            POST_URL(POST_ID=self.post.id)).context['comments']
+        loaded = list(comments)
+        while comments.has_next():
+            response = self.client.get(
+                POST_COMMENTS_URL(POST_ID=self.post.id),
+                {'after': comments.next_cursor})
+            self.assertTemplateNotUsed(response, 'base.html')
+            comments = response.context['comments']
+            self.assertLessEqual(len(comments), COMMENTS_LIMIT)
+            loaded += comments
+        self.assertEqual(loaded, self.expected)
+
+    def test_chunk_query_budget(self):
+        """Порция комментариев — один запрос"""
+        with self.assertNumQueries(1):
+            self.client.get(POST_COMMENTS_URL(POST_ID=self.post.id))
+
+    def test_missing_post(self):
+        """Для несуществующего поста фрагмент отвечает 404"""
+        response = self.client.get(POST_COMMENTS_URL(POST_ID=self.post.id + 1))
+        self.assertEqual(response.status_code, 404)
+
 
 class FollowViewsTest(TestCase):
     def setUp(self):
@@ -304,3 +552,538 @@ class FollowViewsTest(TestCase):
         self.assertEqual(len(response_follower.context['page_obj']), 1)
         response_authorized = self.authorized_client.get(FOLLOW_INDEX_URL())
         self.assertEqual(len(response_authorized.context['page_obj']), 0)
+
+    def test_new_post_fans_out_to_timeline(self):
+        """Новый пост раскладывается в ленты подписчиков"""
+        self.follower_client.get(FOLLOW_URL(USER_NAME=self.following))
+        post = Post.objects.create(author=self.following, text='Новая')
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        run_pending()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=post).exists())
+        response = self.follower_client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_unfollow_clears_timeline(self):
+        """После отписки посты автора пропадают из ленты"""
+        self.follower_client.get(FOLLOW_URL(USER_NAME=self.following))
+        self.follower_client.get(UNFOLLOW_URL(USER_NAME=self.following))
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.follower).exists())
+        response = self.follower_client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_pulled(self):
+        """Посты популярного автора подмешиваются в ленту при чтении"""
+        self.follower_client.get(FOLLOW_URL(USER_NAME=self.following))
+        Post.objects.create(author=self.following, text='Новая')
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.follower_client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_crosses_fanout_limit(self):
+        """Посты, написанные в режиме pull, остаются в ленте после
+        возвращения автора под порог раздачи"""
+        self.follower_client.get(FOLLOW_URL(USER_NAME=self.following))
+        self.authorized_client.get(FOLLOW_URL(USER_NAME=self.following))
+        post = Post.objects.create(author=self.following, text='Новая')
+        run_pending()
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.follower_client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(response.context['page_obj'][0], post)
+        self.authorized_client.get(UNFOLLOW_URL(USER_NAME=self.following))
+        run_pending()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=post).exists())
+        response = self.follower_client.get(FOLLOW_INDEX_URL())
+        self.assertEqual(list(response.context['page_obj']),
+                         [post, self.post])
+
+    @override_settings(TIMELINE_LENGTH=3)
+    def test_timeline_is_trimmed(self):
+        """Лента хранит ограниченное число записей"""
+        Post.objects.bulk_create(
+            Post(author=self.following, text=f'Запись {i}') for i in range(5)
+        )
+        self.follower_client.get(FOLLOW_URL(USER_NAME=self.following))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.follower).count(), 3)
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.b, cls.c, cls.d, cls.e = (
+            User.objects.create_user(username=name)
+            for name in ('reader', 'b', 'c', 'd', 'e'))
+        for user, author in ((cls.reader, cls.b), (cls.reader, cls.c),
+                             (cls.b, cls.d), (cls.c, cls.d), (cls.c, cls.e),
+                             (cls.e, cls.b)):
+            Follow.objects.create(user=user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        graph.graph.reset()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_adjacency(self):
+        """Соседи вершин отсортированы и правятся без пересборки"""
+        adjacency = graph.Adjacency([(1, 2), (1, 5), (3, 1)])
+        self.assertEqual(list(adjacency.neighbours(1)), [2, 5])
+        self.assertEqual(list(adjacency.neighbours(2)), [])
+        self.assertEqual(list(adjacency.neighbours(10)), [])
+        adjacency.add(1, 3)
+        adjacency.add(1, 3)
+        adjacency.add(10, 1)
+        adjacency.remove(3, 1)
+        self.assertEqual(list(adjacency.neighbours(1)), [2, 3, 5])
+        self.assertTrue(adjacency.has(10, 1))
+        self.assertEqual(adjacency.degree(3), 0)
+        with mock.patch('posts.graph.COMPACT_AFTER', 0):
+            adjacency.add(2, 1)
+        self.assertEqual(adjacency.patched, {})
+        self.assertEqual(
+            [list(adjacency.neighbours(v)) for v in (1, 2, 3, 10)],
+            [[2, 3, 5], [1], [], [1]])
+
+    def test_suggestions_and_known_followers(self):
+        """Подбор авторов и знакомые подписчики"""
+        self.assertEqual(graph.graph.suggestions(self.reader.id),
+                         [(self.d.id, 2), (self.e.id, 1)])
+        self.assertEqual(
+            graph.graph.followers_you_know(self.reader.id, self.d.id),
+            [self.b.id, self.c.id])
+        self.assertEqual(
+            graph.graph.followers_you_know(self.b.id, self.d.id), [])
+
+    def test_profile_widgets(self):
+        """Профиль показывает знакомых подписчиков и кого почитать"""
+        response = self.reader_client.get(PROFILE_URL(self.d.username))
+        self.assertEqual(response.context['known_followers'],
+                         [self.b, self.c])
+        self.assertEqual(response.context['suggested_authors'],
+                         [self.d, self.e])
+        self.assertContains(response, 'Кого почитать')
+        request = RequestFactory().get('/')
+        request.user = self.reader
+        response = viewsfunc.profile(request, self.d.username)
+        self.assertContains(response, 'Подписаны:')
+        self.assertNotContains(self.client.get(PROFILE_URL(self.d.username)),
+                               'Кого почитать')
+
+    def test_large_graph(self):
+        """Запросы к графу из 200 000 рёбер укладываются в миллисекунду"""
+        rng = random.Random(0)
+        pairs = [(user, author) for user in range(1, 20_000)
+                 for author in sorted(rng.sample(range(1, 20_000), 10))]
+        big = graph.FollowGraph()
+        big.following = graph.Adjacency(pairs)
+        big.followers = graph.Adjacency(sorted(
+            (author, user) for user, author in pairs))
+        big.checked = time.monotonic() + 60
+        started = time.perf_counter()
+        for user in range(1, 1001):
+            big.suggestions(user)
+            big.followers_you_know(user, user + 1)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.001)
+
+
+class FollowGraphJournalTest(TransactionTestCase):
+    """Граф меняется после фиксации подписки, поэтому тесты идут без
+    общей транзакции."""
+
+    def setUp(self):
+        cache.clear()
+        graph.graph.reset()
+        self.reader, self.b, self.c, self.d, self.e = (
+            User.objects.create_user(username=name)
+            for name in ('reader', 'b', 'c', 'd', 'e'))
+        for user, author in ((self.reader, self.b), (self.reader, self.c),
+                             (self.b, self.d), (self.c, self.d),
+                             (self.c, self.e), (self.e, self.b)):
+            Follow.objects.create(user=user, author=author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        graph.graph.reset()
+
+    def test_follow_views_update_graph(self):
+        """Подписка и отписка сразу меняют граф"""
+        graph.graph.ready()
+        self.reader_client.get(FOLLOW_URL(USER_NAME=self.e.username))
+        self.assertEqual(graph.graph.suggestions(self.reader.id),
+                         [(self.d.id, 2)])
+        self.reader_client.get(UNFOLLOW_URL(USER_NAME=self.c.username))
+        self.assertEqual(graph.graph.suggestions(self.reader.id),
+                         [(self.d.id, 1)])
+
+    def test_rolled_back_follow(self):
+        """Откаченная подписка не попадает ни в граф, ни в журнал"""
+        graph.graph.ready()
+        version = cache.get(graph.VERSION_KEY)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.e)
+            raise RuntimeError
+        self.assertFalse(graph.graph.following.has(self.reader.id, self.e.id))
+        self.assertEqual(cache.get(graph.VERSION_KEY), version)
+
+    @override_settings(FOLLOW_GRAPH_SYNC_INTERVAL=0)
+    def test_other_process_reads_journal(self):
+        """Граф другого процесса дочитывает изменения из журнала"""
+        other = graph.FollowGraph().ready()
+        graph.graph.ready()
+        Follow.objects.create(user=self.reader, author=self.d)
+        Follow.objects.filter(user=self.c, author=self.d).delete()
+        self.assertEqual(
+            other.followers_you_know(self.reader.id, self.d.id),
+            [self.b.id])
+        self.assertEqual(other.suggestions(self.reader.id),
+                         [(self.e.id, 1)])
+        cache.clear()
+        with self.assertNumQueries(2):
+            other.ready()
+
+    @override_settings(FOLLOW_GRAPH_SYNC_INTERVAL=0)
+    def test_lost_journal_entry(self):
+        """Потерянная запись журнала не останавливает сверку: граф
+        загружается заново"""
+        other = graph.FollowGraph().ready()
+        Follow.objects.create(user=self.reader, author=self.d)
+        Follow.objects.create(user=self.reader, author=self.e)
+        version = cache.get(graph.VERSION_KEY)
+        cache.delete(graph.change_key(version - 1))
+        other.ready()
+        self.assertFalse(other.following.has(self.reader.id, self.d.id))
+        other.ready()
+        self.assertTrue(other.following.has(self.reader.id, self.d.id))
+        self.assertTrue(other.following.has(self.reader.id, self.e.id))
+        self.assertEqual(other.version, version)
+
+
+class QueryCountTest(TestCase):
+    """Число запросов страницы не зависит от числа постов и комментариев."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_TEXT,
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'{AUTHOR_NAME}{i}')
+            for i in range(5)
+        ]
+        cls.reader = User.objects.create_user(username=USER_NAME)
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=cls.authors[i % 5],
+                text=f'Тестовый пост {i}',
+                group=cls.group if i % 2 else None,
+            )
+            for author in cls.authors[:3]:
+                Comment.objects.create(
+                    post=cls.post, author=author, text=COMMENT)
+        run_pending()
+
+    def setUp(self):
+        cache.clear()
+        # Граф подписок грузится один раз на процесс, а не в запросе.
+        graph.graph.reset()
+        graph.graph.ready()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_class_based_views(self):
+        """Классы-представления укладываются в бюджет запросов"""
+        budgets = {
+            INDEX_URL(): 1,
+            GROUP_URL(GROUP_SLUG=GROUP_SLUG): 3,
+            PROFILE_URL(USER_NAME=self.authors[0].username): 3,
+            POST_URL(POST_ID=self.post.id): 3,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                self.client.get(url)
+            with self.subTest(url=url, cached=True):
+                with self.assertNumQueries(0):
+                    self.client.get(url)
+        with self.assertNumQueries(3):
+            self.reader_client.get(FOLLOW_INDEX_URL())
+
+    def test_each_object_loaded_once(self):
+        """Группа, автор и пост грузятся один раз за запрос"""
+        author_client = Client()
+        author_client.force_login(self.post.author)
+        # Сессия и пользователь читаются из кэша.
+        budgets = {
+            GROUP_URL(GROUP_SLUG=GROUP_SLUG): 2,
+            PROFILE_URL(USER_NAME=self.authors[0].username): 3,
+            POST_URL(POST_ID=self.post.id): 2,
+            POST_EDIT_URL(POST_ID=self.post.id): 2,
+            POST_DELETE_URL(POST_ID=self.post.id): 1,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                author_client.get(url)
+
+    def test_function_views(self):
+        """Функции-представления укладываются в бюджет запросов"""
+        budgets = (
+            (viewsfunc.index, (), 1),
+            (viewsfunc.group_posts, (GROUP_SLUG,), 2),
+            (viewsfunc.profile, (self.authors[0].username,), 3),
+            (viewsfunc.post_detail, (self.post.id,), 2),
+            (viewsfunc.follow_index, (), 3),
+        )
+        for view, args, budget in budgets:
+            request = RequestFactory().get('/')
+            request.user = self.reader
+            with self.subTest(view=view.__name__):
+                with self.assertNumQueries(budget):
+                    view(request, *args)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username=AUTHOR_NAME, first_name='Иван', last_name='Петров')
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE, slug=GROUP_SLUG, description=GROUP_TEXT)
+        for i in range(3):
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'{POST_TEXT} {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username=USER_NAME)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def rendered_cards(self, url):
+        response = self.reader_client.get(url)
+        return sum(template.name == 'includes/article.html'
+                   for template in response.templates)
+
+    def test_feed_reuses_cards(self):
+        """Лента отрисовывает только карточки, которых нет в кэше"""
+        self.assertEqual(self.rendered_cards(INDEX_URL()), 3)
+        Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.rendered_cards(INDEX_URL()), 1)
+        self.assertEqual(self.rendered_cards(GROUP_URL(GROUP_SLUG)), 0)
+
+    def test_edit_bumps_version(self):
+        """Правка поста поднимает его версию и время изменения"""
+        post = Post.objects.first()
+        version, modified = post.version, post.modified
+        post.text = 'Изменённый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.version, version + 1)
+        self.assertGreater(post.modified, modified)
+        self.assertContains(self.reader_client.get(INDEX_URL()),
+                            'Изменённый текст')
+
+    def test_author_and_group_changes(self):
+        """Карточки меняются вслед за именем автора и группой"""
+        self.reader_client.get(INDEX_URL())
+        self.author.first_name = 'Пётр'
+        self.author.save()
+        self.assertContains(self.reader_client.get(INDEX_URL()), 'Пётр')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.reader_client.get(INDEX_URL()),
+                            'Новое название')
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertContains(self.reader_client.get(INDEX_URL()),
+                            'Группа не найдена', count=3)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_NAME)
+        cls.other = User.objects.create_user(username=USER_NAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE,
+            slug=GROUP_SLUG,
+            description=GROUP_TEXT,
+        )
+        cls.cats = Post.objects.create(
+            author=cls.author, group=cls.group,
+            text='Котики котики и ещё раз котики')
+        cls.cat = Post.objects.create(
+            author=cls.other, text='Один котик и собака')
+        cls.dog = Post.objects.create(
+            author=cls.author, text='Только собака')
+
+    def found(self, **params):
+        response = self.client.get(SEARCH_URL(), params)
+        return response.context['posts']
+
+    def check_backend(self):
+        self.assertEqual(self.found(q='котик'), [self.cats, self.cat])
+        self.assertEqual(self.found(q='котик собака'), [self.cat])
+        self.assertEqual(
+            self.found(q='котик', group=GROUP_SLUG), [self.cats])
+        self.assertEqual(self.found(q='собака', author=USER_NAME),
+                         [self.cat])
+        self.assertEqual(self.found(q='собака', author='nobody'), [])
+        post = Post.objects.get(pk=self.dog.pk)
+        post.text = 'Теперь про хомяка'
+        post.save()
+        self.assertEqual(self.found(q='хомяк'), [post])
+        post.delete()
+        self.assertEqual(self.found(q='хомяк'), [])
+
+    def test_fts5_search(self):
+        """Поиск через FTS5 ранжирует и фильтрует посты"""
+        self.assertIs(search.get_backend(), search.fts5_backend)
+        self.check_backend()
+
+    @override_settings(SEARCH_BACKEND='memory')
+    def test_memory_search(self):
+        """Запасной индекс в памяти ищет так же"""
+        search.memory_backend.rebuild()
+        self.check_backend()
+
+    @override_settings(SEARCH_BACKEND='memory')
+    def test_memory_search_other_worker(self):
+        """Индекс другого воркера узнаёт об изменениях через общий кэш"""
+        other = search.InvertedIndexBackend()
+        self.assertEqual(other.search('хомяк', 0, 10), [])
+        post = Post.objects.create(author=self.author, text='Про хомяка')
+        self.assertEqual(other.search('хомяк', 0, 10), [post.id])
+        post.delete()
+        self.assertEqual(other.search('хомяк', 0, 10), [])
+
+    @override_settings(SEARCH_BACKEND='memory')
+    def test_memory_search_filters_in_chunks(self):
+        """Фильтр по автору не упирается в лимит параметров SQLite"""
+        other = User.objects.create_user(username='other')
+        Post.objects.bulk_create(
+            Post(author=other, text=f'Котик номер {i}')
+            for i in range(search.FILTER_CHUNK + 5)
+        )
+        search.memory_backend.rebuild()
+        with mock.patch.object(search, 'FILTER_CHUNK', 100):
+            self.assertEqual(
+                self.found(q='котик', author=AUTHOR_NAME), [self.cats])
+
+    def test_search_pagination(self):
+        """Результаты поиска разбиты на страницы"""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Котик номер {i}')
+            for i in range(12)
+        )
+        search.get_backend().rebuild()
+        response = self.client.get(SEARCH_URL(), {'q': 'номер'})
+        self.assertEqual(len(response.context['posts']), 10)
+        self.assertTrue(response.context['has_next'])
+        response = self.client.get(SEARCH_URL(), {'q': 'номер', 'page': 2})
+        self.assertEqual(len(response.context['posts']), 2)
+        self.assertFalse(response.context['has_next'])
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR_NAME)
+        cls.reader = User.objects.create_user(username=USER_NAME)
+        cls.group = Group.objects.create(
+            title=GROUP_TITLE, slug=GROUP_SLUG, description=GROUP_TEXT)
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other', description=GROUP_TEXT)
+        cls.quiet = Post.objects.create(
+            author=cls.author, group=cls.group, text='Тихий пост')
+        cls.loud = Post.objects.create(
+            author=cls.author, group=cls.group, text='Обсуждаемый пост')
+        cls.outside = Post.objects.create(
+            author=cls.author, text='Пост без группы')
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(post=post, author=self.reader, text='Да')
+
+    def top(self, url=None):
+        return self.client.get(url or TRENDING_URL()).context['posts']
+
+    def test_comments_raise_post(self):
+        """Комментарии поднимают пост в популярном"""
+        self.comment(self.loud, 2)
+        self.assertEqual(self.top()[0], self.loud)
+        self.assertEqual(len(self.top()), 3)
+
+    def test_old_events_decay(self):
+        """Старые события весят меньше свежей публикации"""
+        self.comment(self.loud, 3)
+        two_days_ago = timezone.now() - timedelta(days=2)
+        Post.objects.filter(pk=self.loud.pk).update(pub_date=two_days_ago)
+        Comment.objects.update(created=two_days_ago)
+        trending.recompute()
+        self.assertEqual(self.top()[-1], self.loud)
+        Post.objects.filter(pk=self.loud.pk).update(
+            pub_date=timezone.now() - timedelta(days=30))
+        Comment.objects.all().delete()
+        trending.recompute()
+        self.assertNotIn(self.loud, self.top())
+
+    def test_group_top(self):
+        """Топ группы содержит только её посты и следует за правкой"""
+        self.comment(self.outside, 3)
+        self.assertEqual(self.top(GROUP_TRENDING_URL(GROUP_SLUG)),
+                         [self.loud, self.quiet])
+        post = Post.objects.get(pk=self.loud.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(self.top(GROUP_TRENDING_URL('other')), [post])
+        self.assertEqual(
+            self.client.get(GROUP_TRENDING_URL('missing')).status_code, 404)
+
+    def test_incremental_matches_recompute(self):
+        """Счёт из сигналов совпадает с пересчётом с нуля"""
+        self.comment(self.loud, 2)
+        self.comment(self.quiet)
+        incremental = dict(PostScore.objects.values_list('post_id', 'score'))
+        trending.recompute()
+        recomputed = dict(PostScore.objects.values_list('post_id', 'score'))
+        self.assertEqual(incremental.keys(), recomputed.keys())
+        for post_id, score in incremental.items():
+            self.assertAlmostEqual(score, recomputed[post_id], places=6)
+
+    def test_one_query(self):
+        """Популярное читается одним запросом"""
+        budgets = {
+            TRENDING_URL(): 1,
+            # Группа и её топ читаются одновременно.
+            GROUP_TRENDING_URL(GROUP_SLUG): 2,
+        }
+        for url, budget in budgets.items():
+            with self.subTest(url=url), self.assertNumQueries(budget):
+                self.client.get(url)
+        request = RequestFactory().get('/')
+        request.user = self.reader
+        with self.assertNumQueries(1):
+            viewsfunc.popular(request)
+
+    def test_recompute_command(self):
+        """Команда пересчитывает популярность с нуля"""
+        PostScore.objects.all().delete()
+        out = StringIO()
+        call_command('recompute_trending', stdout=out)
+        self.assertIn('постов 3', out.getvalue())
+        self.assertEqual(PostScore.objects.count(), 3)
@@ -0,0 +1,67 @@
+"""Миниатюры постов готовятся при загрузке, а не при показе страницы.
+
+PostCreate и PostEdit ставят картинку в фоновую очередь (posts.tasks),
+задача строит все размеры из POST_THUMBNAILS через sorl-thumbnail.
+Шаблоны только ищут готовую миниатюру в хранилище ключей sorl и, пока
+её нет, показывают исходную картинку.
+"""
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts import cache, cards
+from posts.models import Post
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, умеющий искать миниатюру без её построения."""
+
+    def get_options(self, source, options):
+        """Дополняет опции так же, как это делает get_thumbnail."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self.get_options(source, options))
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = PostThumbnailBackend()
+
+
+def ready(image, size):
+    """Готовая миниатюра размера size из POST_THUMBNAILS или None."""
+    if not image:
+        return None
+    geometry, options = settings.POST_THUMBNAILS[size]
+    return backend.get_ready_thumbnail(image, geometry, **options)
+
+
+def generate(name):
+    """Строит все размеры миниатюр для картинки из хранилища и
+    поднимает версию карточек постов, которые её показывают, и
+    поколения лент и страниц с ними: закэшированные до готовности
+    миниатюры фрагменты показывают исходную картинку.
+    """
+    for geometry, options in settings.POST_THUMBNAILS.values():
+        backend.get_thumbnail(name, geometry, **options)
+    posts = Post.objects.filter(image=name)
+    cards.touch(posts)
+    scopes = {cache.INDEX}
+    for post_id, author_id, group_id in posts.values_list(
+            'id', 'author_id', 'group_id'):
+        scopes.update(cache.post_detail_scopes(post_id, author_id, group_id))
+    cache.bump(*scopes)
@@ -0,0 +1,183 @@
+"""Лента подписок с раздачей постов при записи (fan-out-on-write).
+
+Новый пост сразу раскладывается в TimelineEntry всех подписчиков
+автора, и лента читателя становится одним диапазонным чтением по
+индексу (user, -pub_date). Авторы, у которых подписчиков больше
+TIMELINE_FANOUT_LIMIT, не раздаются: их посты подмешиваются в ленту
+при чтении (гибридный pull). Раздача и чтение решают это по одному
+счётчику UserStats.followers_count, поэтому автор всегда попадает ровно
+в один из путей; вернувшийся под порог автор раскладывается по лентам
+подписчиков заново (backfill_followers).
+"""
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+
+from posts.models import Follow, Post, TimelineEntry, UserStats
+from posts.utils import CursorPaginator
+
+# Сколько лент подписчиков заполнять одним bulk_create.
+BACKFILL_BATCH = 50
+
+
+def is_pulled(author_id):
+    """Автор читается через pull: подписчиков больше порога раздачи."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def dropped_to_push(author_id):
+    """Счётчик подписчиков автора только что опустился до порога."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def follower_ids(author_id):
+    """Подписчики автора или None, если автор читается через pull."""
+    if is_pulled(author_id):
+        return None
+    return list(Follow.objects.filter(author_id=author_id)
+                .values_list('user_id', flat=True))
+
+
+def pulled_author_ids(user_id):
+    """Авторы из подписок читателя, которые не раздаются по лентам."""
+    return list(
+        Follow.objects.filter(
+            user_id=user_id,
+            author__stats__followers_count__gt=(
+                settings.TIMELINE_FANOUT_LIMIT),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def trim(user_ids):
+    """Оставляет в лентах не больше TIMELINE_LENGTH последних записей."""
+    boundary = (
+        TimelineEntry.objects.filter(user_id=OuterRef('user_id'))
+        .order_by('-pub_date', '-post_id')
+        .values('pub_date')[settings.TIMELINE_LENGTH - 1:
+                            settings.TIMELINE_LENGTH]
+    )
+    TimelineEntry.objects.filter(
+        user_id__in=user_ids,
+        pub_date__lt=Subquery(boundary),
+    ).delete()
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    users = follower_ids(post.author_id)
+    if not users:
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post.id,
+                       author_id=post.author_id, pub_date=post.pub_date)
+         for user_id in users],
+        ignore_conflicts=True,
+    )
+    if post.id % settings.TIMELINE_TRIM_EVERY == 0:
+        trim(users)
+
+
+def recent_posts(author_id):
+    """Последние посты автора, которые помещаются в ленту."""
+    return list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'pub_date')[:settings.TIMELINE_LENGTH]
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними постами автора после подписки."""
+    if is_pulled(author_id):
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id,
+                       author_id=author_id, pub_date=pub_date)
+         for post_id, pub_date in recent_posts(author_id)],
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def backfill_followers(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков.
+
+    Нужно, когда автор опустился под порог раздачи: посты, написанные
+    в режиме pull, в ленты не попадали.
+    """
+    users = follower_ids(author_id)
+    if not users:
+        return
+    posts = recent_posts(author_id)
+    for start in range(0, len(users), BACKFILL_BATCH):
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post_id,
+                           author_id=author_id, pub_date=pub_date)
+             for user_id in users[start:start + BACKFILL_BATCH]
+             for post_id, pub_date in posts],
+            ignore_conflicts=True,
+        )
+    trim(users)
+
+
+def drop(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту читателя с нуля."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(user_id=user_id).values_list(
+        'author_id', flat=True)
+    for author_id in authors:
+        backfill(user_id, author_id)
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная пагинация ленты подписок.
+
+    Ключи страницы берутся из TimelineEntry, посты авторов с pull-чтением
+    добираются тем же keyset-условием, результаты сливаются по
+    (pub_date, id). object_list — queryset постов для загрузки страницы,
+    порядок ленты всегда убывающий.
+    """
+    entry_fields = ('pub_date', 'post_id')
+
+    def __init__(self, object_list, per_page, user):
+        super().__init__(object_list, per_page)
+        self.user = user
+
+    def fetch(self, values, forward):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        pulled = self.object_list.filter(
+            author_id__in=pulled_author_ids(self.user.id))
+        if values is not None:
+            entries = entries.filter(
+                self.keyset_filter(values, forward, self.entry_fields))
+            pulled = pulled.filter(self.keyset_filter(values, forward))
+        ordering = self.ordering if forward else self.reversed_ordering()
+        renamed = dict(zip(self.fields, self.entry_fields))
+        entry_ordering = [
+            order.replace(order.lstrip('-'), renamed[order.lstrip('-')])
+            for order in ordering
+        ]
+        post_ids = list(
+            entries.order_by(*entry_ordering)
+            .values_list('post_id', flat=True)[:self.per_page + 1]
+        )
+        rows = {self.key(post)[-1]: post
+                for post in self.object_list.filter(id__in=post_ids)}
+        for post in pulled.order_by(*ordering)[:self.per_page + 1]:
+            rows.setdefault(self.key(post)[-1], post)
+        rows = sorted(rows.values(), key=self.key, reverse=forward)
+        rows = rows[:self.per_page + 1]
+        if not forward:
+            rows.reverse()
+        return rows
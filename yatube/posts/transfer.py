@@ -0,0 +1,273 @@
+"""Потоковые выгрузка и загрузка данных yatube в JSONL.
+
+Каждая строка файла — одна запись: {"model": "post", "id": 5, ...}.
+Записи идут в порядке зависимостей (группы, пользователи, посты,
+комментарии, подписки), поэтому загрузка держит в памяти только
+текущую пачку. Соответствие старых id новым хранится во временной
+таблице базы, а не в словаре, и память не растёт с размером файла.
+Картинки постов переносятся только именами файлов.
+"""
+import datetime
+import gzip
+import io
+import json
+import sys
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post, User
+
+FORMAT = 'yatube'
+VERSION = 1
+MAP_TABLE = 'yatube_import_map'
+LOOKUP_CHUNK = 500
+
+EXPORTED = {
+    'group': (Group, ('id', 'title', 'slug', 'description')),
+    'user': (User, ('id', 'username', 'password', 'first_name',
+                    'last_name', 'email', 'is_active', 'is_staff',
+                    'is_superuser', 'date_joined')),
+    'post': (Post, ('id', 'author_id', 'group_id', 'text', 'pub_date',
+                    'image', 'image_width', 'image_height')),
+    'comment': (Comment, ('id', 'post_id', 'author_id', 'text',
+                          'created')),
+    'follow': (Follow, ('id', 'user_id', 'author_id')),
+}
+
+
+@contextmanager
+def open_stream(path, mode):
+    """Файл, stdin/stdout для «-»; сжатие gzip по расширению .gz.
+
+    stdin и stdout процесса после выхода из блока остаются открытыми.
+    """
+    if path != '-':
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, mode + 't', encoding='utf-8') as stream:
+            yield stream
+        return
+    stream = sys.stdin if mode == 'r' else sys.stdout
+    wrapper = io.TextIOWrapper(stream.buffer, encoding='utf-8')
+    try:
+        yield wrapper
+    finally:
+        wrapper.flush()
+        wrapper.detach()
+
+
+def export_rows(chunk_size):
+    """Записи для выгрузки, по одной, без загрузки таблиц в память."""
+    yield {'format': FORMAT, 'version': VERSION}
+    for name, (model, fields) in EXPORTED.items():
+        rows = (model.objects.order_by('pk').values_list(*fields)
+                .iterator(chunk_size=chunk_size))
+        for row in rows:
+            yield {'model': name, **dict(zip(fields, row))}
+
+
+def encode(value):
+    """Даты пишутся с микросекундами, чтобы не сломать порядок лент."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def export(stream, chunk_size=2000, progress=None):
+    counts = dict.fromkeys(EXPORTED, 0)
+    for record in export_rows(chunk_size):
+        stream.write(json.dumps(record, default=encode, ensure_ascii=False))
+        stream.write('\n')
+        name = record.get('model')
+        if name:
+            counts[name] += 1
+            if progress:
+                progress(name, counts[name])
+    return counts
+
+
+@contextmanager
+def raw_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create сохранил даты из файла.
+    """
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Importer:
+    """Загружает записи пачками по batch_size, каждую в своей транзакции.
+
+    Пользователи сопоставляются по username, группы по slug: уже
+    существующие не создаются заново. Записи, чьи связи не нашлись в
+    файле или базе, пропускаются и попадают в skipped.
+    """
+
+    def __init__(self, batch_size=500, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.loaded = dict.fromkeys(EXPORTED, 0)
+        self.skipped = dict.fromkeys(EXPORTED, 0)
+
+    def run(self, lines):
+        lines = iter(lines)
+        header = json.loads(next(lines, 'null'))
+        if not isinstance(header, dict) or header.get('format') != FORMAT:
+            raise ValueError('Файл не похож на выгрузку yatube')
+        if header.get('version') != VERSION:
+            raise ValueError(
+                f'Неизвестная версия выгрузки: {header.get("version")}')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {MAP_TABLE} ('
+                f'kind VARCHAR(16) NOT NULL, old_id BIGINT NOT NULL, '
+                f'new_id BIGINT NOT NULL, PRIMARY KEY (kind, old_id))')
+        try:
+            name, batch = None, []
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('model') not in EXPORTED:
+                    raise ValueError(
+                        f'Неизвестная модель: {record.get("model")}')
+                if batch and (record['model'] != name
+                              or len(batch) >= self.batch_size):
+                    self.flush(name, batch)
+                    batch = []
+                name = record['model']
+                batch.append(record)
+            if batch:
+                self.flush(name, batch)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {MAP_TABLE}')
+        return self.loaded, self.skipped
+
+    def flush(self, name, batch):
+        with transaction.atomic(), raw_dates(
+                Post._meta.get_field('pub_date'),
+                Comment._meta.get_field('created')):
+            getattr(self, f'load_{name}')(batch)
+        if self.progress:
+            self.progress(name, self.loaded[name])
+
+    def mapping(self, kind, old_ids):
+        old_ids = list({old_id for old_id in old_ids if old_id is not None})
+        found = {}
+        with connection.cursor() as cursor:
+            for start in range(0, len(old_ids), LOOKUP_CHUNK):
+                chunk = old_ids[start:start + LOOKUP_CHUNK]
+                cursor.execute(
+                    f'SELECT old_id, new_id FROM {MAP_TABLE} '
+                    f'WHERE kind = %s AND old_id IN '
+                    f'({", ".join(["%s"] * len(chunk))})',
+                    [kind, *chunk])
+                found.update(cursor.fetchall())
+        return found
+
+    def remember(self, kind, pairs):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {MAP_TABLE} (kind, old_id, new_id) '
+                f'VALUES (%s, %s, %s)',
+                [(kind, old_id, new_id) for old_id, new_id in pairs])
+
+    def create(self, model, objects):
+        """bulk_create, возвращающий id созданных строк по порядку.
+
+        Там, где база не возвращает id после вставки (SQLite), они
+        берутся как последние id таблицы: вставка идёт в транзакции,
+        и чужих строк между ними нет.
+        """
+        objects = model.objects.bulk_create(objects)
+        if objects and objects[0].pk is None:
+            ids = list(model.objects.order_by('-pk').values_list(
+                'pk', flat=True)[:len(objects)])
+            return ids[::-1]
+        return [obj.pk for obj in objects]
+
+    def load_by_key(self, name, model, key, batch, build):
+        existing = dict(model.objects.filter(
+            **{f'{key}__in': [record[key] for record in batch]}
+        ).values_list(key, 'pk'))
+        fresh = [record for record in batch if record[key] not in existing]
+        ids = self.create(model, [build(record) for record in fresh])
+        pairs = [(record['id'], existing[record[key]])
+                 for record in batch if record[key] in existing]
+        pairs += [(record['id'], new_id)
+                  for record, new_id in zip(fresh, ids)]
+        self.remember(name, pairs)
+        self.loaded[name] += len(batch)
+
+    def load_group(self, batch):
+        self.load_by_key('group', Group, 'slug', batch, lambda record: Group(
+            title=record['title'], slug=record['slug'],
+            description=record['description']))
+
+    def load_user(self, batch):
+        def build(record):
+            fields = EXPORTED['user'][1][1:]
+            user = User(**{name: record[name] for name in fields})
+            user.date_joined = parse_datetime(record['date_joined'])
+            return user
+        self.load_by_key('user', User, 'username', batch, build)
+
+    def load_post(self, batch):
+        users = self.mapping('user', [record['author_id']
+                                      for record in batch])
+        groups = self.mapping('group', [record['group_id']
+                                        for record in batch])
+        kept = [record for record in batch if record['author_id'] in users]
+        self.skipped['post'] += len(batch) - len(kept)
+        ids = self.create(Post, [
+            Post(author_id=users[record['author_id']],
+                 group_id=groups.get(record['group_id']),
+                 text=record['text'],
+                 pub_date=parse_datetime(record['pub_date']),
+                 image=record['image'] or None,
+                 image_width=record.get('image_width'),
+                 image_height=record.get('image_height'))
+            for record in kept
+        ])
+        self.remember('post', [(record['id'], new_id)
+                               for record, new_id in zip(kept, ids)])
+        self.loaded['post'] += len(kept)
+
+    def load_comment(self, batch):
+        posts = self.mapping('post', [record['post_id'] for record in batch])
+        users = self.mapping('user', [record['author_id']
+                                      for record in batch])
+        kept = [record for record in batch
+                if record['post_id'] in posts
+                and record['author_id'] in users]
+        self.skipped['comment'] += len(batch) - len(kept)
+        Comment.objects.bulk_create([
+            Comment(post_id=posts[record['post_id']],
+                    author_id=users[record['author_id']],
+                    text=record['text'],
+                    created=parse_datetime(record['created']))
+            for record in kept
+        ])
+        self.loaded['comment'] += len(kept)
+
+    def load_follow(self, batch):
+        users = self.mapping('user', [
+            user_id for record in batch
+            for user_id in (record['user_id'], record['author_id'])])
+        kept = [record for record in batch
+                if record['user_id'] in users
+                and record['author_id'] in users
+                and users[record['user_id']] != users[record['author_id']]]
+        self.skipped['follow'] += len(batch) - len(kept)
+        Follow.objects.bulk_create([
+            Follow(user_id=users[record['user_id']],
+                   author_id=users[record['author_id']])
+            for record in kept
+        ], ignore_conflicts=True)
+        self.loaded['follow'] += len(kept)
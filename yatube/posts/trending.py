@@ -0,0 +1,123 @@
+"""Популярные посты.
+
+Счёт поста — сумма весов его событий: публикации (с поправкой на
+число подписчиков автора) и комментариев. Вместо того чтобы остужать
+старые счёты, вес события удваивается каждые TRENDING_HALF_LIFE
+секунд от общей точки отсчёта EPOCH (forward decay): порядок постов по
+такой сумме в любой момент тот же, что по затухающим весам. Событие
+прибавляется к строке PostScore при записи, чтобы не переполниться,
+хранится log2 суммы. Топ сайта и группы читается одним запросом по
+индексу, команда recompute_trending пересчитывает счёты с нуля.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from posts.models import Comment, Post, PostScore, UserStats
+
+EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+# Сколько раз record пробует обновить счёт, пока его меняют другие.
+CAS_ATTEMPTS = 10
+
+
+def event_score(weight, when):
+    """log2 веса события, отнесённого к EPOCH."""
+    return (math.log2(weight)
+            + (when - EPOCH).total_seconds() / settings.TRENDING_HALF_LIFE)
+
+
+def log_add(first, second):
+    """log2(2**first + 2**second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def post_weight(followers):
+    weights = settings.TRENDING_WEIGHTS
+    return weights['post'] + weights['reach'] * math.log2(1 + followers)
+
+
+def record(post_id, group_id, score):
+    """Прибавляет событие к счёту поста.
+
+    Счёт меняется сравнением с обменом по прежнему значению, поэтому
+    одновременные события не теряют друг друга ни в одной базе.
+    Не успевшее за CAS_ATTEMPTS событие вернёт recompute_trending.
+    """
+    for _ in range(CAS_ATTEMPTS):
+        current = (PostScore.objects.filter(post_id=post_id)
+                   .values_list('score', flat=True).first())
+        if current is None:
+            try:
+                with transaction.atomic():
+                    PostScore.objects.create(
+                        post_id=post_id, group_id=group_id, score=score)
+                return
+            except IntegrityError:
+                continue
+        if PostScore.objects.filter(post_id=post_id, score=current).update(
+                score=log_add(current, score)):
+            return
+
+
+def post_published(post):
+    followers = (UserStats.objects.filter(user_id=post.author_id)
+                 .values_list('followers_count', flat=True).first())
+    record(post.id, post.group_id,
+           event_score(post_weight(followers or 0), post.pub_date))
+
+
+def comment_added(comment):
+    record(comment.post_id, comment.post.group_id, event_score(
+        settings.TRENDING_WEIGHTS['comment'], comment.created))
+
+
+def move(post_id, group_id):
+    """Переносит счёт поста в топ его новой группы."""
+    PostScore.objects.filter(post_id=post_id).update(group_id=group_id)
+
+
+def top(group_slug=None):
+    """Самые популярные посты сайта или группы."""
+    scores = PostScore.objects.select_related('post__author', 'post__group')
+    if group_slug is not None:
+        scores = scores.filter(group__slug=group_slug)
+    return [score.post for score in
+            scores.order_by('-score')[:settings.TRENDING_SIZE]]
+
+
+def recompute(now=None):
+    """Пересчитывает все счёты по событиям за TRENDING_WINDOW.
+
+    Посты без событий в окне из PostScore удаляются. Возвращает число
+    постов с новым счётом.
+    """
+    since = (now or timezone.now()) - timedelta(
+        seconds=settings.TRENDING_WINDOW)
+    scores = {}
+    groups = {}
+    posts = Post.objects.filter(pub_date__gte=since).values_list(
+        'id', 'group_id', 'pub_date', 'author__stats__followers_count')
+    for post_id, group_id, pub_date, followers in posts.iterator():
+        scores[post_id] = event_score(post_weight(followers or 0), pub_date)
+        groups[post_id] = group_id
+    comments = Comment.objects.filter(created__gte=since).values_list(
+        'post_id', 'post__group_id', 'created')
+    for post_id, group_id, created in comments.iterator():
+        score = event_score(settings.TRENDING_WEIGHTS['comment'], created)
+        if post_id in scores:
+            score = log_add(scores[post_id], score)
+        scores[post_id] = score
+        groups[post_id] = group_id
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        PostScore.objects.bulk_create(
+            (PostScore(post_id=post_id, group_id=groups[post_id],
+                       score=score)
+             for post_id, score in scores.items()),
+            batch_size=500,
+        )
+    return len(scores)
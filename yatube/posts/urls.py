@@ -7,6 +7,11 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.Index.as_view(), name='index'),
     path('group/<slug:slug>/', views.GroupPost.as_view(), name='group_list'),
+    path('trending/', views.Trending.as_view(), name='trending'),
+    path(
+        'group/<slug:slug>/trending/',
+        views.Trending.as_view(),
+        name='group_trending'),
     path('profile/<str:username>/', views.Profile.as_view(), name='profile'),
     path(
         'posts/<int:post_id>/',
@@ -21,11 +26,16 @@ urlpatterns = [
         'posts/<int:post_id>/delete/',
         views.DeletePost.as_view(),
         name='post_delete'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.PostComments.as_view(),
+        name='post_comments'),
     path(
         'posts/<int:post_id>/comment/',
         views.AddComment.as_view(),
         name='add_comment'),
     path('follow/', views.FollowIndex.as_view(), name='follow_index'),
+    path('search/', views.Search.as_view(), name='search'),
     path(
         'profile/<str:username>/follow/',
         views.ProfileFollow.as_view(),
@@ -1,8 +1,198 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+
+LIMIT = 10
+FEED_ORDERING = ('-pub_date', '-id')
+COMMENTS_LIMIT = 20
+COMMENTS_ORDERING = ('created', 'id')
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = json.dumps(
+        [value.isoformat() if hasattr(value, 'isoformat') else value
+         for value in values],
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model, fields):
+    """Распаковывает токен обратно в значения ключа сортировки.
+
+    Для испорченного токена возвращает None.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [
+            model._meta.get_field(name).to_python(value)
+            for name, value in zip(fields, values)
+        ]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+class CursorPage(Sequence):
+    """Страница ленты, выбранная по курсору, а не по номеру."""
+    is_cursor = True
+
+    def __init__(self, object_list, cursor='', next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage {self.cursor or "first"}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по уникальному ключу сортировки.
+
+    Вместо COUNT(*) и OFFSET строит условие по ключу последней
+    показанной записи, поэтому стоимость страницы не зависит от её
+    глубины. Последнее поле ordering должно быть уникальным. Работает
+    и с объектами, и со словарями из values().
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def key(self, obj):
+        if isinstance(obj, dict):
+            return [obj[name] for name in self.fields]
+        return [getattr(obj, name) for name in self.fields]
+
+    def keyset_filter(self, values, forward=True, fields=None):
+        """Условие «строго после ключа» в порядке ordering
+        (или строго перед ним, если forward=False).
+
+        fields позволяет применить условие к полям с другими именами.
+        """
+        fields = fields or self.fields
+        condition = Q()
+        for position, order in enumerate(self.ordering):
+            descending = order.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            prefix = dict(zip(fields[:position], values[:position]))
+            condition |= Q(
+                **prefix,
+                **{f'{fields[position]}__{lookup}': values[position]}
+            )
+        return condition
+
+    def reversed_ordering(self):
+        return [
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in self.ordering
+        ]
+
+    def fetch(self, values, forward):
+        """Выбирает per_page + 1 записей от ключа в нужную сторону."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(values, forward))
+        ordering = self.ordering if forward else self.reversed_ordering()
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        if not forward:
+            rows.reverse()
+        return rows
+
+    def decode(self, token):
+        if not token:
+            return None
+        return decode_cursor(token, self.object_list.model, self.fields)
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before.
+
+        Без курсоров (или с испорченным курсором) отдаёт первую страницу.
+        """
+        before_values = self.decode(before)
+        if before_values is not None:
+            rows = self.fetch(before_values, forward=False)
+            has_more = len(rows) > self.per_page
+            rows = rows[-self.per_page:] if has_more else rows
+            return CursorPage(
+                rows,
+                cursor=f'before:{before}',
+                next_cursor=encode_cursor(self.key(rows[-1]))
+                if rows else before,
+                previous_cursor=encode_cursor(self.key(rows[0]))
+                if has_more and rows else None,
+            )
+        after_values = self.decode(after)
+        rows = self.fetch(after_values, forward=True)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        previous_cursor = None
+        if after_values is not None:
+            previous_cursor = (encode_cursor(self.key(rows[0]))
+                               if rows else after)
+        return CursorPage(
+            rows,
+            cursor=f'after:{after}' if after_values is not None else '',
+            next_cursor=encode_cursor(self.key(rows[-1]))
+            if has_more else None,
+            previous_cursor=previous_cursor,
+        )
+
+
+class CursorPaginationMixin:
+    """Подключает курсорную пагинацию к ListView.
+
+    Старые ссылки вида ?page=N продолжают работать через Paginator.
+    """
+    cursor_ordering = FEED_ORDERING
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return CursorPaginator(queryset, page_size, self.cursor_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.page_kwarg in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_cursor_paginator(queryset, page_size)
+        page = paginator.get_page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
-def pagin(posts, request):
-    LIMIT = 10
-    paginator = Paginator(posts, LIMIT)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def pagin(posts, request, cursor_paginator=None):
+    if 'page' in request.GET:
+        paginator = Paginator(posts, LIMIT)
+        return paginator.get_page(request.GET.get('page'))
+    cursor_paginator = cursor_paginator or CursorPaginator(posts, LIMIT)
+    return cursor_paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
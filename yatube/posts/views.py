@@ -1,46 +1,85 @@
+from functools import partial
+
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib.auth import get_user_model
 from django.views.generic import (ListView, CreateView, DeleteView,
-                                  DetailView, UpdateView, View)
-
+                                  DetailView, TemplateView, UpdateView, View)
+
+from core.concurrency import gather
+from core.routers import UsePrimaryMixin
+from core.throttling import ThrottleMixin
+from posts import graph, tasks, trending
+from posts.cache import (AnonymousPageCacheMixin, FragmentCacheMixin,
+                         group_scope, lookup, post_detail_scopes,
+                         profile_scope)
 from posts.models import Follow, Post, Group, User, Comment
-from posts.forms import PostForm, CommentForm
+from posts.forms import PostForm, CommentForm, SearchForm
+from posts.identity import IdentityMapMixin
 from posts.def_uls import (PROFILE_URL, POST_URL, POST_EDIT_URL,
                            POST_CREATE_URL, LOGIN_URL)
+from posts.search import get_backend
+from posts.timeline import TimelinePaginator
+from posts.utils import (COMMENTS_LIMIT, COMMENTS_ORDERING, LIMIT,
+                         CursorPaginationMixin, CursorPaginator)
 
 
-LIMIT = 10
-
-
-class Index(ListView):
+class Index(AnonymousPageCacheMixin, FragmentCacheMixin,
+            CursorPaginationMixin, ListView):
     model = Post
     template_name: str = 'posts/index.html'
     paginate_by: int = LIMIT
 
+    def get_queryset(self):
+        return Post.objects.select_related('author', 'group')
+
 
-class GroupPost(ListView, LoginRequiredMixin):
+class GroupPost(AnonymousPageCacheMixin, FragmentCacheMixin,
+                IdentityMapMixin, CursorPaginationMixin, ListView,
+                LoginRequiredMixin):
     model = Group
     template_name: str = 'posts/group_list.html'
     paginate_by: int = LIMIT
     context_object_name: str = 'group'
 
+    def get_group(self):
+        return self.get_once(self.model.objects, slug=self.kwargs.get('slug'))
+
     def get_queryset(self):
-        return get_object_or_404(
-            self.model,
-            slug=self.kwargs.get('slug')
-        ).posts.all()
+        return Post.objects.filter(
+            group__slug=self.kwargs.get('slug')
+        ).select_related('author', 'group')
+
+    def paginate_queryset(self, queryset, page_size):
+        # Группа и страница постов не зависят друг от друга.
+        _, pagination = gather(
+            self.get_group,
+            partial(super().paginate_queryset, queryset, page_size))
+        return pagination
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['group'] = get_object_or_404(
-            self.model,
-            slug=self.kwargs.get('slug')
-        )
+        context['group'] = self.get_group()
         return context
 
+    def get_fragment_scope(self, context):
+        return group_scope(context['group'].id)
+
+    def get_page_scopes(self):
+        slug = self.kwargs.get('slug')
+        found = lookup('group', slug, Group.objects.filter(slug=slug), 'id')
+        if found is None:
+            return None
+        return [group_scope(*found)]
+
+    def get_rendered_scopes(self, context):
+        return [group_scope(context['group'].id)]
 
-class PostCreate(CreateView, LoginRequiredMixin):
+
+class PostCreate(ThrottleMixin, UsePrimaryMixin, CreateView,
+                 LoginRequiredMixin):
+    throttle_scope = 'post'
     form_class = PostForm
     template_name: str = 'posts/create_post.html'
 
@@ -53,10 +92,12 @@ class PostCreate(CreateView, LoginRequiredMixin):
         form = form.save(commit=False)
         form.author = self.request.user
         form.save()
+        tasks.schedule_thumbnails(form)
         return redirect(PROFILE_URL(self.request.user))
 
 
-class PostEdit(UpdateView, LoginRequiredMixin):
+class PostEdit(UsePrimaryMixin, IdentityMapMixin, UpdateView,
+               LoginRequiredMixin):
     model = Post
     form_class = PostForm
     template_name: str = 'posts/create_post.html'
@@ -64,66 +105,102 @@ class PostEdit(UpdateView, LoginRequiredMixin):
     context_object_name: str = 'post'
     extra_context = {'post_edit_flag': True}
 
+    def get_object(self, queryset=None):
+        return self.get_once(self.model.objects, pk=self.kwargs['post_id'])
+
     def dispatch(self, request, *args, **kwargs):
-        obj = super().get_object()
-        if (obj.author != self.request.user
-           and self.request.user.is_authenticated):
-            return redirect(POST_URL(self.kwargs['post_id']))
         if self.request.user.is_anonymous:
             return redirect(LOGIN_URL()
                             + POST_EDIT_URL(self.kwargs['post_id']))
+        if self.get_object().author_id != self.request.user.id:
+            return redirect(POST_URL(self.kwargs['post_id']))
         return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            tasks.schedule_thumbnails(post)
         return redirect(POST_URL(self.kwargs['post_id']))
 
 
-class DeletePost(DeleteView, LoginRequiredMixin):
+class DeletePost(UsePrimaryMixin, IdentityMapMixin, DeleteView,
+                 LoginRequiredMixin):
     model = Post
     success_url = '/'
     pk_url_kwarg: str = 'post_id'
     template_name: str = 'posts/post_delete.html'
 
+    def get_object(self, queryset=None):
+        return self.get_once(self.model.objects, pk=self.kwargs['post_id'])
+
     def dispatch(self, request, *args, **kwargs):
-        obj = super().get_object()
-        if (obj.author != self.request.user
-           and self.request.user.is_authenticated):
-            return redirect(POST_URL(self.kwargs['post_id']))
         if self.request.user.is_anonymous:
             return redirect(LOGIN_URL()
                             + POST_URL(self.kwargs['post_id']))
+        if self.get_object().author_id != self.request.user.id:
+            return redirect(POST_URL(self.kwargs['post_id']))
         return super().dispatch(request, *args, **kwargs)
 
 
-class Profile(ListView):
+class Profile(AnonymousPageCacheMixin, FragmentCacheMixin,
+              IdentityMapMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name: str = 'posts/profile.html'
     paginate_by: int = LIMIT
     user = None
 
+    def get_author(self):
+        return self.get_once(User.objects.select_related('stats'),
+                             username=self.kwargs.get('username'))
+
     def get_queryset(self):
-        return get_object_or_404(
-            get_user_model(),
-            username=self.kwargs.get('username')
-        ).posts.all()
+        return Post.objects.filter(
+            author__username=self.kwargs.get('username')
+        ).select_related('author', 'group')
+
+    def get_following(self, user):
+        return Follow.objects.filter(
+            user=user, author__username=self.kwargs.get('username')
+        ).exists()
+
+    def paginate_queryset(self, queryset, page_size):
+        # Автор, подписка и страница постов ищутся по username
+        # одновременно.
+        calls = [self.get_author,
+                 partial(super().paginate_queryset, queryset, page_size)]
+        user = self.request.user
+        if user.is_authenticated:
+            calls.append(partial(self.get_following, user))
+        _, pagination, *following = gather(*calls)
+        self.following = following
+        return pagination
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        author = get_object_or_404(
-            User,
-            username=self.kwargs.get('username')
-        )
-        context['author'] = author
-        if self.request.user.is_authenticated:
-            context['following'] = Follow.objects.filter(
-                user=self.request.user,
-                author=author).exists()
+        context['author'] = self.get_author()
+        if self.following:
+            context['following'] = self.following[0]
+            context.update(graph.profile_context(
+                self.request.user, context['author']))
         context['page_obj'] = context.pop('page_obj')
         return context
 
+    def get_fragment_scope(self, context):
+        return profile_scope(context['author'].id)
+
+    def get_page_scopes(self):
+        username = self.kwargs.get('username')
+        found = lookup(
+            'user', username, User.objects.filter(username=username), 'id')
+        if found is None:
+            return None
+        return [profile_scope(*found)]
+
+    def get_rendered_scopes(self, context):
+        return [profile_scope(context['author'].id)]
 
-class PostDetail(DetailView):
+
+class PostDetail(AnonymousPageCacheMixin, IdentityMapMixin, DetailView):
     form_class = CommentForm
     model = Post
     template_name: str = 'posts/post_detail.html'
@@ -131,27 +208,66 @@ class PostDetail(DetailView):
     pk_url_kwarg: str = 'post_id '
 
     def get_object(self):
-        return get_object_or_404(self.model, pk=self.kwargs.get('post_id'))
+        return self.get_once(self.get_queryset(),
+                             pk=self.kwargs.get('post_id'))
 
     def get_queryset(self):
-        return get_object_or_404(
-            self.model,
-            pk=self.kwargs.get('post_id')
-        ).comments.all()
+        return self.model.objects.select_related('author__stats', 'group')
+
+    def get(self, request, *args, **kwargs):
+        # Пост и первая порция комментариев грузятся одновременно.
+        self.object, self.comments = gather(
+            self.get_object,
+            partial(comments_page, self.kwargs.get('post_id')))
+        return self.render_to_response(
+            self.get_context_data(object=self.object))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['post'] = get_object_or_404(
-            self.model,
-            pk=self.kwargs.get('post_id')
-        )
+        context['post'] = self.object
         context['form'] = CommentForm(self.request.POST or None)
-        context['comments'] = Comment.objects.filter(
-            post=context['post']).all()
+        context['comments'] = self.comments
+        return context
+
+    def get_page_scopes(self):
+        post_id = self.kwargs.get('post_id')
+        found = lookup('post', post_id, Post.objects.filter(pk=post_id),
+                       'author_id', 'group_id')
+        if found is None:
+            return None
+        return post_detail_scopes(post_id, *found)
+
+    def get_rendered_scopes(self, context):
+        post = context['post']
+        return post_detail_scopes(post.id, post.author_id, post.group_id)
+
+
+def comments_page(post_id, after=None):
+    """Порция комментариев поста в хронологическом порядке."""
+    return CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        COMMENTS_LIMIT,
+        COMMENTS_ORDERING,
+    ).get_page(after=after)
+
+
+class PostComments(TemplateView):
+    """Следующая порция комментариев для подгрузки на странице поста."""
+    template_name: str = 'posts/includes/comments_chunk.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        post_id = self.kwargs['post_id']
+        comments = comments_page(post_id, self.request.GET.get('after'))
+        if not comments and not Post.objects.filter(pk=post_id).exists():
+            raise Http404
+        context['comments'] = comments
         return context
 
 
-class AddComment(DetailView, LoginRequiredMixin):
+class AddComment(ThrottleMixin, UsePrimaryMixin, DetailView,
+                 LoginRequiredMixin):
+    throttle_scope = 'comment'
     model = Post
     pk_url_kwarg: str = 'post_id'
     form_class = CommentForm
@@ -173,7 +289,7 @@ class AddComment(DetailView, LoginRequiredMixin):
         return redirect(POST_URL(self.kwargs['post_id']))
 
 
-class FollowIndex(ListView, LoginRequiredMixin):
+class FollowIndex(CursorPaginationMixin, ListView, LoginRequiredMixin):
     model = Post
     template_name: str = 'posts/follow.html'
     paginate_by: int = LIMIT
@@ -187,7 +303,16 @@ class FollowIndex(ListView, LoginRequiredMixin):
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Post.objects.filter(author__following__user=self.user)
+        return Post.objects.filter(
+            author__following__user=self.user
+        ).select_related('author', 'group')
+
+    def get_cursor_paginator(self, queryset, page_size):
+        return TimelinePaginator(
+            Post.objects.select_related('author', 'group'),
+            page_size,
+            self.user
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -195,7 +320,10 @@ class FollowIndex(ListView, LoginRequiredMixin):
         return context
 
 
-class ProfileFollow(LoginRequiredMixin, View):
+class ProfileFollow(ThrottleMixin, UsePrimaryMixin, LoginRequiredMixin,
+                    View):
+    throttle_scope = 'follow'
+    throttle_methods = ('GET',)
 
     def get(self, request, *args, **kwargs):
         author = get_object_or_404(
@@ -207,7 +335,10 @@ class ProfileFollow(LoginRequiredMixin, View):
         return redirect(PROFILE_URL(self.kwargs['username']))
 
 
-class ProfileUnfollow(LoginRequiredMixin, View):
+class ProfileUnfollow(ThrottleMixin, UsePrimaryMixin, LoginRequiredMixin,
+                      View):
+    throttle_scope = 'follow'
+    throttle_methods = ('GET',)
 
     def get(self, request, *args, **kwargs):
         author = get_object_or_404(
@@ -217,3 +348,64 @@ class ProfileUnfollow(LoginRequiredMixin, View):
         if request.user != author:
             Follow.objects.filter(user=request.user, author=author).delete()
         return redirect(PROFILE_URL(self.kwargs['username']))
+
+
+class Search(TemplateView):
+    template_name: str = 'posts/search.html'
+
+    def get_page_number(self):
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            return 1
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = SearchForm(self.request.GET or None)
+        context['form'] = form
+        if not form.is_valid():
+            return context
+        author_id = None
+        if form.cleaned_data['author']:
+            author_id = User.objects.filter(
+                username=form.cleaned_data['author']
+            ).values_list('id', flat=True).first() or 0
+        group = form.cleaned_data['group']
+        page = self.get_page_number()
+        ids = get_backend().search(
+            form.cleaned_data['q'],
+            offset=(page - 1) * LIMIT,
+            limit=LIMIT + 1,
+            group_id=group.id if group else None,
+            author_id=author_id,
+        )
+        found = Post.objects.select_related('author', 'group').in_bulk(
+            ids[:LIMIT])
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        context.update({
+            'posts': [found[post_id] for post_id in ids[:LIMIT]
+                      if post_id in found],
+            'page_number': page,
+            'has_next': len(ids) > LIMIT,
+            'query': params.urlencode(),
+        })
+        return context
+
+
+class Trending(IdentityMapMixin, TemplateView):
+    """Популярные посты сайта или группы из готового рейтинга."""
+    template_name: str = 'posts/trending.html'
+
+    def get_group(self):
+        return self.get_once(Group.objects, slug=self.kwargs['slug'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        slug = self.kwargs.get('slug')
+        if slug is None:
+            context['posts'] = trending.top()
+            return context
+        context['group'], context['posts'] = gather(
+            self.get_group, partial(trending.top, slug))
+        return context
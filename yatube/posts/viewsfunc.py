@@ -1,31 +1,42 @@
 from django.contrib.auth.decorators import login_required
+from django.http import Http404
 from django.shortcuts import redirect, render, get_object_or_404
 
-from posts.models import Follow, Post, Group, User
+from core.routers import use_primary
+from core.throttling import throttle
+from posts import graph, tasks, trending
+from posts.cache import INDEX, fragment_context, group_scope, profile_scope
+from posts.models import Comment, Follow, Post, Group, User
 from posts.forms import PostForm, CommentForm
-from posts.utils import pagin
+from posts.timeline import TimelinePaginator
+from posts.utils import (COMMENTS_LIMIT, COMMENTS_ORDERING, LIMIT,
+                         CursorPaginator, pagin)
 
 
 def index(request):
-    posts = Post.objects.select_related('group')
+    posts = Post.objects.select_related('author', 'group')
     page_obj = pagin(posts, request)
     context = {
         'page_obj': page_obj,
+        **fragment_context(INDEX),
     }
     return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.select_related('author', 'group')
     page_obj = pagin(posts, request)
     context = {
         'group': group,
         'page_obj': page_obj,
+        **fragment_context(group_scope(group.id)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@use_primary
+@throttle('post')
 @login_required
 def post_create(request):
     form = PostForm(
@@ -40,9 +51,11 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    tasks.schedule_thumbnails(post)
     return redirect('posts:profile', username=request.user)
 
 
+@use_primary
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id,)
@@ -60,13 +73,16 @@ def post_edit(request, post_id):
         return redirect('posts:post_detail', post_id)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            tasks.schedule_thumbnails(post)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.select_related('author', 'group')
     following = (request.user.is_authenticated
                  and Follow.objects.filter(user=request.user, author=author
                                            ).exists())
@@ -75,14 +91,22 @@ def profile(request, username):
         'page_obj': page_obj,
         'author': author,
         'following': following,
+        **fragment_context(profile_scope(author.id)),
     }
+    if request.user.is_authenticated:
+        context.update(graph.profile_context(request.user, author))
     return render(request, 'posts/profile.html', context)
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id,)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id,)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = CursorPaginator(
+        post.comments.select_related('author'),
+        COMMENTS_LIMIT,
+        COMMENTS_ORDERING,
+    ).get_page()
     context = {
         'post': post,
         'form': form,
@@ -91,6 +115,23 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    comments = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        COMMENTS_LIMIT,
+        COMMENTS_ORDERING,
+    ).get_page(after=request.GET.get('after'))
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    context = {
+        'comments': comments,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comments_chunk.html', context)
+
+
+@use_primary
+@throttle('comment')
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id,)
@@ -105,24 +146,29 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    follow = Post.objects.filter(author__following__user=request.user)
-    page_obj = pagin(follow, request)
+    posts = Post.objects.select_related('author', 'group')
+    follow = posts.filter(author__following__user=request.user)
+    page_obj = pagin(follow, request, TimelinePaginator(
+        posts, LIMIT, request.user))
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@use_primary
+@throttle('follow', methods=('GET',))
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     user = request.user
-    follow = Follow.objects.filter(user=user, author=author)
-    if user != author and not follow:
-        Follow.objects.create(user=user, author=author)
+    if user != author:
+        Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
 
 
+@use_primary
+@throttle('follow', methods=('GET',))
 @login_required
 def profile_unfollow(request, username):
     user = request.user
@@ -131,3 +177,11 @@ def profile_unfollow(request, username):
     if user != author and follow:
         follow.delete()
     return redirect('posts:profile', username=username)
+
+
+def popular(request, slug=None):
+    context = {}
+    if slug is not None:
+        context['group'] = get_object_or_404(Group, slug=slug)
+    context['posts'] = trending.top(slug)
+    return render(request, 'posts/trending.html', context)
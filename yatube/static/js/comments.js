@@ -0,0 +1,23 @@
+// Подгружает следующую порцию комментариев вместо кнопки «Показать ещё».
+document.addEventListener('click', function (event) {
+  var more = event.target.closest('[data-comments-more]');
+  if (!more) {
+    return;
+  }
+  var link = more.querySelector('a');
+  event.preventDefault();
+  link.classList.add('disabled');
+  fetch(link.href, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      more.outerHTML = html;
+    })
+    .catch(function () {
+      link.classList.remove('disabled');
+    });
+});
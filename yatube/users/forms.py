@@ -1,5 +1,8 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth import get_user_model
+from django.contrib.sites.shortcuts import get_current_site
+
+from users import tasks
 
 
 User = get_user_model()
@@ -9,3 +12,28 @@ class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Письмо сброса пароля отправляет очередь задач.
+
+    В задачу попадает только id пользователя: токен сброса создаётся
+    при отправке и не хранится в базе очереди.
+    """
+
+    def save(self, domain_override=None,
+             subject_template_name='registration/password_reset_subject.txt',
+             email_template_name='registration/password_reset_email.html',
+             use_https=False, token_generator=None, from_email=None,
+             request=None, html_email_template_name=None,
+             extra_email_context=None):
+        if domain_override:
+            site_name = domain = domain_override
+        else:
+            site = get_current_site(request)
+            site_name, domain = site.name, site.domain
+        for user in self.get_users(self.cleaned_data['email']):
+            tasks.send_password_reset.enqueue(
+                user.pk, domain, site_name, use_https,
+                subject_template_name, email_template_name,
+                html_email_template_name, from_email, extra_email_context)
@@ -0,0 +1,37 @@
+"""Фоновые задачи users (см. core.tasks)."""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.forms import PasswordResetForm
+from django.contrib.auth.tokens import default_token_generator
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core.tasks import task
+
+User = get_user_model()
+
+
+@task()
+def send_password_reset(user_id, domain, site_name, use_https,
+                        subject_template_name, email_template_name,
+                        html_email_template_name=None, from_email=None,
+                        extra_email_context=None):
+    """Письмо сброса пароля. Ссылка со сбросом создаётся здесь, а не в
+    запросе, чтобы токен не хранился в аргументах задачи.
+    """
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.has_usable_password():
+        return
+    user_email = getattr(user, User.get_email_field_name())
+    context = {
+        'email': user_email,
+        'domain': domain,
+        'site_name': site_name,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'user': user,
+        'token': default_token_generator.make_token(user),
+        'protocol': 'https' if use_https else 'http',
+        **(extra_email_context or {}),
+    }
+    PasswordResetForm().send_mail(
+        subject_template_name, email_template_name, context, from_email,
+        user_email, html_email_template_name=html_email_template_name)
@@ -24,11 +24,14 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,7 +48,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,13 +65,53 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Сколько секунд держать соединение с базой между запросами
+# (0 — закрывать после каждого запроса, None — не закрывать).
+DATABASE_CONN_MAX_AGE = 60
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+    },
 }
 
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+
+# Псевдонимы из DATABASES, с которых читают ленты и страницы постов.
+# Пустой список — всё читается из default. Локально реплику
+# db.replica.sqlite3 обновляет команда sync_replica.
+DATABASE_REPLICAS = []
+
+# Сколько секунд после своей записи пользователь читает из default.
+REPLICA_PIN_SECONDS = 5
+
+# Ограничения пишущих запросов по областям: для пользователя и для
+# IP-адреса — (частота, сколько запросов можно сделать подряд).
+# Область, которой здесь нет, не ограничивается.
+THROTTLE_RATES = {
+    'post': {'user': ('30/h', 10), 'ip': ('120/h', 30)},
+    'comment': {'user': ('120/h', 20), 'ip': ('600/h', 60)},
+    'follow': {'user': ('300/h', 30), 'ip': ('1200/h', 100)},
+}
+# Сколько доверенных обратных прокси стоит перед сайтом. Каждый
+# дописывает в X-Forwarded-For адрес, с которого пришёл запрос, поэтому
+# адрес клиента — N-й с конца; при 0 берётся REMOTE_ADDR.
+THROTTLE_TRUSTED_PROXIES = 0
+
+# Потоки, в которых yatube.asgi выполняет запросы.
+ASGI_THREADS = 32
+
+# Потоки для одновременных независимых запросов внутри страницы
+# (core.concurrency.gather). 0 — выполнять их по очереди.
+CONCURRENT_LOOKUP_WORKERS = 8
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +145,22 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Размеры миниатюр постов: строятся фоновой задачей после загрузки
+# картинки.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Загрузки всегда пишутся во временный файл, а не в память.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Пределы для картинок постов: размер файла, число пикселей до
+# декодирования и наибольшие стороны сохранённой картинки.
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_SIZE = (2048, 2048)
+
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -112,12 +171,93 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Кэш общий для всех воркеров: файл SQLite рядом с базой. Для
+# сетевого хранилища укажите в OPTIONS['CLIENT'] его клиента
+# (см. core.cache). Тесты запускает core.test_runner на хранилище в
+# памяти процесса, общий кэш сайта они не трогают.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.InstrumentedSharedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'CLIENT': 'core.cache.SQLiteClient',
+            'MAX_ENTRIES': 100_000,
+        },
     }
 }
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
+# Фрагменты лент и страницы для анонимов сбрасываются сигналами,
+# поэтому могут жить долго.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Карточки постов ключуются версией поста и не сбрасываются вовсе.
+CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Сессия и пользователь запроса читаются из кэша (core.auth), запись
+# идёт и в кэш, и в базу. Копия пользователя живёт в кэше минуту:
+# столько её не видят изменения в обход сигналов, например
+# User.objects.filter(...).update(is_active=False).
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['core.auth.CachedModelBackend']
+USER_CACHE_TIMEOUT = 60
+
+# Замеры запросов по имени URL хранятся за последний час слотами по
+# минуте и видны персоналу на core:stats.
+REQUEST_STATS_WINDOW = 60 * 60
+REQUEST_STATS_SLOT = 60
 
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
+
+# Лента подписок: сколько записей хранить на читателя, с какого числа
+# подписчиков автор читается через pull и как часто подрезать ленты.
+TIMELINE_LENGTH = 800
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_TRIM_EVERY = 50
+
+# Граф подписок в памяти (posts.graph): как часто процесс дочитывает
+# журнал изменений из общего кэша, сколько изменений журнал хранит и
+# как долго.
+FOLLOW_GRAPH_SYNC_INTERVAL = 1
+FOLLOW_GRAPH_JOURNAL_LENGTH = 10_000
+FOLLOW_GRAPH_JOURNAL_TIMEOUT = 60 * 60 * 24
+# Подбор авторов: сколько подписок смотреть на каждом шаге и сколько
+# авторов предлагать. Сколько знакомых подписчиков называть по имени.
+FOLLOW_SUGGESTION_FANOUT = 50
+FOLLOW_SUGGESTIONS = 5
+KNOWN_FOLLOWERS_SHOWN = 3
+
+# Популярное: вес события вдвое меньше через TRENDING_HALF_LIFE
+# секунд. Публикация весит post плюс reach на log2 числа подписчиков
+# автора, комментарий — comment.
+TRENDING_HALF_LIFE = 60 * 60 * 12
+TRENDING_WEIGHTS = {'post': 1, 'comment': 2, 'reach': 0.5}
+# За сколько секунд события учитывает recompute_trending.
+TRENDING_WINDOW = 60 * 60 * 24 * 7
+# Сколько постов на странице популярного.
+TRENDING_SIZE = 30
+
+# Движок поиска: 'auto' (FTS5, если доступен), 'fts5' или 'memory'.
+SEARCH_BACKEND = 'auto'
+
+# Фоновые задачи (core.tasks): сколько задач воркер run_tasks
+# выполняет одновременно, как часто ищет новые и сколько секунд
+# задача может выполняться, прежде чем её вернут в очередь.
+TASK_WORKERS = 4
+TASK_POLL_INTERVAL = 1
+TASK_LEASE = 60 * 5
+# Попытки задачи и задержка перед первым повтором, дальше она
+# удваивается.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10
+# Выполненные и неудавшиеся задачи хранятся неделю: пока выполненная
+# задача хранится, задачу с тем же ключом второй раз не поставить.
+# Воркер чистит их раз в минуту.
+TASK_KEEP_DONE = 60 * 60 * 24 * 7
+TASK_PURGE_EVERY = 60
+# Задержки задач на core:stats: за последний час, не больше чем по
+# TASK_STATS_LIMIT задачам.
+TASK_STATS_WINDOW = 60 * 60
+TASK_STATS_LIMIT = 10_000
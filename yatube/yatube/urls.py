@@ -14,6 +14,8 @@ urlpatterns = [
     path('auth/', include('django.contrib.auth.urls')),
     path('', include('posts.urls', namespace='posts')),
     path('about/', include('about.urls', namespace='about')),
+    path('core/', include('core.urls', namespace='core')),
+    path('api/', include('api.urls', namespace='api')),
 ]
 
 if settings.DEBUG: